@@ -153,6 +153,23 @@ def create_app():
     if _settings_bp:
         app.register_blueprint(_settings_bp)
 
+    # ===== وضع التطوير: عدد النسخ الكاملة للجداول في كل طلب (لرصد التراجع في الأداء) =====
+    from utils import text_clean
+
+    @app.before_request
+    def _start_frame_copy_count():
+        if app.debug:
+            text_clean.reset_copy_counts()
+
+    @app.after_request
+    def _log_frame_copy_count(response):
+        if app.debug:
+            counts = text_clean.pop_copy_counts()
+            if counts:
+                app.logger.debug("[FrameCopies] %s %s total=%d %s", request.method, request.path,
+                                 sum(counts.values()), counts)
+        return response
+
 
     # ===== إنشاء الجداول + إنشاء admin/admin إن لم يوجد + ترقيع أعمدة support_case و user =====
     with app.app_context():
@@ -286,6 +303,14 @@ def create_app():
             add_column_if_missing("support_case", "dismissed",
                                  "ALTER TABLE support_case ADD COLUMN dismissed BOOLEAN DEFAULT 0")
 
+        # أعمدة الظل المُطبّعة وملف الأعمدة غير الفارغة في المخزن العمودي (report_dataset)
+        if table_has_column("report_dataset", "id"):
+            add_column_if_missing("report_dataset", "shadow_json",
+                                 "ALTER TABLE report_dataset ADD COLUMN shadow_json TEXT")
+            add_column_if_missing("report_dataset", "profile_json",
+                                 "ALTER TABLE report_dataset ADD COLUMN profile_json TEXT")
+            db.session.commit()
+
         # --- ترقيع أعمدة User المفقودة ---
         if table_has_column("user", "id"):
             add_column_if_missing("user", "can_trader_services",
@@ -379,6 +404,37 @@ def create_app():
             # لا تُعطل التطبيق لو حدث خطأ أثناء التحديث
             print(f"[Auth] Skipped admin password env update: {_ex}")
 
+        # ترحيل بيانات التقارير القديمة (data_json) إلى المخزن العمودي المضغوط
+        try:
+            from utils.dataset_store import migrate_legacy_states
+            cleaners = {}
+            if machine_reports_bp:
+                from routes.machine_reports import _coerce_text_df
+                cleaners["reports"] = _coerce_text_df
+            if trader_services_bp:
+                from routes.trader_services import _coerce_all_text_no_decimals
+                cleaners["trader"] = _coerce_all_text_no_decimals
+            stats = migrate_legacy_states(cleaners=cleaners, logger=app.logger)
+            if stats["migrated"] or stats["failed"]:
+                print(f"[DatasetStore] migrated={stats['migrated']} rows={stats['rows']} failed={stats['failed']}")
+        except Exception as _ex:
+            print(f"[DatasetStore] Skipped legacy data migration: {_ex}")
+
+        # مهام الاستيراد التي توقفت بإعادة تشغيل/قتل worker سابق: تُسجّل فاشلة وتُحذف ملفاتها
+        try:
+            from utils.import_jobs import fail_stale_jobs
+            fail_stale_jobs(logger=app.logger)
+        except Exception as _ex:
+            print(f"[ImportJob] Skipped stale job cleanup: {_ex}")
+
+        # بناء فهارس الاستعلام لكل الأقسام في الخلفية (لا يؤخر بدء التطبيق)
+        if machine_reports_bp:
+            try:
+                from routes.machine_reports import warm_inquiry_indexes
+                warm_inquiry_indexes(app)
+            except Exception as _ex:
+                print(f"[InquiryIndex] Skipped startup warm-up: {_ex}")
+
     # ===== المسارات العامة =====
     @app.route("/")
     def index():
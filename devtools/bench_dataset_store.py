@@ -0,0 +1,79 @@
+import importlib.util
+import sys
+import os
+import time
+import tracemalloc
+
+# Load app.py explicitly to avoid module resolution issues
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+APP_PATH = os.path.join(BASE_DIR, 'app.py')
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+spec = importlib.util.spec_from_file_location('appmod', APP_PATH)
+appmod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(appmod)
+app = appmod.app
+
+import pandas as pd
+from models import db, User
+from models_reports import ReportState
+from utils import dataset_store
+from routes.machine_reports import _df_to_json, _json_to_df, _row_to_df, _store_df
+
+ROWS = int(os.environ.get('BENCH_ROWS', '200000'))
+BENCH_CATEGORY = '__bench_dataset_store__'
+
+
+def _synthetic_df(n: int) -> pd.DataFrame:
+    offices = ['مكتب القاهرة', 'مكتب الجيزة', 'مكتب الاسكندرية', 'مكتب طنطا']
+    return pd.DataFrame({
+        'رقم العميل': [str(100000 + i) for i in range(n)],
+        'اسم العميل': [f'مخبز رقم {i % 5000}' for i in range(n)],
+        'مسلسل': [f'SN{i:08d}' for i in range(n)],
+        'رقم الماكينة': [str(900000 + (i % 40000)) for i in range(n)],
+        'مكتب': [offices[i % len(offices)] for i in range(n)],
+        'الحالة': ['تعمل' if i % 3 else 'متوقفة' for i in range(n)],
+    })
+
+
+def _measure(label, fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{label:<28} {elapsed * 1000:9.1f} ms   peak {peak / 1e6:8.1f} MB')
+    return out
+
+
+def main():
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').first()
+        df = _synthetic_df(ROWS)
+        print('rows:', len(df), 'cols:', len(df.columns))
+
+        row = ReportState(category=BENCH_CATEGORY, user_id=admin.id if admin else 1)
+        db.session.add(row)
+        db.session.flush()
+        try:
+            # المسار القديم: نص JSON كامل في data_json
+            js = _measure('json: save (to_json)', lambda: _df_to_json(df))
+            _measure('json: load (json_to_df)', lambda: _json_to_df(js))
+            print('json size: %.1f MB' % (len(js.encode('utf-8')) / 1e6))
+
+            # المخزن العمودي المضغوط
+            _measure('store: save', lambda: (_store_df(row, df), db.session.flush()))
+            db.session.expire_all()
+            loaded = _measure('store: load', lambda: _row_to_df(row))
+            _measure('store: load 2 columns', lambda: dataset_store.load_frame(row, columns=['رقم العميل', 'مسلسل'])[0])
+            size = sum(len(c.payload) for c in dataset_store.ReportDatasetChunk.query
+                       .filter_by(dataset_id=dataset_store.get_dataset(row).id))
+            print('store size: %.1f MB' % (size / 1e6))
+            print('round trip equal:', loaded.equals(_json_to_df(js)))
+        finally:
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    main()
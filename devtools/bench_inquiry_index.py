@@ -0,0 +1,112 @@
+import importlib.util
+import sys
+import os
+import time
+import tracemalloc
+
+# Load app.py explicitly to avoid module resolution issues
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+APP_PATH = os.path.join(BASE_DIR, 'app.py')
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+spec = importlib.util.spec_from_file_location('appmod', APP_PATH)
+appmod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(appmod)
+app = appmod.app
+
+import pandas as pd
+from routes import machine_reports as mr
+
+ROWS = int(os.environ.get('BENCH_ROWS', '150000'))
+CATEGORY = '__bench_inquiry_index__'
+
+
+def _synthetic_df(n: int) -> pd.DataFrame:
+    first = ['محمد', 'أحمد', 'مخبز', 'إبراهيم', 'مصطفى', 'علي']
+    last = ['السيد', 'عبد الله', 'الجديد', 'النور', 'سلامة']
+    return pd.DataFrame({
+        'رقم العميل': [str(200000 + i) for i in range(n)],
+        'اسم العميل': [f'{first[i % 6]} {last[i % 5]} {i % 997}' for i in range(n)],
+        'مسلسل الماكينة': [f'SN{i:08d}' for i in range(n)],
+        'رقم الماكينة': [str(700000 + (i % 50000)) for i in range(n)],
+        'مكتب': ['مكتب %d' % (i % 40) for i in range(n)],
+    })
+
+
+def _legacy_build(df: pd.DataFrame) -> dict:
+    """بناء الفهارس بالطريقة القديمة (iterrows + قوائم) للمقارنة فقط."""
+    indexes = {}
+    groups = {
+        'code': ['رقم العميل', 'رقم الماكينة'],
+        'serial': ['مسلسل الماكينة', 'رقم الماكينة'],
+        'machine_code': ['رقم الماكينة'],
+    }
+    for idx, r in df.iterrows():
+        for name, cols in groups.items():
+            for c in cols:
+                k = mr._norm_key_text(mr._textify(r.get(c)))
+                if not k:
+                    continue
+                indexes.setdefault(name, {}).setdefault(k, []).append(idx)
+                if len(k) >= 3:
+                    indexes.setdefault(name + '_prefix3', {}).setdefault(k[:3], []).append(idx)
+                if len(k) >= 5:
+                    indexes.setdefault(name + '_prefix5', {}).setdefault(k[:5], []).append(idx)
+        k = mr._norm_key_text(mr._textify(r.get('اسم العميل')))
+        if k:
+            indexes.setdefault('name', {}).setdefault(k, []).append(idx)
+            for t in [t for t in k.split(' ') if t]:
+                indexes.setdefault('name_token', {}).setdefault(t, []).append(idx)
+    return indexes
+
+
+def _measure(label, fn):
+    # الزمن بدون tracemalloc (له كلفة كبيرة على التخصيصات)، ثم الذاكرة في تشغيل منفصل
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    out = fn()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{label:<22} {elapsed:8.2f} s   retained {current / 1e6:8.1f} MB   peak {peak / 1e6:8.1f} MB')
+    return out
+
+
+def main():
+    df = _synthetic_df(ROWS)
+    print('rows:', len(df))
+    legacy = _measure('legacy (iterrows)', lambda: _legacy_build(df))
+
+    with app.test_request_context():
+        mr._row_to_mapped_df = lambda row, mapping: df
+        mr._row_has_data = lambda row: True
+        mr._load_state = lambda category: None
+        _measure('vectorized', lambda: mr._build_inquiry_cache(CATEGORY))
+    indexes = mr.INQUIRY_CACHE.pop(CATEGORY)['indexes']
+
+    # التحقق من تطابق المواضع مع الطريقة القديمة
+    mismatched = 0
+    for name, legacy_idx in legacy.items():
+        new_idx = indexes[name]
+        for k, rows in legacy_idx.items():
+            if sorted(set(rows)) != new_idx.get(k, []).tolist():
+                mismatched += 1
+    print('mismatched keys:', mismatched)
+    print('postings bytes: %.1f MB' % (sum(i.nbytes() for i in indexes.values() if hasattr(i, 'nbytes')) / 1e6))
+
+    # البحث الجزئي: فهرس trigram مقابل contains على كامل البيانات
+    sub = indexes['code_substr']
+    for q in ['2', '99', '0123', '7049', '200150']:
+        t0 = time.perf_counter()
+        hits = sub.search(q)
+        t_index = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        expected = mr._filter_dataframe(df, q, search_cols=sub.cols)
+        t_scan = (time.perf_counter() - t0) * 1000
+        same = hits.tolist() == [df.index.get_loc(i) for i in expected.index]
+        print(f'substring {q!r:<10} hits {len(hits):7d}   index {t_index:8.2f} ms   contains {t_scan:9.2f} ms   same={same}')
+
+
+if __name__ == '__main__':
+    main()
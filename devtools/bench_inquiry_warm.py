@@ -0,0 +1,64 @@
+import importlib.util
+import sys
+import os
+import time
+import statistics
+
+# Load app.py explicitly to avoid module resolution issues
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+APP_PATH = os.path.join(BASE_DIR, 'app.py')
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+spec = importlib.util.spec_from_file_location('appmod', APP_PATH)
+appmod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(appmod)
+app = appmod.app
+
+from models import User
+
+CATEGORY = os.environ.get('BENCH_CATEGORY', 'bakeries')
+QUERY = os.environ.get('BENCH_QUERY', '240311')
+SEARCH_TYPE = os.environ.get('BENCH_SEARCH_TYPE', 'code')
+REPEAT = int(os.environ.get('BENCH_REPEAT', '50'))
+
+
+def _report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f'{label:<32} mean {statistics.mean(samples):8.2f} ms   p95 {p95:8.2f} ms   n={len(samples)}')
+
+
+def main():
+    from routes import machine_reports as mr
+    with app.app_context():
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            admin = User.query.filter_by(username='admin').first()
+            sess['_user_id'] = str(admin.id if admin else 1)
+
+        payload = {'category': CATEGORY, 'search_type': SEARCH_TYPE, 'query': QUERY, 'visit_period': 'month'}
+
+        # الطلب الأول يبني الكاش (بارد)
+        t0 = time.perf_counter()
+        resp = client.post('/reports/api/inquiry_search', json=payload)
+        print('status:', resp.status_code, 'cold: %.1f ms' % ((time.perf_counter() - t0) * 1000))
+
+        # فحص الصلاحية وحده (بدون تحميل البيانات)
+        with app.test_request_context():
+            checks = []
+            for _ in range(REPEAT):
+                t0 = time.perf_counter()
+                mr._get_inquiry_cache(CATEGORY)
+                checks.append((time.perf_counter() - t0) * 1000)
+        _report('_get_inquiry_cache (warm)', checks)
+
+        warm = []
+        for _ in range(REPEAT):
+            t0 = time.perf_counter()
+            client.post('/reports/api/inquiry_search', json=payload)
+            warm.append((time.perf_counter() - t0) * 1000)
+        _report('api_inquiry_search (warm)', warm)
+
+
+if __name__ == '__main__':
+    main()
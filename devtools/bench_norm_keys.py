@@ -0,0 +1,68 @@
+import sys
+import os
+import re
+import time
+
+# Micro-benchmark for Arabic key normalization (scalar vs column path) over synthetic names.
+# Run:  python devtools/bench_norm_keys.py            (1M names)
+#       BENCH_ROWS=200000 python devtools/bench_norm_keys.py
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import numpy as np
+import pandas as pd
+from utils import norm_keys
+
+ROWS = int(os.environ.get('BENCH_ROWS', '1000000'))
+_AR_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
+
+
+def _legacy_norm(s) -> str:
+    """الدالة القديمة (استبدالات متتالية + re.sub) كمرجع للمقارنة."""
+    if s is None:
+        return ""
+    t = str(s).translate(_AR_DIGITS)
+    t = t.replace("ـ", "").replace("أ", "ا").replace("إ", "ا").replace("آ", "ا")
+    t = t.replace("ى", "ي").replace("ة", "ه").replace("ئ", "ي").replace("ؤ", "و")
+    return re.sub(r"\s+", " ", t).strip()
+
+
+def _synthetic_names(n: int) -> pd.Series:
+    rng = np.random.default_rng(12)
+    first = ['أحمد', 'محمد', 'إبراهيم', 'آمنة', 'فاطمة', 'مصطفى', 'علي', 'يحيى', 'هدى', 'رؤوف', 'عائشة', 'ســـعيد']
+    prefix = ['مخبز', 'مخبز ', ' بقالة', 'تموين\t', 'مطحن ']
+    a, b, c = (rng.integers(0, len(first), n) for _ in range(3))
+    p = rng.integers(0, len(prefix), n)
+    d = rng.integers(0, 20000, n)
+    digits = "٠١٢٣٤٥٦٧٨٩"
+    names = [f"{prefix[p[i]]} {first[a[i]]}  {first[b[i]]} {first[c[i]]} {''.join(digits[int(x)] for x in str(d[i]))} "
+             for i in range(n)]
+    return pd.Series(names, dtype=object)
+
+
+def _timed(label: str, fn):
+    t0 = time.perf_counter()
+    out = fn()
+    print(f'{label:<28} {time.perf_counter() - t0:8.3f} s')
+    return out
+
+
+def main() -> int:
+    s = _synthetic_names(ROWS)
+    print(f'{ROWS} names, {s.nunique()} distinct')
+    ref = _timed('legacy map(_norm_key_text)', lambda: s.map(_legacy_norm).to_numpy(dtype=object))
+    scalar = _timed('map(norm_key_text)', lambda: s.map(norm_keys.norm_key_text).to_numpy(dtype=object))
+    column = _timed('norm_key_array', lambda: norm_keys.norm_key_array(s.to_numpy(dtype=object)))
+    # حالات حدية: NaN/None، مسافات يونيكود، قيم فارغة أو مسافات فقط، فاصل داخلي
+    edge = pd.Series([None, np.nan, '', '   ', '　أ ب\n', 'ى ة ئ ؤ ـ', 'a\x00 b', 12, 1.5], dtype=object)
+    edge_ref = [_legacy_norm(v) if isinstance(v, str) or isinstance(v, (int, float)) and not pd.isna(v) else ''
+                for v in edge]
+    ok = (list(scalar) == list(ref)) and (list(column) == list(ref)) \
+        and list(norm_keys.norm_key_array(edge.to_numpy(dtype=object))) == edge_ref
+    print('ok' if ok else 'MISMATCH')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
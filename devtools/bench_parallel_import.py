@@ -0,0 +1,57 @@
+import sys
+import os
+import io
+import time
+
+# Benchmark: reading the six import files sequentially vs in the shared process pool (utils/import_pool)
+# on synthetic workbooks. The pool result must equal the sequential one.
+# Run:  python devtools/bench_parallel_import.py                 (BENCH_ROWS=40000 per file)
+#       IMPORT_WORKERS=6 BENCH_ROWS=100000 python devtools/bench_parallel_import.py
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import openpyxl
+from utils import import_pool
+from routes.machine_reports import _read_bytes
+
+ROWS = int(os.environ.get('BENCH_ROWS', '40000'))
+FILES = 6
+
+
+def _workbook(seed: int, n: int) -> bytes:
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(['رقم العميل', 'اسم العميل', 'مسلسل', 'المكتب', 'كمية', 'ملاحظات'])
+    for i in range(n):
+        k = (i * 7 + seed) % (n or 1)
+        ws.append([240000 + k, f'مخبز {k % 5000}', f'{k:015d}', f'مكتب {k % 40}', k / 4, '' if k % 3 else 'n/a'])
+    bio = io.BytesIO()
+    wb.save(bio)
+    return bio.getvalue()
+
+
+def main() -> int:
+    files = [(f'f{i + 1}.xlsx', _workbook(i, ROWS)) for i in range(FILES)]
+    print(f'{FILES} files x {ROWS} rows, workers={import_pool.worker_count()}, cpus={os.cpu_count()}')
+
+    t0 = time.perf_counter()
+    seq = [_read_bytes(name, payload) for name, payload in files]
+    t_seq = time.perf_counter() - t0
+
+    # تشغيل المجمع مسبقاً حتى لا يدخل وقت إنشاء العمليات في القياس
+    import_pool.result(import_pool.submit(_read_bytes, *files[0]), _read_bytes, *files[0])
+    t0 = time.perf_counter()
+    futures = [(import_pool.submit(_read_bytes, name, payload), (name, payload)) for name, payload in files]
+    par = [import_pool.result(fut, _read_bytes, *args) for fut, args in futures]
+    t_par = time.perf_counter() - t0
+    import_pool.shutdown()
+
+    ok = all(a.equals(b) and list(a.columns) == list(b.columns) for a, b in zip(seq, par))
+    print(f'sequential {t_seq:7.2f} s   pool {t_par:7.2f} s   speedup x{t_seq / t_par:4.2f}')
+    print('ok' if ok else 'MISMATCH')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
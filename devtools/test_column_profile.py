@@ -0,0 +1,157 @@
+import io
+import os
+import sys
+import time
+import random
+import tempfile
+import importlib.util
+
+# Empty-column profile: column_profile.nonempty_columns (with and without the stored per-column counts)
+# must keep exactly the columns the previous per-request scan kept, on random frames (empty tokens in
+# any case, whitespace, NaN/None, numbers, duplicate names), and the counts stored by dataset_store must
+# match the stored data for imports saved in several batches. Uses a throwaway SQLite database.
+# Run:  python devtools/test_column_profile.py            (ROUNDS=300)
+#       python devtools/test_column_profile.py --bench    (BENCH_ROWS=200000, 12 columns)
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+_TMP = tempfile.mkdtemp(prefix='column_profile_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_TMP, 'profile.db')
+os.environ.setdefault('INQUIRY_INDEX_DIR', os.path.join(_TMP, 'idx'))
+os.environ['IMPORT_JOBS_ASYNC'] = '0'
+
+spec = importlib.util.spec_from_file_location('appmod', os.path.join(BASE_DIR, 'app.py'))
+appmod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(appmod)
+app = appmod.app
+
+import numpy as np
+import pandas as pd
+from models import User
+from models_reports import ReportState
+from utils import column_profile, dataset_store, text_clean
+from routes import machine_reports as reports
+
+ROUNDS = int(os.environ.get('ROUNDS', '300'))
+
+_VALUES = ['', '', '', ' ', 'nan', 'NaN', ' None ', 'NULL', 'n/a', 'N/A', 'NaT', '-', '—', 'na', 'x', '0', '12.5',
+           'مخبز', '  أحمد ', None, np.nan, 7, 0.0]
+
+
+def _legacy(df: pd.DataFrame) -> list:
+    """المسح السابق لكل عمود (fillna/astype/strip/lower/isin) كمرجع."""
+    def _is_empty_series(s) -> bool:
+        if not isinstance(s, pd.Series):
+            return s.empty if hasattr(s, 'empty') else True
+        vals = s.fillna("").astype(str).str.strip().str.lower()
+        return ((vals == "") | (vals.isin(text_clean.EMPTY_TOKENS))).all()
+    return [c for c in df.columns if not _is_empty_series(df[c])]
+
+
+def _frame(rng: random.Random) -> pd.DataFrame:
+    n = rng.randint(1, 200)
+    cols = {}
+    for j in range(rng.randint(1, 6)):
+        # أعمدة فارغة غالباً: قيمة واحدة غير فارغة في موضع عشوائي (قبل حد الفحص الأولي أو بعده)
+        pool = _VALUES[:13] if rng.random() < 0.6 else _VALUES
+        vals = [rng.choice(pool) for _ in range(n)]
+        if rng.random() < 0.3:
+            vals[rng.randrange(n)] = rng.choice(['x', 'مخبز', 7])
+        cols[f'c{j}'] = vals
+    df = pd.DataFrame(cols)
+    if rng.random() < 0.1 and df.shape[1] > 1:
+        df.columns = ['c0'] * df.shape[1]
+    return df
+
+
+def check() -> list:
+    rng = random.Random(22)
+    bad = []
+    for i in range(ROUNDS):
+        df = _frame(rng)
+        old = _legacy(df)
+        if column_profile.nonempty_columns(df) != old:
+            bad.append(('scan', i, old))
+        if df.columns.is_unique:
+            counts = column_profile.nonempty_counts(df)
+            if column_profile.nonempty_columns(df, counts) != old:
+                bad.append(('counts', i, old))
+            # بعد المابنج: إعادة تسمية (وأحياناً اسمان إلى اسم واحد، فيُفحص العمود مباشرة)
+            rename = {c: f'م{c}' for c in df.columns if rng.random() < 0.5}
+            if rng.random() < 0.2 and df.shape[1] > 1:
+                rename[df.columns[1]] = rename.get(df.columns[0], df.columns[0])
+            mapped = df.rename(columns=rename)
+            if mapped.columns.is_unique and column_profile.nonempty_columns(
+                    mapped, column_profile.mapped_counts(counts, rename)) != _legacy(mapped):
+                bad.append(('mapped', i, rename))
+    return bad
+
+
+def check_store() -> list:
+    """عدادات الحفظ على دفعات = عدادات البيانات المحفوظة نفسها."""
+    bad = []
+    rng = random.Random(5)
+    row = ReportState(category='profile_test', user_id=User.query.first().id)
+    frames = [reports._coerce_text_df(_frame_fixed(rng)) for _ in range(3)]
+    dataset_store.save_frames(row, frames, cleaner='reports')
+    counts, cleaner = dataset_store.load_profile(row)
+    df, _ = dataset_store.load_frame(row)
+    if cleaner != 'reports' or counts != column_profile.nonempty_counts(df):
+        bad.append(f'stored profile differs: {counts}')
+    if [c for c in df.columns if counts.get(c)] != _legacy(df):
+        bad.append('stored profile keeps other columns than a scan')
+    return bad
+
+
+def _frame_fixed(rng: random.Random) -> pd.DataFrame:
+    n = 120
+    return pd.DataFrame({'رقم': [str(i) for i in range(n)],
+                         'فارغ': [rng.choice(['', 'nan', '-']) for _ in range(n)],
+                         'متفرق': [rng.choice(['', '', 'x']) for _ in range(n)],
+                         'ملاحظات': [''] * n})
+
+
+def _bench() -> None:
+    n = int(os.environ.get('BENCH_ROWS', '200000'))
+    rng = np.random.default_rng(22)
+    df = pd.DataFrame({f'عمود {j}': ([f'{240000 + x}' for x in rng.integers(0, n, n)] if j % 3 else
+                                     np.where(rng.random(n) < 0.999, '', 'x').astype(object) if j % 2 else [''] * n)
+                       for j in range(12)})
+    counts = column_profile.nonempty_counts(df)
+    sub = df.iloc[np.sort(rng.choice(n, n // 10, replace=False))]
+    for label, frame in (('all rows', df), ('10% subset', sub)):
+        t0 = time.perf_counter()
+        old = _legacy(frame)
+        t_old = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        new = column_profile.nonempty_columns(frame)
+        t_new = time.perf_counter() - t0
+        line = f'{label:<11} scan (previous) {t_old * 1000:8.1f} ms   numpy {t_new * 1000:7.1f} ms'
+        if frame is df:
+            t0 = time.perf_counter()
+            column_profile.nonempty_columns(frame, counts)
+            line += f'   stored profile {(time.perf_counter() - t0) * 1000:6.2f} ms'
+        print(f'{line}   same={old == new}   ({len(frame)} rows x 12)')
+    t0 = time.perf_counter()
+    column_profile.nonempty_counts(df)
+    print(f'profile at save time {(time.perf_counter() - t0) * 1000:8.1f} ms')
+
+
+def main() -> int:
+    bad = check()
+    for b in bad[:20]:
+        print('MISMATCH path=%s round=%s detail=%s' % b)
+    with app.app_context():
+        store_bad = check_store()
+    for b in store_bad:
+        print('FAIL', b)
+    if bad or store_bad:
+        return 1
+    print(f'ok: {ROUNDS} rounds')
+    if '--bench' in sys.argv:
+        _bench()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
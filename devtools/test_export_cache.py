@@ -0,0 +1,170 @@
+import io
+import os
+import sys
+import time
+import tempfile
+import importlib.util
+
+# On-disk export cache (utils/export_cache): a cached export must carry the same cells as a fresh one
+# (reports, trader primary/frequent; xlsx and csv), If-None-Match returns 304, an interrupted CSV download
+# leaves no file, a new import or mapping invalidates, and the total size stays under the limit.
+# Uses a throwaway SQLite database and cache directory.
+# Run:  python devtools/test_export_cache.py            (CACHE_ROWS=2000)
+#       python devtools/test_export_cache.py --bench    (repeat-download timings, BENCH_ROWS=100000)
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+_TMP = tempfile.mkdtemp(prefix='export_cache_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_TMP, 'cache.db')
+os.environ.setdefault('INQUIRY_INDEX_DIR', os.path.join(_TMP, 'idx'))
+os.environ['EXPORT_CACHE_DIR'] = os.path.join(_TMP, 'exports')
+os.environ['IMPORT_JOBS_ASYNC'] = '0'
+
+spec = importlib.util.spec_from_file_location('appmod', os.path.join(BASE_DIR, 'app.py'))
+appmod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(appmod)
+app = appmod.app
+
+import pandas as pd
+from urllib.parse import quote
+from models import User
+from utils.export_cache import EXPORT_CACHE
+
+ROWS = int(os.environ.get('BENCH_ROWS' if '--bench' in sys.argv else 'CACHE_ROWS', '100000' if '--bench' in sys.argv else '2000'))
+
+
+def _xlsx(df: pd.DataFrame) -> io.BytesIO:
+    bio = io.BytesIO()
+    df.to_excel(bio, index=False)
+    bio.seek(0)
+    return bio
+
+
+def _frame(n: int, tag: str = '') -> pd.DataFrame:
+    return pd.DataFrame({'رقم العميل': [str(240000 + i) for i in range(n)],
+                         'اسم العميل': [f'مخبز {"احمد" if i % 3 else "النور"} {i}{tag}' for i in range(n)],
+                         'القسم': ['مخابز' if i % 2 else '' for i in range(n)],
+                         'ملاحظات': ['' for _ in range(n)]})
+
+
+def _load(client, tag: str = '') -> None:
+    df = _frame(ROWS, tag)
+    client.post('/reports/bakeries/import', content_type='multipart/form-data', data={'file1': (_xlsx(df), 'a.xlsx')})
+    client.post('/trader/primary/import', content_type='multipart/form-data', data={'file': (_xlsx(df), 'p.xlsx')})
+    from routes.trader_services import _save_state as _trader_save_state
+    _trader_save_state('trader_frequent:recent_program', df.rename(columns={'القسم': 'النوع'}))
+    client.get('/support/')       # عرض رسائل الاستيراد (flash)
+
+
+def _get(client, url: str, **kw):
+    resp = client.get(url, **kw)
+    body = b''.join(resp.response)
+    resp.close()
+    return resp, body
+
+
+def _cells(body: bytes, fmt: str) -> list:
+    if fmt == 'csv':
+        df = pd.read_csv(io.BytesIO(body), dtype=str, keep_default_na=False, encoding='utf-8-sig')
+    else:
+        df = pd.read_excel(io.BytesIO(body), dtype=str).fillna('')
+    return [list(df.columns)] + df.values.tolist()
+
+
+def _urls() -> list:
+    urls = []
+    for base in ('/reports/bakeries/export', '/trader/primary/export', '/trader/frequent/export'):
+        for q in ('', 'احمد', '24001'):
+            for fmt in ('xlsx', 'csv'):
+                urls.append((f'{base}?q={quote(q)}&format={fmt}', fmt))
+    return urls
+
+
+def check(client) -> list:
+    bad = []
+    max_bytes, EXPORT_CACHE.max_bytes = EXPORT_CACHE.max_bytes, 0      # مرجع بدون كاش
+    fresh = {u: _cells(_get(client, u)[1], fmt) for u, fmt in _urls()}
+    EXPORT_CACHE.max_bytes = max_bytes
+    for _ in range(2):            # أول مرور يكتب الملفات والثاني يقرأ منها
+        for u, fmt in _urls():
+            resp, body = _get(client, u)
+            if resp.status_code != 200 or _cells(body, fmt) != fresh[u]:
+                bad.append(f'export differs with cache: {u}')
+    stats = EXPORT_CACHE.stats()
+    if stats['hits'] < len(_urls()) or stats['files'] != len(_urls()):
+        bad.append(f'expected one file per export and cache hits: {stats}')
+
+    u = _urls()[0][0]
+    resp, _ = _get(client, u)
+    etag = resp.headers.get('ETag')
+    resp, body = _get(client, u, headers={'If-None-Match': etag})
+    if resp.status_code != 304 or body:
+        bad.append(f'If-None-Match: {resp.status_code}')
+
+    # تحميل CSV منقطع لا يترك ملفاً ناقصاً
+    EXPORT_CACHE.invalidate()
+    resp = client.get('/reports/bakeries/export?format=csv')
+    next(iter(resp.response))
+    resp.close()
+    if EXPORT_CACHE.stats()['files']:
+        bad.append(f'partial csv kept: {EXPORT_CACHE.stats()}')
+
+    # استيراد جديد يبطل الملفات (والتصدير التالي يحمل البيانات الجديدة)
+    for u, fmt in _urls():
+        _get(client, u)
+    _load(client, tag='-جديد')
+    if EXPORT_CACHE.stats()['files']:
+        bad.append(f'files kept after import: {EXPORT_CACHE.stats()}')
+    for u, fmt in _urls()[:2]:
+        rows = _cells(_get(client, u)[1], fmt)
+        if not any('-جديد' in v for r in rows[1:] for v in r):
+            bad.append(f'stale export after import: {u}')
+
+    # تغيير المابنج: إصدار جديد للملف والقديم يُحذف
+    client.post('/reports/bakeries/save_mapping', data={'rename_lines': 'اسم العميل => الاسم'})
+    before = EXPORT_CACHE.stats()['files']
+    _get(client, '/reports/bakeries/export?format=xlsx')
+    if EXPORT_CACHE.stats()['files'] > before:
+        bad.append(f'older mapping version kept: {EXPORT_CACHE.stats()}')
+
+    # الإخلاء حسب الحجم
+    EXPORT_CACHE.max_bytes = 1
+    for u, fmt in _urls():
+        _get(client, u)
+    if EXPORT_CACHE.stats()['files'] > 1:
+        bad.append(f'size limit not applied: {EXPORT_CACHE.stats()}')
+    EXPORT_CACHE.max_bytes = max_bytes
+    return bad
+
+
+def _bench(client) -> None:
+    for base in ('/reports/bakeries/export', '/trader/primary/export', '/trader/frequent/export'):
+        for fmt in ('xlsx', 'csv'):
+            EXPORT_CACHE.invalidate()
+            times = []
+            for _ in range(2):
+                t0 = time.perf_counter()
+                _get(client, f'{base}?format={fmt}')
+                times.append(time.perf_counter() - t0)
+            print(f'{base:<26} {fmt:<5} first {times[0] * 1000:8.1f} ms   cached {times[1] * 1000:7.1f} ms  ({ROWS} rows)')
+
+
+def main() -> int:
+    with app.app_context():
+        client = app.test_client()
+        admin = User.query.filter_by(username='admin').first()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(admin.id)
+        _load(client)
+        if '--bench' in sys.argv:
+            _bench(client)
+            return 0
+        bad = check(client)
+    for b in bad:
+        print('FAIL', b)
+    print('ok' if not bad else f'{len(bad)} failure(s)')
+    return 1 if bad else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
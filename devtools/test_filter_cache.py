@@ -0,0 +1,183 @@
+import io
+import os
+import sys
+import time
+import tempfile
+import importlib.util
+
+# Filter result cache and "all columns" search index: paging through a search must render exactly what
+# a fresh full-scan filter renders (reports category view, trader primary/frequent, support), plus
+# TTL / LRU / per-user cap checks.
+# Uses a throwaway SQLite database.
+# Run:  python devtools/test_filter_cache.py            (CACHE_ROWS=3000)
+#       python devtools/test_filter_cache.py --bench    (page-to-page timings, BENCH_ROWS=100000)
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+_TMP = tempfile.mkdtemp(prefix='filter_cache_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_TMP, 'cache.db')
+os.environ.setdefault('INQUIRY_INDEX_DIR', os.path.join(_TMP, 'idx'))
+os.environ['IMPORT_JOBS_ASYNC'] = '0'
+
+spec = importlib.util.spec_from_file_location('appmod', os.path.join(BASE_DIR, 'app.py'))
+appmod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(appmod)
+app = appmod.app
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from urllib.parse import quote
+from sqlalchemy import text
+from models import db, User, SupportCase
+from utils.filter_cache import FILTER_CACHE, FilterCache
+from utils import search_index
+
+ROWS = int(os.environ.get('BENCH_ROWS' if '--bench' in sys.argv else 'CACHE_ROWS', '100000' if '--bench' in sys.argv else '3000'))
+
+
+def _xlsx(df: pd.DataFrame) -> io.BytesIO:
+    bio = io.BytesIO()
+    df.to_excel(bio, index=False)
+    bio.seek(0)
+    return bio
+
+
+def _frame(n: int) -> pd.DataFrame:
+    return pd.DataFrame({'رقم العميل': [str(240000 + i) for i in range(n)],
+                         'اسم العميل': [f'مخبز {"احمد" if i % 3 else "النور"} {i}' for i in range(n)],
+                         'مسلسل': [f'SN{100000 + i}' for i in range(n)],
+                         'القسم': ['مخابز' if i % 2 else '' for i in range(n)],
+                         'ملاحظات': ['' for _ in range(n)]})
+
+
+def _load(client) -> None:
+    df = _frame(ROWS)
+    client.post('/reports/bakeries/import', content_type='multipart/form-data', data={'file1': (_xlsx(df), 'a.xlsx')})
+    client.post('/trader/primary/import', content_type='multipart/form-data', data={'file': (_xlsx(df), 'p.xlsx')})
+    # شاشة المترددين تعرض بيانات "الحديثة" (تُضاف صفاً بصف من شاشة الاستعلام عادةً)
+    from routes.trader_services import _save_state as _trader_save_state
+    _trader_save_state('trader_frequent:recent_program', df.rename(columns={'القسم': 'النوع'}))
+    client.get('/support/')       # عرض رسائل الاستيراد (flash) حتى لا تظهر في أول صفحة مقارنة
+
+
+def _urls() -> list:
+    urls = []
+    for base in ('/reports/bakeries', '/trader/primary', '/trader/frequent', '/support/'):
+        for q, search_in in (('', 'all'), ('احمد', 'all'), ('SN1001', 'all'), ('2400', 'رقم العميل'), ('zzzz', 'all')):
+            for page in (1, 2, 7, 500):
+                urls.append(f'{base}?q={quote(q)}&search_in={quote(search_in)}&page={page}&page_size=10')
+    return urls
+
+
+def check_views(client) -> list:
+    bad = []
+    urls = _urls()
+    FILTER_CACHE.ttl = 0          # مرجع: تصفية كاملة (مسح بدون فهرس البحث) في كل طلب
+    indexed_search, search_index.search = search_index.search, lambda *a, **k: None
+    fresh = {u: client.get(u).get_data(as_text=True) for u in urls}
+    search_index.search = indexed_search
+    # فهارس البحث تُبنى في الخلفية عند أول بحث؛ ننتظرها حتى يمر المرور التالي بالفهرس
+    for u in urls:
+        client.get(u)
+    for _ in range(600):
+        if not search_index.SEARCH_INDEX_CACHE._building:
+            break
+        time.sleep(0.1)
+    if search_index.SEARCH_INDEX_CACHE.stats()['entries'] < 3:
+        bad.append(f'search indexes not built: {search_index.SEARCH_INDEX_CACHE.stats()}')
+    FILTER_CACHE.ttl = 120
+    FILTER_CACHE.invalidate()
+    for _ in range(2):            # أول مرور يملأ الكاش والثاني يقرأ منه
+        for u in urls:
+            if client.get(u).get_data(as_text=True) != fresh[u]:
+                bad.append(f'page differs with cache: {u}')
+    if FILTER_CACHE.stats()['hits'] < len(urls):
+        bad.append(f'expected cache hits, got {FILTER_CACHE.stats()}')
+    # تعديل حالة دعم يبطل النتائج المخزنة
+    case = SupportCase.query.order_by(SupportCase.id.desc()).first()
+    url = f'/support/?q={quote("تعديل-جديد")}'
+    before = client.get(url).get_data(as_text=True)
+    case.notes = 'تعديل-جديد'
+    db.session.commit()
+    after = client.get(url).get_data(as_text=True)
+    if before.count('تعديل-جديد') >= after.count('تعديل-جديد'):
+        bad.append('support edit not visible through the cache')
+    # تعديل من worker آخر (بدون أحداث ORM في هذه العملية): يظهر عبر updated_at في قاعدة البيانات
+    case = SupportCase.query.order_by(SupportCase.id.asc()).first()
+    url = f'/support/?q={quote("تعديل-آخر")}'
+    before = client.get(url).get_data(as_text=True)
+    db.session.execute(text("UPDATE support_case SET notes = :n, updated_at = :t WHERE id = :i"),
+                       {'n': 'تعديل-آخر', 't': datetime.utcnow(), 'i': case.id})
+    db.session.commit()
+    after = client.get(url).get_data(as_text=True)
+    if before.count('تعديل-آخر') >= after.count('تعديل-آخر'):
+        bad.append('support edit from another worker not visible through the cache')
+    return bad
+
+
+def check_eviction() -> list:
+    bad = []
+    cache = FilterCache(ttl=0.2, max_entries=3, max_bytes=10**6, user_max_bytes=2000)
+    pos = np.arange(100, dtype=np.int64)          # 800 بايت + الأعمدة
+    for i in range(3):
+        cache.put(cache.make_key('s:1', 'v1', f'q{i}', 'all', 1), pos, ['a'], 100)
+    if cache.stats()['bytes'] > 2000 or cache.get(cache.make_key('s:1', 'v1', 'q0', 'all', 1)) is not None:
+        bad.append(f'per-user cap not applied: {cache.stats()}')
+    cache.put(cache.make_key('s:1', 'v1', 'q', 'all', 2), pos, ['a'], 100)
+    if cache.get(cache.make_key('s:1', 'v1', 'q2', 'all', 1)) is None:
+        bad.append('another user evicted by a per-user cap')
+    cache.put(cache.make_key('s:1', 'v2', 'q', 'all', 3), None, ['a'], 5)
+    if cache.stats()['entries'] != 1:
+        bad.append(f'older dataset version kept: {cache.stats()}')
+    for i in range(5):
+        cache.put(cache.make_key('s:1', 'v2', f'x{i}', 'all', 3), None, ['a'], 5)
+    if cache.stats()['entries'] != 3:
+        bad.append(f'LRU entry limit not applied: {cache.stats()}')
+    time.sleep(0.3)
+    if cache.get(cache.make_key('s:1', 'v2', 'x4', 'all', 3)) is not None:
+        bad.append('expired entry returned')
+    cache.put(cache.make_key('s:1:extra', 'v', 'q', 'all', 3), None, [], 0)
+    cache.invalidate('s:1')
+    if cache.stats()['entries'] != 0:
+        bad.append('invalidate(scope) left entries of the scope')
+    return bad
+
+
+def _bench(client) -> None:
+    q = quote('احمد')
+    for base in ('/reports/bakeries', '/trader/primary', '/trader/frequent', '/support/'):
+        for label, ttl in (('no cache', 0), ('cache', 120)):
+            FILTER_CACHE.ttl = ttl
+            FILTER_CACHE.invalidate()
+            client.get(f'{base}?q={q}&page=1')
+            t0 = time.perf_counter()
+            for page in range(2, 12):
+                client.get(f'{base}?q={q}&page={page}')
+            print(f'{base:<20} {label:<9} {(time.perf_counter() - t0) * 100:8.1f} ms/page  ({ROWS} rows)')
+
+
+def main() -> int:
+    bad = check_eviction()
+    with app.app_context():
+        client = app.test_client()
+        admin = User.query.filter_by(username='admin').first()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(admin.id)
+        _load(client)
+        db.session.add_all([SupportCase(name=f'عميل {i}', code=str(1000 + i), work_type='أعمال دعم عامة',
+                                        work_detail='احمد' if i % 4 else '', created_by=admin.id)
+                            for i in range(min(ROWS, 2000))])
+        db.session.commit()
+        if '--bench' in sys.argv:
+            _bench(client)
+            return 0
+        bad += check_views(client)
+    for b in bad:
+        print('FAIL', b)
+    print('ok' if not bad else f'{len(bad)} failure(s)')
+    return 1 if bad else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import json
+import sys
+import os
+
+# Golden-output regression check for _group_search_results.
+# Run:  python devtools/test_group_search_results.py           (compare)
+#       python devtools/test_group_search_results.py --update  (rewrite golden file)
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import numpy as np
+import pandas as pd
+from routes.machine_reports import _group_search_results, _entity_row_positions, _materialize_entity
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), 'golden', 'group_search_results.json')
+
+
+def _cases() -> dict:
+    nan = np.nan
+    # عميل بعدة ماكينات + نفس رقم الماكينة مكرر مع شريحة في صف واحد فقط + بدائل أعمدة
+    bakeries = pd.DataFrame({
+        'رقم العميل': ['100', '100', '100', '200', '200', '300', nan, '100'],
+        'اسم العميل': ['مخبز النور', 'مخبز النور', 'مخبز النور', 'مخبز الامل', 'مخبز الامل', 'مخبز السلام', 'بدون كود', 'مخبز النور'],
+        'مكتب': ['القاهرة', 'القاهرة', '', 'الجيزة', 'الجيزة', nan, 'طنطا', 'القاهرة'],
+        'مسلسل الماكينة': ['SN1', '', 'SN3', 'SN4', nan, 'SN6', 'SN7', '-'],
+        'مسلسل': ['', 'SN2-ALT', '', '', 'SN5-ALT', '', '', 'SN8-ALT'],
+        'رقم الماكينة': ['M1', 'M1', 'M3', 'M4', 'M4', '', 'M7', 'M1'],
+        'ماكينة رئيسية/فرعية': ['رئيسية', 'فرعية', '', 'رئيسية', 'فرعية', 'رئيسية', '', ''],
+        'النوع': ['', '', 'فرعية', '', '', '', 'رئيسية', 'رئيسية'],
+        'حالة الماكينة': ['تعمل', '', 'متوقفة', nan, 'تعمل', 'تعمل', '', ''],
+        'الحالة': ['', 'تعمل', '', 'متوقفة', '', '', 'تعمل', 'nan'],
+        'شريحة 1': ['', '0101', '', '', '', '0106', '', '0108'],
+        'SIM1': ['', '', '', '0104', '', '', '0107', ''],
+        'شريحة2': ['0201', '', '', '', '0205', '', '', '0208'],
+        'SIM2': ['', '0202', '', '', '', '', '', ''],
+        'CS_1': ['x', 'x', 'x', 'x', 'x', 'x', 'x', 'x'],
+        'timestamp': ['2024-01-01 10:00', '', '', '', '', '', '', ''],
+        'SW_AC_SUP': [12.0, nan, 7.5, '', '3', '1e3', '', None],
+        'عدد الزيارات': [3, 1, 4, 1, 5, 9, 2, 6],
+        'متوسط': [1.5, nan, 2.0, 0.0, 3.25, nan, 1.0, 2.5],
+    })
+    # عمود مفتاح واحد فقط: كل صف كيان مستقل، مع كود الماكينة بدلاً من رقم الماكينة
+    single_key = pd.DataFrame({
+        'رقم التاجر': ['T1', 'T2', 'T2'],
+        'كود الماكينة': ['K1', 'K1', ''],
+        'Serial': ['S1', '', 'S3'],
+        'Status': ['ok', '', 'down'],
+        'شريحة 1': ['', '011', ''],
+        'شريحة1': ['010', '', ''],
+    })
+    return {
+        'bakeries': (bakeries, 'bakeries'),
+        'ration': (bakeries.iloc[::-1].reset_index(drop=True), 'ration'),
+        'single_key': (single_key, 'substitute'),
+    }
+
+
+def _dump(results: dict) -> str:
+    return json.dumps(results, ensure_ascii=False, indent=1, default=str)
+
+
+def main() -> int:
+    results = {name: _group_search_results(df, category) for name, (df, category) in _cases().items()}
+    text = _dump(results)
+    if '--update' in sys.argv:
+        os.makedirs(os.path.dirname(GOLDEN_PATH), exist_ok=True)
+        with open(GOLDEN_PATH, 'w', encoding='utf-8') as fh:
+            fh.write(text + '\n')
+        print('golden updated:', GOLDEN_PATH)
+        return 0
+    with open(GOLDEN_PATH, encoding='utf-8') as fh:
+        expected = fh.read().rstrip('\n')
+    if text != expected:
+        print('MISMATCH: _group_search_results output differs from golden file')
+        for i, (a, b) in enumerate(zip(text.splitlines(), expected.splitlines())):
+            if a != b:
+                print(f'  line {i + 1}:\n    got      {a}\n    expected {b}')
+                break
+        return 1
+    # الجلب الكسول لكيان واحد يجب أن يطابق عنصره في التجميع الكامل
+    for name, (df, category) in _cases().items():
+        rows = _entity_row_positions(df, category)
+        lazy = [_materialize_entity(df, category, rows, i) for i in range(len(rows))]
+        if _dump(lazy) != _dump(results[name]):
+            print(f'MISMATCH: lazy entities differ from full grouping ({name})')
+            return 1
+    print('ok:', ', '.join(f'{k}={len(v)} entities' for k, v in results.items()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import io
+import os
+import sys
+import time
+import tempfile
+import importlib.util
+
+# Background import jobs end-to-end: POST an import, poll /reports/api/jobs/<id> until it finishes,
+# then check the stored rows; jobs left queued/running by a dead worker are reported as failed.
+# Uses a throwaway SQLite database.
+# Run:  python devtools/test_import_jobs.py
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+_TMP = tempfile.mkdtemp(prefix='import_jobs_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_TMP, 'jobs.db')
+os.environ.setdefault('INQUIRY_INDEX_DIR', os.path.join(_TMP, 'idx'))
+os.environ['IMPORT_JOBS_ASYNC'] = '1'
+
+spec = importlib.util.spec_from_file_location('appmod', os.path.join(BASE_DIR, 'app.py'))
+appmod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(appmod)
+app = appmod.app
+
+import pandas as pd
+from datetime import datetime, timedelta
+from models import db, User
+from models_reports import ReportState, ImportJob
+from utils import dataset_store, import_jobs
+
+ROWS = int(os.environ.get('JOB_ROWS', '2000'))
+
+
+def _xlsx(df: pd.DataFrame) -> io.BytesIO:
+    bio = io.BytesIO()
+    df.to_excel(bio, index=False)
+    bio.seek(0)
+    return bio
+
+
+def _wait(client, job_id: int, timeout: float = 300.0) -> tuple[dict, set]:
+    """متابعة المهمة حتى تنتهي؛ يعيد آخر حالة ومجموعة المراحل التي ظهرت أثناء المتابعة."""
+    seen = set()
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        st = client.get(f'/reports/api/jobs/{job_id}').get_json()
+        if st.get('stage'):
+            seen.add(st['stage'])
+        if st['status'] in ('done', 'failed'):
+            return st, seen
+        time.sleep(0.2)
+    raise TimeoutError(f'job {job_id} did not finish')
+
+
+def _job_id(resp) -> int:
+    return int(resp.headers['Location'].rstrip('/').rsplit('/', 1)[-1])
+
+
+def main() -> int:
+    bad = []
+    base = pd.DataFrame({'رقم العميل': [str(240000 + i) for i in range(ROWS)],
+                         'اسم العميل': [f'مخبز {i}' for i in range(ROWS)],
+                         'مسلسل الماكينة': [f'SN{100000 + i}' for i in range(ROWS)]})
+    extra = pd.DataFrame({'رقم العميل': [str(240000 + i) for i in range(0, ROWS, 2)],
+                          'اسم العميل': [f'مخبز {i}' for i in range(0, ROWS, 2)],
+                          'رقم المحمول': [f'01{i:09d}' for i in range(0, ROWS, 2)]})
+    with app.app_context():
+        client = app.test_client()
+        admin = User.query.filter_by(username='admin').first()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(admin.id)
+
+        t0 = time.perf_counter()
+        resp = client.post('/reports/bakeries/import', content_type='multipart/form-data',
+                           data={'file1': (_xlsx(base), 'a.xlsx'), 'file2': (_xlsx(extra), 'b.xlsx')})
+        answered = time.perf_counter() - t0
+        if resp.status_code != 302 or '/reports/jobs/' not in resp.headers.get('Location', ''):
+            bad.append(f'reports import: expected redirect to job page, got {resp.status_code}')
+            return _report(bad)
+        job_id = _job_id(resp)
+        if client.get(f'/reports/jobs/{job_id}').status_code != 200:
+            bad.append('job page not rendered')
+        st, seen = _wait(client, job_id)
+        print(f'reports job {job_id}: {st["status"]} rows={st["rows_processed"]} '
+              f'elapsed={st["elapsed_ms"]} ms, request answered in {answered * 1000:.0f} ms, stages seen {sorted(seen)}')
+        if st['status'] != 'done' or st['level'] != 'success' or st['rows_processed'] != ROWS:
+            bad.append(f'reports job result: {st}')
+        db.session.expire_all()
+        row = ReportState.query.filter_by(category='bakeries', user_id=admin.id).first()
+        df, _ = dataset_store.load_frame(row)
+        if df is None or len(df) != ROWS or 'رقم المحمول' not in df.columns:
+            bad.append('reports data not stored')
+
+        # وضع إلحاق الكيانات غير المطابقة: كيانات الملف 2 غير الموجودة في الأساس تُضاف كصفوف جديدة
+        new_entities = pd.DataFrame({'رقم العميل': [str(900000 + i) for i in range(10)],
+                                     'اسم العميل': [f'مخبز جديد {i}' for i in range(10)],
+                                     'رقم المحمول': ['0100000000'] * 10})
+        resp = client.post('/reports/bakeries/import', content_type='multipart/form-data',
+                           data={'file1': (_xlsx(base), 'a.xlsx'), 'append_unmatched': '1',
+                                 'file2': (_xlsx(pd.concat([extra, new_entities])), 'b.xlsx')})
+        st, _ = _wait(client, _job_id(resp))
+        if st['status'] != 'done' or st['rows_processed'] != ROWS + len(new_entities):
+            bad.append(f'reports append-unmatched job result: {st}')
+
+        resp = client.post('/trader/primary/import', content_type='multipart/form-data',
+                           data={'file': (_xlsx(base), 'p.xlsx')})
+        st, _ = _wait(client, _job_id(resp))
+        if st['status'] != 'done' or st['rows_processed'] != ROWS:
+            bad.append(f'trader primary job result: {st}')
+
+        resp = client.post('/trader/frequent/import', content_type='multipart/form-data',
+                           data={'label': '2026-01', 'file1': (_xlsx(base), 'f1.xlsx'), 'file2': (_xlsx(extra), 'f2.xlsx')})
+        st, _ = _wait(client, _job_id(resp))
+        if st['status'] != 'done' or st['rows_processed'] != ROWS + len(extra):
+            bad.append(f'trader frequent job result: {st}')
+
+        # ملف تالف: المهمة تنتهي برسالة خطأ بدل خطأ 500 في الطلب
+        resp = client.post('/trader/primary/import', content_type='multipart/form-data',
+                           data={'file': (io.BytesIO(b'not a workbook'), 'bad.xlsx')})
+        st, _ = _wait(client, _job_id(resp))
+        if st['status'] != 'failed' or st['level'] != 'danger':
+            bad.append(f'broken file job result: {st}')
+        if client.get('/reports/api/jobs/999999').status_code != 404:
+            bad.append('unknown job should be 404')
+        bad += _check_stale(client, admin)
+    return _report(bad)
+
+
+def _check_stale(client, admin) -> list:
+    """مهام توقفت بإعادة تشغيل worker: تُسجّل فاشلة (عند الاستعلام وعند البدء) وتُحذف ملفاتها؛ مهمة ينبض مجلدها
+    (مرحلة store في worker آخر لا تستطيع تحديث الجدول) أو سجلها تبقى جارية بملفاتها."""
+    bad = []
+    old = datetime.utcnow() - import_jobs.stale_after() - timedelta(minutes=1)
+    jobs = [ImportJob(kind='reports', target='bakeries', user_id=admin.id, status=status, stage='store',
+                      created_at=old, updated_at=old) for status in ('running', 'queued', 'running')]
+    fresh = ImportJob(kind='reports', target='bakeries', user_id=admin.id, status='running', stage='store')
+    db.session.add_all(jobs + [fresh])
+    db.session.commit()
+    stamp = (old - datetime(1970, 1, 1)).total_seconds()
+    for job in jobs + [fresh]:
+        os.makedirs(import_jobs.job_dir(job.id), exist_ok=True)
+        os.utime(import_jobs.job_dir(job.id), (stamp, stamp))
+    alive_dir, alive_db = jobs[2], fresh
+    os.utime(import_jobs.job_dir(alive_dir.id))          # نبض المجلد فقط
+    st = client.get(f'/reports/api/jobs/{jobs[0].id}').get_json()
+    if st['status'] != 'failed' or st['level'] != 'danger' or os.path.isdir(import_jobs.job_dir(jobs[0].id)):
+        bad.append(f'stale running job not failed on poll: {st}')
+    st = client.get(f'/reports/api/jobs/{alive_dir.id}').get_json()
+    if st['status'] != 'running':
+        bad.append(f'job with a folder heartbeat was failed on poll: {st}')
+    if import_jobs.fail_stale_jobs() != 1 or os.path.isdir(import_jobs.job_dir(jobs[1].id)):
+        bad.append('stale queued job not failed at startup')
+    db.session.expire_all()
+    for job in (alive_dir, alive_db):
+        if db.session.get(ImportJob, job.id).status != 'running' or not os.path.isdir(import_jobs.job_dir(job.id)):
+            bad.append(f'job {job.id} with a recent heartbeat was failed or lost its files')
+    # النبض يحدّث updated_at باتصاله الخاص
+    import_jobs.beat(app, [alive_dir.id])
+    db.session.expire_all()
+    if db.session.get(ImportJob, alive_dir.id).updated_at < datetime.utcnow() - timedelta(minutes=1):
+        bad.append('heartbeat did not update updated_at')
+    for job in (alive_dir, alive_db):
+        os.rmdir(import_jobs.job_dir(job.id))
+    return bad
+
+
+def _report(bad: list) -> int:
+    for b in bad:
+        print('FAIL', b)
+    print('ok' if not bad else f'{len(bad)} failure(s)')
+    return 1 if bad else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+import sys
+import os
+import random
+import time
+
+# Equivalence check: hash-join _left_enrich and index-based _append_unmatched vs the previous
+# merge/row-apply implementations, on random frames (Arabic key variants, duplicate/missing keys,
+# overlapping columns with empty cells).
+# Values are drawn from cleaned text whose cleaning is a fixed point: frames are cleaned once and never
+# re-cleaned (see utils/text_clean), while the old code re-applied _textify on every merge.
+# Run:  python devtools/test_left_enrich.py            (ROUNDS=300)
+#       python devtools/test_left_enrich.py --bench    (BENCH_ROWS=200000 base rows, 4 entity files)
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import numpy as np
+import pandas as pd
+from utils import text_clean
+from routes.machine_reports import _left_enrich, _append_unmatched, _normalize_key_cols, _coerce_text_df, _textify
+
+ROUNDS = int(os.environ.get('ROUNDS', '300'))
+
+
+def _legacy_left_enrich(base: pd.DataFrame, data: pd.DataFrame, keys: list[str], suffix="__D") -> pd.DataFrame:
+    """التنفيذ السابق (merge + textify للأعمدة المشتركة + تنظيف كامل) كمرجع."""
+    if data is None or data.empty or not keys:
+        return base.copy()
+    baseN = _normalize_key_cols(base, keys)
+    dataN = _normalize_key_cols(data, keys).drop_duplicates(subset=keys, keep="first")
+    enrich_cols = [c for c in dataN.columns if c not in keys]
+    merged = baseN.merge(dataN, how="left", on=keys, suffixes=("", suffix), copy=True)
+    for col in enrich_cols:
+        col_with_suffix = f"{col}{suffix}"
+        if col_with_suffix in merged.columns and col in merged.columns:
+            lvals = text_clean.textify_series(merged[col].astype(str))
+            rvals = text_clean.textify_series(merged[col_with_suffix].astype(str))
+            merged[col] = lvals.where(lvals != "", rvals)
+            merged.drop(columns=[col_with_suffix], inplace=True)
+    return _coerce_text_df(merged)
+
+
+def _legacy_append_unmatched(base: pd.DataFrame, data: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    """التنفيذ السابق (مجموعة tuples + apply لكل صف) كمرجع."""
+    if data is None or data.empty or not keys:
+        return base.copy()
+    baseK = _normalize_key_cols(base, keys)
+    dataK = _normalize_key_cols(data, keys)
+    base_keys = set(tuple(row) for row in baseK[keys].itertuples(index=False, name=None))
+    data_only = dataK[~dataK[keys].apply(lambda r: tuple(r) in base_keys, axis=1)]
+    if data_only.empty:
+        return base.copy()
+    union_cols = list(dict.fromkeys(list(base.columns) + [c for c in data_only.columns if c not in base.columns]))
+    out = pd.concat([base.reindex(columns=union_cols), data_only.reindex(columns=union_cols)], ignore_index=True)
+    return _coerce_text_df(out)
+
+
+_KEYS = ['240001', '٢٤٠٠٠١', '240002', ' 240002 ', '007', '7', '', '12.5', 'مخبز أحمد', 'مخبز احمد', 'مخبز  إبراهيم',
+         'مخبز ابراهيم', 'مكتب ١', 'مكتب 1', 'الإدارة أ', 'الاداره ا', 'هدى', 'هدي', 'nan']
+_VALUES = ['', '', '', 'x', 'y', '0', '1', '0101234567', '12.5', '1e3', 'ملاحظة', 'رئيسية', '—', 'SN-001', '  a  ']
+
+
+def _fixed(values: list) -> list:
+    """القيم التي تنظيفها ثابت (تنظيفها مرة ثانية لا يغيرها)."""
+    return [v for v in values if _textify(_textify(v)) == _textify(v)]
+
+
+def _frame(rng: random.Random, n: int, keys: list, cols: list) -> pd.DataFrame:
+    data = {k: [rng.choice(_KEYS) for _ in range(n)] for k in keys}
+    for c in cols:
+        data[c] = [rng.choice(_VALUES) for _ in range(n)]
+    return _coerce_text_df(pd.DataFrame(data))
+
+
+def check() -> list:
+    global _KEYS, _VALUES
+    _KEYS, _VALUES = _fixed(_KEYS), _fixed(_VALUES)
+    rng = random.Random(11)
+    bad = []
+    for i in range(ROUNDS):
+        keys = rng.choice([['رقم العميل'], ['رقم العميل', 'اسم العميل'], ['الادارة', 'المكتب']])
+        base = _frame(rng, rng.randint(1, 40), keys, ['a', 'b', 'c'])
+        data = _frame(rng, rng.randint(1, 30), keys, rng.sample(['b', 'c', 'd', 'e'], rng.randint(1, 4)))
+        if i % 7 == 0:
+            # جدول إثراء غير معلّم (كما يصل من مجمع العمليات بعد pickle)
+            data = data.copy()
+        old, new = _legacy_left_enrich(base, data, keys), _left_enrich(base, data, keys)
+        if list(old.columns) != list(new.columns) or not old.reset_index(drop=True).equals(new):
+            bad.append((i, keys, list(old.columns), list(new.columns)))
+        if not text_clean.is_clean(new, 'reports'):
+            bad.append((i, 'output not marked clean', '', ''))
+        # الإلحاق بعد الإثراء كما في _merge_all
+        old, new = _legacy_append_unmatched(new, data, keys), _append_unmatched(new, data, keys)
+        if list(old.columns) != list(new.columns) or not old.reset_index(drop=True).equals(new.reset_index(drop=True)):
+            bad.append((i, ['append'] + keys, list(old.columns), list(new.columns)))
+    return bad
+
+
+def _bench() -> None:
+    n = int(os.environ.get('BENCH_ROWS', '200000'))
+    rng = np.random.default_rng(4)
+    codes = np.array([str(240000 + i) for i in range(n // 2)], dtype=object)
+    names = np.array([f'مخبز {i}' for i in range(n // 2)], dtype=object)
+    pick = rng.integers(0, n // 2, n)
+    base = _coerce_text_df(pd.DataFrame({'رقم العميل': codes[pick], 'اسم العميل': names[pick],
+                                         'مسلسل': [f'SN{i}' for i in range(n)], 'رقم المحمول': np.where(pick % 3 == 0, '', '010')}))
+    files = []
+    for j in range(4):
+        sel = rng.permutation(n // 2)[: n // 4]
+        files.append(_coerce_text_df(pd.DataFrame({'رقم العميل': codes[sel], 'اسم العميل': names[sel],
+                                                   'رقم المحمول': [f'01{x:09d}' for x in sel],
+                                                   f'بيان {j}': ['س'] * len(sel)})))
+    keys = ['رقم العميل', 'اسم العميل']
+    for label, fn in (('merge (previous)', _legacy_left_enrich), ('hash join', _left_enrich)):
+        t0 = time.perf_counter()
+        out = base
+        for f in files:
+            out = fn(out, f, keys)
+        print(f'{label:<18} {n} rows x 4 files   {time.perf_counter() - t0:7.2f} s   -> {out.shape}')
+    # ملف إثراء نصفه كيانات غير موجودة في الأساس
+    extra = _coerce_text_df(pd.DataFrame({'رقم العميل': [str(240000 + i) for i in range(n // 4, n // 4 + n // 2)],
+                                          'اسم العميل': [f'مخبز {i}' for i in range(n // 4, n // 4 + n // 2)],
+                                          'بيان': ['س'] * (n // 2)}))
+    for label, fn in (('apply (previous)', _legacy_append_unmatched), ('index anti-join', _append_unmatched)):
+        t0 = time.perf_counter()
+        out = fn(base, extra, keys)
+        print(f'{label:<18} {n} + {len(extra)} rows   {time.perf_counter() - t0:7.2f} s   -> {out.shape}')
+
+
+def main() -> int:
+    bad = check()
+    for b in bad[:20]:
+        print('MISMATCH round=%s keys=%s old=%s new=%s' % b)
+    if bad:
+        return 1
+    print(f'ok: {ROUNDS} rounds')
+    if '--bench' in sys.argv:
+        _bench()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
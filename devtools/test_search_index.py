@@ -0,0 +1,121 @@
+import sys
+import os
+import random
+import time
+
+# Equivalence check: "all columns" search through the trigram index (utils/search_index) vs the full
+# row-text scan, for the reports and trader _filter_dataframe, on random frames and queries (Arabic
+# letter variants, queries spanning two columns, short queries, regex characters that keep the old path).
+# Run:  python devtools/test_search_index.py            (ROUNDS=200)
+#       python devtools/test_search_index.py --bench    (BENCH_ROWS=200000, 12 columns)
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import numpy as np
+import pandas as pd
+from flask import Flask
+from utils import search_index, norm_keys
+from routes import machine_reports as reports
+from routes import trader_services as trader
+
+ROUNDS = int(os.environ.get('ROUNDS', '200'))
+
+_WORDS = ['مخبز', 'أحمد', 'احمد', 'إبراهيم', 'ابراهيم', 'هدى', 'هدي', 'النور', 'الإدارة', 'مكتب', '٢٤٠٠٠١', '240001',
+          'SN-100', 'sn-100', 'Main', 'main', '', '', '0101234567', 'a.b', 'x(y']
+
+
+def _value(rng: random.Random) -> str:
+    return ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(0, 3))).strip()
+
+
+def _query(rng: random.Random, df: pd.DataFrame) -> str:
+    kind = rng.randint(0, 5)
+    if kind == 0:
+        return rng.choice(_WORDS)
+    if kind == 1 and len(df):
+        # جزء يمتد عبر نهاية عمود وبداية التالي
+        r = rng.randrange(len(df))
+        text = ' '.join(v for v in df.iloc[r].tolist() if v)
+        if len(text) > 4:
+            i = rng.randrange(len(text) - 3)
+            return text[i:i + rng.randint(2, 12)]
+        return text
+    if kind == 2:
+        return rng.choice(['ا', 'مخ', 'sn', ' ', '1', 'د م'])
+    if kind == 3:
+        return rng.choice(['a.b', 'x(y', '24.0', 'sn|main', '[0]'])
+    return _value(rng)
+
+
+def _frame(rng: random.Random, n: int, cols: int) -> pd.DataFrame:
+    return pd.DataFrame({f'c{j}': [_value(rng) for _ in range(n)] for j in range(cols)})
+
+
+def check() -> list:
+    rng = random.Random(21)
+    bad = []
+    app = Flask(__name__)
+    with app.app_context():
+        for i in range(ROUNDS):
+            df = _frame(rng, rng.randint(0, 60), rng.randint(1, 5))
+            r_index = search_index.build(df, norm_keys.norm_key_array)
+            t_index = search_index.build(df)
+            for _ in range(5):
+                q = _query(rng, df)
+                try:
+                    old = reports._filter_dataframe(df, q)
+                except Exception as ex:
+                    old = ex
+                new = reports._filter_dataframe(df, q, text_index=lambda: r_index)
+                if isinstance(old, Exception) or not old.index.equals(new.index):
+                    bad.append(('reports', i, q))
+                # الشاشة الحالية ترفع re.error لاستعلام نمطي غير صالح (مثل "x(y")؛ المطلوب نفس السلوك
+                outs = []
+                for kw in ({}, {'text_index': lambda: t_index}):
+                    try:
+                        outs.append(trader._filter_dataframe(df, q, 'all', **kw).index)
+                    except Exception as ex:
+                        outs.append(type(ex).__name__)
+                if not (outs[0] == outs[1] if isinstance(outs[0], str) else outs[0].equals(outs[1])):
+                    bad.append(('trader', i, q))
+    return bad
+
+
+def _bench() -> None:
+    n = int(os.environ.get('BENCH_ROWS', '200000'))
+    rng = np.random.default_rng(5)
+    df = pd.DataFrame({f'عمود {j}': [f'قيمة {x} مخبز' if j % 3 == 0 else f'{240000 + x}'
+                                     for x in rng.integers(0, n, n)] for j in range(12)})
+    app = Flask(__name__)
+    with app.app_context():
+        for label, build, fn in (('reports', lambda: search_index.build(df, norm_keys.norm_key_array), reports._filter_dataframe),
+                                 ('trader', lambda: search_index.build(df), lambda d, q, text_index=None: trader._filter_dataframe(d, q, 'all', text_index=text_index))):
+            t0 = time.perf_counter()
+            idx = build()
+            t_build = time.perf_counter() - t0
+            for q in ('2412345', 'قيمة 1234 مخبز'):
+                t0 = time.perf_counter()
+                old = fn(df, q)
+                t_scan = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                new = fn(df, q, text_index=lambda: idx)
+                t_idx = time.perf_counter() - t0
+                print(f'{label:<8} q={q!r:<18} scan {t_scan * 1000:8.1f} ms   index {t_idx * 1000:7.1f} ms   '
+                      f'rows {len(new)} (same={old.index.equals(new.index)})   build {t_build:.1f} s')
+
+
+def main() -> int:
+    bad = check()
+    for b in bad[:20]:
+        print('MISMATCH screen=%s round=%s q=%r' % b)
+    if bad:
+        return 1
+    print(f'ok: {ROUNDS} rounds')
+    if '--bench' in sys.argv:
+        _bench()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import random
+import tempfile
+
+# Shared (memory-mapped) inquiry indexes (utils/shared_index): SharedSubstringIndex.search must return the same
+# row positions as the in-memory SubstringIndex it was written from, for short queries (scanned over the
+# joined values) and trigram queries, including matches that cross the boundary between two stored values.
+# Run:  python devtools/test_shared_index.py            (ROUNDS=200)
+#       python devtools/test_shared_index.py --bench    (BENCH_ROWS=200000; short-query scan time)
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import numpy as np
+from utils.inquiry_index import SubstringIndex
+from utils.shared_index import SharedSubstringIndex
+
+ROUNDS = int(os.environ.get('ROUNDS', '200'))
+_TMP = tempfile.mkdtemp(prefix='shared_index_')
+_ALPHABET = ['0', '0', '1', '2', '5', '7', 'a', 'b', 'م', 'خ', 'ب', 'ز', '-']
+
+
+def _shared(index: SubstringIndex, name: str) -> SharedSubstringIndex:
+    prefix = os.path.join(_TMP, name)
+    SharedSubstringIndex.write(prefix, index)
+    return SharedSubstringIndex.load(prefix, index.cols)
+
+
+def _pair(keys: list, name: str) -> tuple:
+    index = SubstringIndex.build(['c'], np.array(keys, dtype=object), np.arange(len(keys), dtype=np.int32))
+    return index, _shared(index, name)
+
+
+def check() -> list:
+    bad = []
+    # تطابق يعبر الحد بين '10' و'005' كان يتخطى '00' في بداية '005'
+    mem, shared = _pair(['10', '005', '2100', '7'], 'boundary')
+    for q in ('00', '0', '10', '1', '7', '005', '100'):
+        if mem.search(q).tolist() != shared.search(q).tolist():
+            bad.append(f'boundary q={q!r}: memory {mem.search(q).tolist()} shared {shared.search(q).tolist()}')
+    rng = random.Random(7)
+    for i in range(ROUNDS):
+        keys = [''.join(rng.choice(_ALPHABET) for _ in range(rng.randint(1, 6))) for _ in range(rng.randint(1, 80))]
+        mem, shared = _pair(keys, f'r{i}')
+        for _ in range(10):
+            q = ''.join(rng.choice(_ALPHABET) for _ in range(rng.randint(1, 4)))
+            if mem.search(q).tolist() != shared.search(q).tolist():
+                bad.append(f'round {i} q={q!r}')
+    return bad
+
+
+def _bench() -> None:
+    n = int(os.environ.get('BENCH_ROWS', '200000'))
+    rng = np.random.default_rng(7)
+    keys = [f'{x:07d}' for x in rng.integers(0, 10 ** 7, n)]
+    mem, shared = _pair(keys, 'bench')
+    for q in ('00', '5', '123'):
+        t0 = time.perf_counter()
+        m = mem.search(q)
+        t_mem = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        s = shared.search(q)
+        t_shared = time.perf_counter() - t0
+        print(f'q={q!r:<6} memory {t_mem * 1000:8.1f} ms   shared {t_shared * 1000:8.1f} ms   '
+              f'rows {len(s)}   same={m.tolist() == s.tolist()}   ({n} keys)')
+
+
+def main() -> int:
+    bad = check()
+    for b in bad[:20]:
+        print('MISMATCH', b)
+    if bad:
+        print(f'{len(bad)} mismatch(es)')
+        return 1
+    print(f'ok: {ROUNDS} rounds')
+    if '--bench' in sys.argv:
+        _bench()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+import sys
+import os
+import io
+import time
+import random
+import datetime
+import tracemalloc
+
+# Equivalence check: chunked upload reader (utils/stream_ingest) vs the full read of _read_any
+# (pd.read_excel / pd.read_csv with dtype=str) on synthetic files with awkward layouts.
+# Run:  python devtools/test_stream_ingest.py
+#       python devtools/test_stream_ingest.py --bench     (BENCH_ROWS=200000 by default)
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import openpyxl
+import pandas as pd
+from utils import stream_ingest
+
+
+class _Upload:
+    """بديل FileStorage: اسم + تيار قابل للبحث."""
+
+    def __init__(self, filename: str, payload: bytes):
+        self.filename = filename
+        self.stream = io.BytesIO(payload)
+
+    def read(self):
+        return self.stream.read()
+
+
+def _xlsx(rows: list) -> bytes:
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for r in rows:
+        ws.append(r)
+    bio = io.BytesIO()
+    wb.save(bio)
+    return bio.getvalue()
+
+
+def _excel_cases() -> dict:
+    rng = random.Random(7)
+    body = []
+    for i in range(2500):
+        if i % 500 == 7:
+            body.append([])
+            continue
+        body.append([str(1000 + i) if i % 3 else 1000 + i, f'عميل {i}' if i % 11 else 'NA',
+                     'c' if i % 5 == 0 else None, i + 0.5 if i % 2 else float(i),
+                     datetime.datetime(2024, 1, 1 + i % 28, 10, i % 60) if i % 4 else '2024-02-01',
+                     '#N/A' if i % 13 == 0 else 'n', i % 2 == 0, rng.choice([None, '', ' 007 '])])
+    header = ['رقم العميل', 'اسم', None, 'مبلغ', 'تاريخ', 'اسم', 'flag', 'x']
+    return {
+        # عناوين مكررة/فارغة، صفوف فارغة في الوسط والنهاية، أنواع مختلطة
+        'mixed': [header] + body + [[None] * 8, []],
+        'formula error': [['a', 'b'], [1, '=1/0'], [2, 'x']],
+        'header only': [['a', 'b']],
+        'empty': [],
+        'short rows': [['a', 'b', 'c'], [1], [None, None, 3], ['x', 'y']],
+        'leading blanks': [['a', 'b'], [], [], ['1', '2']],
+    }
+
+
+def check() -> list:
+    bad = []
+    for name, rows in _excel_cases().items():
+        payload = _xlsx(rows)
+        try:
+            ref = pd.read_excel(io.BytesIO(payload), dtype=str)
+        except Exception:
+            ref = pd.DataFrame()
+        for chunk_rows in (1, 7, 700, 100000):
+            frames = stream_ingest.open_upload_frames(_Upload(f'{name}.xlsx', payload), chunk_rows)
+            got = pd.concat(list(frames)) if frames is not None else pd.DataFrame()
+            if ref.empty and got.empty and len(ref.columns) == 0:
+                continue
+            if list(ref.columns) != list(got.columns) or not ref.equals(got):
+                bad.append(('xlsx', name, chunk_rows))
+
+    # صف أعرض من العناوين: read_excel يضيف أعمدة Unnamed للملف كله، فيُرفض البث
+    wide = _Upload('wide.xlsx', _xlsx([['a'], [1], [1, 2]]))
+    try:
+        list(stream_ingest.open_upload_frames(wide, 1))
+        bad.append(('xlsx', 'wide row not rejected', 1))
+    except stream_ingest.StreamUnsupported:
+        pass
+    try:
+        stream_ingest.open_upload_frames(_Upload('old.xls', b'\xd0\xcf'))
+        bad.append(('xls', 'not rejected', 0))
+    except stream_ingest.StreamUnsupported:
+        pass
+
+    text = 'رقم,اسم,اسم,\n1,أ,,x\n,,,\n007,"ب, ج",د,\n' + '\n'.join(f'{i},n{i},,' for i in range(300)) + '\n'
+    for enc_name, payload in (('utf8', text.encode('utf-8')), ('bad bytes', text.encode('utf-8') + b'\xff,1,2,3\n')):
+        ref = pd.read_csv(io.BytesIO(payload), dtype=str, encoding='utf-8', encoding_errors='ignore')
+        for chunk_rows in (1, 50, 100000):
+            got = pd.concat(list(stream_ingest.open_upload_frames(_Upload('a.csv', payload), chunk_rows)))
+            if list(ref.columns) != list(got.columns) or not ref.equals(got):
+                bad.append(('csv', enc_name, chunk_rows))
+    return bad
+
+
+def _bench() -> None:
+    n = int(os.environ.get('BENCH_ROWS', '200000'))
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(['رقم العميل', 'اسم العميل', 'مسلسل', 'المكتب', 'كمية', 'تاريخ'])
+    for i in range(n):
+        ws.append([i, f'مخبز {i % 5000}', f'{i:015d}', f'مكتب {i % 40}', i / 4, '2024-01-02'])
+    bio = io.BytesIO()
+    wb.save(bio)
+    payload = bio.getvalue()
+    print(f'{n} rows, xlsx {len(payload) / 1e6:.1f} MB')
+
+    for label, fn in (('read_excel (full)', lambda: pd.read_excel(io.BytesIO(payload), dtype=str)),
+                      ('stream chunks', lambda: sum(len(df) for df in stream_ingest.open_upload_frames(
+                          _Upload('b.xlsx', payload))))):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'{label:<20} {elapsed:7.2f} s   peak python alloc {peak / 1e6:8.1f} MB')
+
+
+def main() -> int:
+    bad = check()
+    for b in bad:
+        print('MISMATCH format=%s case=%s chunk_rows=%s' % b)
+    if bad:
+        return 1
+    print('ok')
+    if '--bench' in sys.argv:
+        _bench()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
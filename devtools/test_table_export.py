@@ -0,0 +1,215 @@
+import io
+import os
+import sys
+import time
+import random
+import tempfile
+import tracemalloc
+import importlib.util
+
+# Streaming XLSX export (utils/table_export): the workbook read back must hold the same cells as the
+# previous pandas/ExcelWriter export (text cells, empty cells, support date/time columns), with the same
+# header and frozen first row, for random frames and through the report/trader/support export URLs.
+# format=csv must carry the same cells (UTF-8 with BOM), with formula-like values kept as text ('-prefixed);
+# format=parquet needs pyarrow (else a redirect).
+# Uses a throwaway SQLite database.
+# Run:  python devtools/test_table_export.py            (ROUNDS=40)
+#       python devtools/test_table_export.py --bench    (BENCH_ROWS=200000, 12 columns; time and peak memory)
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+_TMP = tempfile.mkdtemp(prefix='table_export_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_TMP, 'export.db')
+os.environ.setdefault('INQUIRY_INDEX_DIR', os.path.join(_TMP, 'idx'))
+os.environ['IMPORT_JOBS_ASYNC'] = '0'
+
+spec = importlib.util.spec_from_file_location('appmod', os.path.join(BASE_DIR, 'app.py'))
+appmod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(appmod)
+app = appmod.app
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from openpyxl import load_workbook
+from models import db, User, SupportCase
+from utils import table_export
+
+ROUNDS = int(os.environ.get('ROUNDS', '40'))
+_DATE_COLS = ('وقت التذكير', 'تاريخ التسجيل')
+
+
+def _legacy_xlsx(out_df: pd.DataFrame) -> io.BytesIO:
+    """التصدير السابق (ExcelWriter + قياس كل القيم) كمرجع."""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        out_df.to_excel(writer, index=False, sheet_name='data')
+        ws = writer.sheets['data']
+        for i, c in enumerate(out_df.columns):
+            series = out_df[c].astype(str)
+            ws.set_column(i, i, min(max([len(str(c))] + [len(s) for s in series.tolist()]) + 2, 60))
+        ws.freeze_panes(1, 0)
+    output.seek(0)
+    return output
+
+
+def _cells(data) -> tuple:
+    ws = load_workbook(data if not isinstance(data, bytes) else io.BytesIO(data), read_only=False)['data']
+    rows = [[('' if v is None else v) for v in r] for r in ws.iter_rows(values_only=True)]
+    return rows, ws.freeze_panes
+
+
+def _frame(rng: random.Random, n: int, dates: bool) -> pd.DataFrame:
+    words = ['', '', 'مخبز', '0101234567', '240001', '=1+1', 'http://x.y', '  ', 'SN-100', 'a' * 80]
+    df = pd.DataFrame({f'عمود {j}': [rng.choice(words) for _ in range(n)] for j in range(rng.randint(1, 5))})
+    if dates:
+        for c in _DATE_COLS:
+            df[c] = pd.to_datetime([datetime(2024, 1, 1 + rng.randrange(28), rng.randrange(24), rng.randrange(60))
+                                    if rng.random() < 0.7 else None for _ in range(n)])
+    return df
+
+
+def check_frames() -> list:
+    rng = random.Random(23)
+    bad = []
+    for i in range(ROUNDS):
+        dates = i % 3 == 0
+        df = _frame(rng, rng.randint(0, 3000), dates)
+        new = io.BytesIO()
+        table_export.write_xlsx(df, new, datetime_cols=_DATE_COLS if dates else ())
+        new.seek(0)
+        old_rows, old_freeze = _cells(_legacy_xlsx(df))
+        new_rows, new_freeze = _cells(new)
+        if old_rows != new_rows or old_freeze != new_freeze:
+            bad.append(f'round {i}: cells differ ({len(df)} rows)')
+        widths = table_export.column_widths(df, _DATE_COLS if dates else ())
+        if any(w > 60 or w < 3 for w in widths):
+            bad.append(f'round {i}: widths {widths}')
+    return bad
+
+
+def check_csv_formulas() -> list:
+    """قيم تبدأ كمعادلة تبقى نصاً في CSV (تُسبق بـ ')؛ الأرقام السالبة/الدولية والقيم العادية كما هي."""
+    cases = {'=1+1': "'=1+1", '@SUM(A1)': "'@SUM(A1)", '+cmd|x': "'+cmd|x", '-cmd': "'-cmd", '\tx': "'\tx",
+             '-5': '-5', '+201001234567': '+201001234567', '-.5': '-.5', '-': '-', 'مخبز': 'مخبز', '': '', 'a=b': 'a=b'}
+    df = pd.DataFrame({'=HEADER()': list(cases), 'نص': ['x'] * len(cases)})
+    body = b''.join(table_export.iter_csv(df))
+    csv = pd.read_csv(io.BytesIO(body), dtype=str, keep_default_na=False, encoding='utf-8-sig')
+    bad = []
+    if list(csv.columns) != ["'=HEADER()", 'نص']:
+        bad.append(f'csv formula header not escaped: {list(csv.columns)}')
+    if csv.iloc[:, 0].tolist() != list(cases.values()):
+        bad.append(f'csv formula cells: {csv.iloc[:, 0].tolist()}')
+    if df.iloc[:, 0].tolist() != list(cases):
+        bad.append('csv export modified the source frame')
+    return bad
+
+
+def _xlsx(df: pd.DataFrame) -> io.BytesIO:
+    bio = io.BytesIO()
+    df.to_excel(bio, index=False)
+    bio.seek(0)
+    return bio
+
+
+def check_urls(client) -> list:
+    bad = []
+    df = pd.DataFrame({'رقم العميل': [str(240000 + i) for i in range(500)],
+                       'اسم العميل': [f'مخبز {i}' for i in range(500)],
+                       'ملاحظات': [''] * 500})
+    client.post('/reports/bakeries/import', content_type='multipart/form-data', data={'file1': (_xlsx(df), 'a.xlsx')})
+    client.post('/trader/primary/import', content_type='multipart/form-data', data={'file': (_xlsx(df), 'p.xlsx')})
+    admin = User.query.filter_by(username='admin').first()
+    db.session.add_all([SupportCase(name=f'عميل {i}', code=str(1000 + i), work_type='أعمال دعم عامة',
+                                    reminder_at='2024-05-01 09:30' if i % 2 else '', created_by=admin.id)
+                        for i in range(50)])
+    db.session.commit()
+    for url, expect_rows in (('/reports/bakeries/export', 501), ('/trader/primary/export', 501), ('/support/export', 51)):
+        resp = client.get(url)
+        body = b''.join(resp.response)
+        resp.close()
+        if resp.status_code != 200 or resp.mimetype != table_export.XLSX_MIMETYPE:
+            bad.append(f'{url}: {resp.status_code} {resp.mimetype}')
+            continue
+        rows, freeze = _cells(body)
+        if len(rows) != expect_rows or freeze != 'A2' or 'ملاحظات' in rows[0]:
+            bad.append(f'{url}: {len(rows)} rows, header {rows[0]}')
+        if url.startswith('/support'):
+            col = rows[0].index('وقت التذكير') if 'وقت التذكير' in rows[0] else None
+            if col is None or not any(isinstance(r[col], datetime) for r in rows[1:]):
+                bad.append(f'{url}: reminder column not exported as date/time')
+        bad += _check_formats(client, url, rows)
+    return bad
+
+
+def _check_formats(client, url: str, rows: list) -> list:
+    """CSV وParquet لنفس الرابط: نفس الخلايا التي في ملف Excel."""
+    bad = []
+    resp = client.get(url + '?format=csv')
+    body = b''.join(resp.response)
+    resp.close()
+    if not body.startswith(b'\xef\xbb\xbf') or resp.mimetype != 'text/csv':
+        bad.append(f'{url} csv: no BOM or mimetype {resp.mimetype}')
+    csv = pd.read_csv(io.BytesIO(body), dtype=str, keep_default_na=False, encoding='utf-8-sig')
+    expect = [[v.strftime('%Y-%m-%d %H:%M') if isinstance(v, datetime) else str(v) for v in r] for r in rows]
+    if [list(csv.columns)] + csv.values.tolist() != expect:
+        bad.append(f'{url} csv: cells differ from the Excel export')
+    resp = client.get(url + '?format=parquet')
+    try:
+        import pyarrow  # noqa: F401
+    except ModuleNotFoundError:
+        if resp.status_code != 302:
+            bad.append(f'{url} parquet without pyarrow: {resp.status_code}')
+        return bad
+    pq = pd.read_parquet(io.BytesIO(resp.data))
+    if list(pq.columns) != rows[0] or len(pq) != len(rows) - 1:
+        bad.append(f'{url} parquet: {pq.shape}')
+    return bad
+
+
+def _bench() -> None:
+    n = int(os.environ.get('BENCH_ROWS', '200000'))
+    rng = np.random.default_rng(23)
+    df = pd.DataFrame({f'عمود {j}': [f'قيمة {x} مخبز' if j % 3 == 0 else f'{240000 + x}'
+                                     for x in rng.integers(0, n, n)] for j in range(12)})
+    for label, fn in (('ExcelWriter (previous)', lambda: _legacy_xlsx(df)),
+                      ('streaming', lambda: table_export.write_xlsx(df, tempfile.TemporaryFile()))):
+        t0 = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t0
+        # الذاكرة في تشغيل منفصل (tracemalloc يبطئ الكتابة)
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f'{label:<24} {elapsed:7.1f} s   peak python memory {peak / 2**20:8.1f} MB   ({n} rows x 12)')
+    chunks = table_export.iter_csv(df)
+    t0 = time.perf_counter()
+    next(chunks)
+    next(chunks)
+    t_first = time.perf_counter() - t0
+    size = sum(len(c) for c in chunks)
+    print(f'{"csv (streamed)":<24} first rows after {t_first * 1000:.1f} ms, complete {time.perf_counter() - t0:5.1f} s '
+          f'({size / 2**20:.1f} MB)')
+
+
+def main() -> int:
+    bad = check_frames() + check_csv_formulas()
+    with app.app_context():
+        client = app.test_client()
+        admin = User.query.filter_by(username='admin').first()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(admin.id)
+        bad += check_urls(client)
+    for b in bad:
+        print('FAIL', b)
+    if bad:
+        return 1
+    print(f'ok: {ROUNDS} rounds + export URLs')
+    if '--bench' in sys.argv:
+        _bench()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+import sys
+import os
+import re
+import random
+import time
+
+# Property-based equivalence check: column engine (utils/text_clean.textify_array) vs the legacy
+# per-cell _textify of each screen, on random values. Uses hypothesis when installed, otherwise a
+# seeded random generator over the same value space.
+# Run:  python devtools/test_text_clean.py            (EXAMPLES=2000 by default)
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from utils import text_clean
+
+try:
+    from hypothesis import given, settings, strategies as st
+except ModuleNotFoundError:
+    given = None
+
+EXAMPLES = int(os.environ.get('EXAMPLES', '2000'))
+_EMPTY_TOKENS = {"nan", "none", "null", "na", "n/a", "nat", "-", "—"}
+
+
+# ========== الدوال القديمة (مرجع) ==========
+def _legacy_reports(v) -> str:
+    if v is None: return ""
+    if isinstance(v, (float, np.float64)):
+        if np.isinf(v):
+            return ""
+        if np.isnan(v):
+            return ""
+    t = str(v).strip()
+    if t == "" or t.lower() in _EMPTY_TOKENS: return ""
+    t = t.replace(",", "")
+    if t.isdigit() and len(t) > 12:
+        return t
+    try:
+        float_val = float(t)
+        if np.isinf(float_val) or np.isnan(float_val):
+            return ""
+        if float_val == int(float_val):
+            return str(int(float_val))
+        return str(float_val)
+    except ValueError:
+        pass
+    return t
+
+
+def _legacy_trader(v) -> str:
+    if v is None: return ""
+    t = str(v).strip()
+    if t == "" or t.lower() in _EMPTY_TOKENS: return ""
+    t = t.replace(",", "")
+    if re.fullmatch(r"\d+", t): return t
+    if re.fullmatch(r"\d+\.\d+", t): return t.split(".", 1)[0]
+    if re.fullmatch(r"[0-9]+(\.[0-9]+)?[eE][+\-]?[0-9]+", t):
+        try: return str(Decimal(t).to_integral_value(rounding="ROUND_DOWN"))
+        except InvalidOperation: return ""
+    return t
+
+
+def _legacy_support(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, datetime):
+        return v.strftime("%Y-%m-%d %H:%M")
+    return _legacy_trader(v)
+
+
+def _legacy_coerce_reports(df: pd.DataFrame) -> pd.DataFrame:
+    out = df.copy()
+    out.columns = [str(c).strip().replace("\n", " ").replace("\r", " ") for c in out.columns]
+    out = out[list(dict.fromkeys(out.columns))]
+    for c in out.columns:
+        out[c] = out[c].map(_legacy_reports)
+    return out
+
+
+LEGACY = {'reports': _legacy_reports, 'trader': _legacy_trader, 'support': _legacy_support}
+
+# ========== توليد القيم ==========
+# حروف تغطي: أرقام لاتينية/عربية/كاملة العرض، فواصل، إشارات، أس، مسافات يونيكود، رموز فارغة
+_ALPHABET = list("0123456789٠١٢٣٤٥٦٧٨٩０１.,-+eEinfatyNAn_/ :\t ²") + ['مخبز', 'SN', '—', 'null', 'None']
+_SPECIAL = ['', ' ', 'nan', 'NaN', 'N/A', '-', '—', 'nat', 'inf', '-inf', 'Infinity', '007', '0', '00', '-0',
+            '12.5', '12.50', '1,234', '1,234.5', '1e3', '1.5E+2', '2e-3', '1_000', '.5', '5.', ',', ', 12.5',
+            '1234567890123', '12345678901234567890', '٠١٢٣٤٥٦٧٨٩٠١٢٣', '١٢.٥', '+5', ' 42 ', 'n,a',
+            '2024-01-02 10:30', '01/02/2024', 'SN-00012', 'مخبز النور', '0x1F', '1e400', '9' * 12, '0' * 14]
+
+
+def _random_value(rng: random.Random):
+    r = rng.random()
+    if r < 0.35:
+        return rng.choice(_SPECIAL)
+    if r < 0.75:
+        return ''.join(rng.choice(_ALPHABET) for _ in range(rng.randint(0, 8)))
+    if r < 0.82:
+        return rng.choice([None, np.nan, float('inf'), -0.0, 0.0, 12.5, 1e20, 3.0, 1e-7])
+    if r < 0.88:
+        return rng.choice([0, 7, -12, 10 ** 15, 2 ** 60, True])
+    if r < 0.94:
+        return datetime(2024, rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 23), rng.randint(0, 59))
+    return str(rng.randint(0, 10 ** rng.randint(1, 18))).zfill(rng.randint(1, 20))
+
+
+def _column_variants(values: list) -> list:
+    """نفس القيم بأكثر من نوع عمود: object، وعددي/تاريخ عند الإمكان."""
+    cols = [pd.Series(values, dtype=object)]
+    nums = [v for v in values if isinstance(v, float) and not isinstance(v, bool)]
+    if nums:
+        cols.append(pd.Series(nums, dtype=np.float64))
+    ints = [v for v in values if isinstance(v, int) and not isinstance(v, bool)]
+    if ints:
+        cols.append(pd.Series(ints, dtype=np.int64))
+    return cols
+
+
+def check(values: list) -> list:
+    """قائمة الاختلافات (فارغة عند التطابق) لكل الأنماط."""
+    bad = []
+    for mode, legacy in LEGACY.items():
+        for col in _column_variants(values):
+            expected = []
+            for v in col.tolist() if col.dtype != object else list(col):
+                expected.append(legacy(v))
+            got = list(text_clean.textify_array(col, mode))
+            scalar = [text_clean.TEXTIFY[mode](v) for v in (col.tolist() if col.dtype != object else list(col))]
+            for v, e, g, s in zip(col.tolist(), expected, got, scalar):
+                if not (e == g == s):
+                    bad.append((mode, str(col.dtype), repr(v), e, g, s))
+    return bad
+
+
+def check_frame(values: list) -> list:
+    """_coerce_text_df الجديدة مقابل القديمة (أسماء أعمدة تحتاج تنظيفاً + أعمدة مكررة بعد التنظيف)."""
+    from routes.machine_reports import _coerce_text_df
+    n = len(values)
+    df = pd.DataFrame({'a': values, ' b\n': values[::-1], 'c\r': range(n)})
+    old, new = _legacy_coerce_reports(df), _coerce_text_df(df)
+    bad = []
+    if list(old.columns) != list(new.columns) or not old.equals(new):
+        bad.append(('reports', 'frame', repr(values)[:80], list(old.columns), list(new.columns), ''))
+    # مع الأسماء المكررة كانت الحلقة القديمة تعيد _textify على نفس العمود مرتين؛ نقارن الأعمدة فقط
+    dup = df.set_axis(['a', 'b', 'a '], axis=1)
+    if list(_legacy_coerce_reports(dup).columns) != list(_coerce_text_df(dup).columns):
+        bad.append(('reports', 'frame-dup', repr(values)[:80], '', '', ''))
+    return bad
+
+
+def _run_random() -> list:
+    rng = random.Random(2024)
+    bad = []
+    for i in range(EXAMPLES):
+        values = [_random_value(rng) for _ in range(rng.randint(1, 30))]
+        bad += check(values)
+        if i % 20 == 0:
+            bad += check_frame(values)
+    return bad
+
+
+def _run_hypothesis() -> list:
+    bad = []
+    value = st.one_of(
+        st.sampled_from(_SPECIAL), st.text(alphabet=st.sampled_from(_ALPHABET), max_size=8), st.text(max_size=6),
+        st.none(), st.floats(allow_nan=True), st.integers(min_value=-2 ** 62, max_value=2 ** 62),
+        st.datetimes(min_value=datetime(1990, 1, 1), max_value=datetime(2100, 1, 1)),
+    )
+
+    @settings(max_examples=EXAMPLES, deadline=None)
+    @given(st.lists(value, min_size=1, max_size=30))
+    def prop(values):
+        found = check(values)
+        bad.extend(found)
+        assert not found
+
+    try:
+        prop()
+    except AssertionError:
+        pass
+    return bad
+
+
+def check_marker() -> list:
+    """علامة النظافة: تبقى مع النسخ الصريحة فقط، وتُسقط مع أي جدول مشتق آخر."""
+    clean = text_clean.coerce_text_frame(pd.DataFrame({'a': ['1', '2'], 'b': ['x', None]}), 'reports')
+    cases = {
+        'coerce output': (clean, True),
+        'copy_frame': (text_clean.copy_frame(clean), True),
+        'carry(row filter)': (text_clean.carry(clean, clean[clean['a'] == '1']), True),
+        'plain copy': (clean.copy(), False),
+        'reindex': (clean.reindex(columns=['a', 'b', 'c']), False),
+        'concat': (pd.concat([clean, clean.rename(columns={'b': 'c'})]), False),
+        'other mode': (clean, 'trader'),
+    }
+    bad = []
+    for name, (df, expected) in cases.items():
+        mode = expected if isinstance(expected, str) else 'reports'
+        if text_clean.is_clean(df, mode) != (expected is True):
+            bad.append(('reports', 'marker', name, expected, not expected, ''))
+    return bad
+
+
+def _bench() -> None:
+    rng = np.random.default_rng(3)
+    n = int(os.environ.get('BENCH_ROWS', '300000'))
+    df = pd.DataFrame({
+        'رقم العميل': rng.integers(0, 20000, n).astype(str),
+        'مسلسل': [f'{x:015d}' for x in rng.integers(0, 10 ** 12, n)],
+        'كمية': [f'{x / 4:.2f}' for x in rng.integers(0, 4000, n)],
+        'اسم': np.array(['مخبز النور', 'مخبز الامل', 'nan', '-', ''], dtype=object)[rng.integers(0, 5, n)],
+    })
+    for mode, legacy in LEGACY.items():
+        t0 = time.perf_counter()
+        for c in df.columns:
+            df[c].map(legacy)
+        t_old = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        text_clean.coerce_text_frame(df, mode)
+        t_new = time.perf_counter() - t0
+        print(f'{mode:<8} {n} rows x {df.shape[1]} cols   per-cell {t_old:6.2f} s   column engine {t_new:6.2f} s')
+
+
+def main() -> int:
+    bad = _run_hypothesis() if given is not None else _run_random()
+    bad += check_marker()
+    for b in bad[:20]:
+        print('MISMATCH mode=%s dtype=%s value=%s legacy=%r engine=%r scalar=%r' % b)
+    if bad:
+        return 1
+    print(f'ok: {EXAMPLES} examples ({"hypothesis" if given is not None else "seeded random"})')
+    if '--bench' in sys.argv:
+        _bench()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import sys
+import os
+import time
+
+# Equivalence + timing check for the visit aggregate store used by the inquiry screen.
+# Run:  python devtools/test_visit_aggregates.py
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from routes import machine_reports as mr
+
+ROWS = int(os.environ.get('BENCH_ROWS', '20000'))
+
+
+def _synthetic_visits(n: int, with_date: bool = True) -> pd.DataFrame:
+    now = datetime.now()
+    rng = np.random.default_rng(7)
+    days = rng.integers(0, 400, n)
+    types = ['مخابز', 'تموين', 'استبدال']
+    df = pd.DataFrame({
+        'رقم العميل': [str(100 + (i % 700)) for i in range(n)],
+        'اسم العميل': [f'مخبز {"أحمد" if i % 3 else "احمد"} {i % 700}' for i in range(n)],
+        'مسلسل': [f'SN{(i * 7) % 900:05d}' for i in range(n)],
+        'النوع': [types[i % 3] for i in range(n)],
+        '_الفترة': [f'{now.year}-{now.month:02d}' if i % 4 else 'other' for i in range(n)],
+    })
+    if with_date:
+        base = pd.Timestamp(now.year, now.month, 1) + pd.Timedelta(days=20)
+        dates = (base - pd.to_timedelta(days, unit='D') + pd.to_timedelta(rng.integers(0, 86400, n), unit='s'))
+        # صيغة يوم/شهر: التحليل بـ dayfirst لا يتغير بتغير أول صف في المجموعة المطابقة
+        df['التاريخ'] = [d.strftime('%d/%m/%Y %H:%M:%S') if i % 50 else 'غير معروف' for i, d in enumerate(dates)]
+    return df
+
+
+def _legacy(visit_history_df, meta, code, name, category, serials, visit_period):
+    """المسار القديم (أقنعة على كامل سجل الزيارات + _fetch_visit_data) للمقارنة فقط."""
+    dfv = mr._standardize_visit_df(visit_history_df)
+    code_norm = mr._norm_key_text(str(code)) if mr._textify(code) != '' else None
+    name_norm = mr._norm_key_text(str(name)) if mr._textify(name) != '' else None
+    serials_norm = set(mr._norm_key_text(s) for s in serials)
+    pre = dfv
+    type_norm = mr._norm_key_text(str(mr.CATEGORIES.get(category, category)))
+    type_mask = None
+    if 'النوع' in pre.columns:
+        type_mask = (pre['النوع'].apply(mr._textify).apply(mr._norm_key_text) == type_norm)
+        pre = pre[type_mask]
+    mask = None
+    if 'رقم العميل' in dfv.columns and code_norm is not None:
+        mask = (dfv['رقم العميل'].apply(mr._textify).apply(mr._norm_key_text) == code_norm)
+    if 'اسم العميل' in dfv.columns and name_norm is not None:
+        nm = (dfv['اسم العميل'].apply(mr._textify).apply(mr._norm_key_text) == name_norm)
+        mask = (mask & nm) if mask is not None else nm
+    if mask is not None:
+        dfv = dfv[mask]
+        if type_mask is not None:
+            dfv = dfv[type_mask.reindex(dfv.index)]
+    if dfv.empty and ('رقم العميل' in pre.columns or 'اسم العميل' in pre.columns):
+        union = None
+        if 'رقم العميل' in pre.columns and code_norm is not None:
+            union = (pre['رقم العميل'].apply(mr._textify).apply(mr._norm_key_text) == code_norm)
+        if 'اسم العميل' in pre.columns and name_norm is not None:
+            nm = (pre['اسم العميل'].apply(mr._textify).apply(mr._norm_key_text) == name_norm)
+            union = (union | nm) if union is not None else nm
+        if union is not None:
+            dfv = pre[union]
+    if dfv.empty and 'مسلسل' in pre.columns and serials_norm:
+        dfv = pre[pre['مسلسل'].apply(mr._textify).apply(mr._norm_key_text).isin(serials_norm)]
+    if dfv.empty:
+        return 0, {'current_month': {'total': 0, 'details': {}}, 'current_year': {'total': 0, 'details': {}}}
+    return len(dfv), mr._fetch_visit_data(code, dfv, visit_period, meta.get('month_label'), meta.get('year_label'))
+
+
+def _new(agg, code, name, category, serials, visit_period):
+    code_norm = mr._norm_key_text(str(code)) if mr._textify(code) != '' else None
+    name_norm = mr._norm_key_text(str(name)) if mr._textify(name) != '' else None
+    serials_norm = set(mr._norm_key_text(s) for s in serials)
+    type_norm = mr._norm_key_text(str(mr.CATEGORIES.get(category, category)))
+    rows, _ = mr._visit_match_rows(agg, code_norm, name_norm, type_norm, serials_norm)
+    meta = agg['meta']
+    return int(rows.size), mr._visit_counts(agg, rows, visit_period, meta.get('month_label'), meta.get('year_label'))
+
+
+def main() -> int:
+    now = datetime.now()
+    scenarios = [
+        ('recent_program', {'source': 'recent_program', 'month_label': None, 'year_label': None}, True),
+        ('month', {'source': 'month', 'month_label': f'{now.year}-{now.month:02d}', 'year_label': None}, True),
+        ('year', {'source': 'year', 'month_label': None, 'year_label': str(now.year)}, True),
+        ('month', {'source': 'month', 'month_label': None, 'year_label': None}, False),
+    ]
+    # (رقم، اسم، مسلسلات): تطابق كامل / اسم مختلف (اتحاد) / غير موجود (مسلسلات) / لا شيء
+    lookups = [('105', 'مخبز احمد 5', []), ('105', 'اسم آخر', []), ('99999', 'غير موجود', ['SN00035', 'SN00042']),
+               ('99999', '', []), ('', 'مخبز أحمد 10', [])]
+    failures = 0
+    for visit_period, meta, with_date in scenarios:
+        df = _synthetic_visits(ROWS, with_date)
+        t0 = time.perf_counter()
+        agg = mr._build_visit_aggregates(df, meta)
+        t_build = time.perf_counter() - t0
+        t_old = t_new = 0.0
+        for category in ('bakeries', 'ration'):
+            for code, name, serials in lookups:
+                t0 = time.perf_counter()
+                old = _legacy(df, meta, code, name, category, serials, visit_period)
+                t_old += time.perf_counter() - t0
+                t0 = time.perf_counter()
+                new = _new(agg, code, name, category, serials, visit_period)
+                t_new += time.perf_counter() - t0
+                if repr(old) != repr(new):
+                    failures += 1
+                    print('MISMATCH', visit_period, with_date, category, code, name, '\n  old', repr(old)[:300], '\n  new', repr(new)[:300])
+        print(f'{visit_period:<15} date={with_date!s:<5} build {t_build * 1000:8.1f} ms   '
+              f'legacy {t_old * 1000 / 10:8.1f} ms/lookup   aggregate {t_new * 1000 / 10:6.2f} ms/lookup')
+    print('ok' if not failures else f'{failures} mismatches')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -33,6 +33,80 @@ class ReportState(db.Model):
         return f'<ReportState {self.category}/{self.user_id}>'
 
 
+# مخزن البيانات العمودي: بديل data_json لتخزين جداول التقارير الكبيرة
+# رأس المجموعة (الأعمدة وعدد الصفوف) في report_dataset، والقيم في أجزاء عمودية مضغوطة
+class ReportDataset(db.Model):
+    __tablename__ = "report_dataset"
+
+    id = db.Column(db.Integer, primary_key=True)
+    state_id = db.Column(db.Integer, db.ForeignKey("report_state.id", ondelete="CASCADE"), nullable=False, unique=True, index=True)
+
+    # أسماء الأعمدة بالترتيب (JSON list)
+    columns_json = db.Column(db.Text, nullable=False, default="[]")
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    # عدد الصفوف في كل جزء (chunk)
+    chunk_rows = db.Column(db.Integer, nullable=False, default=0)
+    # صيغة ترميز الأجزاء (قابلة للتوسعة): zjson = JSON مضغوط zlib لكل عمود
+    codec = db.Column(db.String(20), nullable=False, default="zjson")
+    # دالة التنظيف التي طُبقت قبل الحفظ: reports | trader | raw
+    cleaner = db.Column(db.String(20), nullable=False, default="raw")
+    # أعمدة الظل المُطبّعة وعمود المصدر لكل منها: {"__norm_code": "رقم العميل", ...}
+    shadow_json = db.Column(db.Text, nullable=True)
+    # عدد الخلايا غير الفارغة لكل عمود عند الحفظ: {"رقم العميل": 120000, "ملاحظات": 0, ...} (utils/column_profile)
+    profile_json = db.Column(db.Text, nullable=True)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<ReportDataset state={self.state_id} rows={self.row_count}>'
+
+
+class ReportDatasetChunk(db.Model):
+    __tablename__ = "report_dataset_chunk"
+
+    id = db.Column(db.Integer, primary_key=True)
+    dataset_id = db.Column(db.Integer, db.ForeignKey("report_dataset.id", ondelete="CASCADE"), nullable=False, index=True)
+    chunk_no = db.Column(db.Integer, nullable=False)
+    column_pos = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('dataset_id', 'chunk_no', 'column_pos', name='_dataset_chunk_col_uc'),
+    )
+
+
+# مهام الاستيراد في الخلفية: المرحلة الحالية وعدد الصفوف والنتيجة (انظر utils/import_jobs.py)
+class ImportJob(db.Model):
+    __tablename__ = "jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # نوع المهمة: reports | trader_primary | trader_frequent
+    kind = db.Column(db.String(30), nullable=False, index=True)
+    # القسم أو مفتاح الحالة المستهدف (bakeries، trader_frequent:2024-01 ...)
+    target = db.Column(db.String(100), nullable=False, default="")
+    user_id = db.Column(db.Integer, nullable=True, index=True)
+
+    # queued | running | done | failed
+    status = db.Column(db.String(20), nullable=False, default="queued", index=True)
+    # read | merge | store | index
+    stage = db.Column(db.String(20), nullable=True)
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)
+
+    # رسالة النتيجة للمستخدم ومستواها (success | warning | danger) ورابط صفحة النتائج
+    message = db.Column(db.Text, nullable=True)
+    level = db.Column(db.String(20), nullable=True)
+    result_url = db.Column(db.String(500), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<ImportJob {self.id} {self.kind}/{self.target} {self.status}:{self.stage}>'
+
+
 # نموذج جديد: تذاكر الخدمات المرتبطة بالمسلسلات وتفاصيل الماكينات
 class ServiceTicket(db.Model):
     __tablename__ = "service_tickets"
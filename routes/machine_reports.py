@@ -1,17 +1,35 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, current_app, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
 from flask_login import login_required, current_user
 from models import db
-from models_reports import ReportState, ServiceTicket
+from models_reports import ReportState, ReportDataset, ServiceTicket, ImportJob
 from utils.decorators import role_required, permission_required
+from utils import dataset_store
+from utils.frame_cache import FRAME_CACHE, estimate_bytes
+from utils.filter_cache import FILTER_CACHE, subset_positions
+from utils.export_cache import EXPORT_CACHE
+from utils import search_index
+from utils import shared_index
+from utils import norm_keys
+from utils import text_clean
+from utils import column_profile
+from utils import table_export
+from utils import stream_ingest
+from utils import import_pool
+from utils import import_jobs
+from utils.inquiry_index import PostingIndex, SubstringIndex, affix_keys, key_lengths, split_tokens, lookup as _index_lookup
 import pandas as pd
 import json
 import io
 import re
-from decimal import Decimal
 import numpy as np 
 from io import BytesIO 
 from datetime import datetime 
-from time import time
+from time import time, perf_counter
+import itertools
+import threading
+import os
+import uuid
+from collections import OrderedDict
 
 machine_reports_bp = Blueprint('machine_reports_bp', __name__)
 
@@ -72,7 +90,7 @@ CUSTOMER_DETAIL_COLS = [
 # ==================== (1) الدوال المساعدة العامة (Utils, Coercion, State) ====================
 
 # ========== تحويل كل القيم لنص + إزالة الوقت + تنظيف nan/none ==========
-_EMPTY_TOKENS = {"nan", "none", "null", "na", "n/a", "nat", "-", "—"}
+_EMPTY_TOKENS = text_clean.EMPTY_TOKENS
 _DATE_RE_1 = re.compile(r"^(\d{4}[-/]\d{1,2}[-/]\d{1,2})[ T]\d{1,2}:\d{2}(?::\d{2})?$")
 _DATE_RE_2 = re.compile(r"^(\d{1,2}[-/]\d{1,2}[-/]\d{4})[ T]\d{1,2}:\d{2}(?::\d{2})?$")
 
@@ -84,74 +102,30 @@ def _strip_time_from_date(txt: str) -> str:
     return txt
 
 def _textify(v) -> str:
-    """تحويل القيمة إلى نص نظيف مع معالجة الأرقام العشرية والأسية بتبسيط."""
-    if v is None: return ""
-    
-    if isinstance(v, (float, np.float64)):
-        if np.isinf(v):
-            return "" 
-        if np.isnan(v):
-            return "" 
-    
-    t = str(v).strip()
-    if t == "" or t.lower() in _EMPTY_TOKENS: return ""
-    
-    t = t.replace(",", "")
-    # لا نقوم بإزالة وقت التاريخ بعد الآن لضمان ظهور وقت الزيارة في الواجهة
-
-    # 💡 FIX: تجنب تحويل أرقام التعريف الطويلة (مثل المسلسلات أو الشرائح) إلى float لتجنب فقدان الدقة
-    # إذا كان النص يتكون من أرقام فقط وطوله أكبر من 12، فاحفظه كنص (String).
-    if t.isdigit() and len(t) > 12: 
-        return t 
-        
-    try:
-        float_val = float(t)
-        
-        if np.isinf(float_val) or np.isnan(float_val):
-            return ""
-            
-        if float_val == int(float_val):
-            return str(int(float_val))
-        
-        # محاولة التعامل مع الأرقام العشرية الكبيرة بطريقة Decimal
-        try:
-             # تحويلها إلى قيمة صحيحة مقربة (إن أمكن) لتجنب الأصفار العشرية غير الضرورية
-             # أو تركها كقيمة عشرية مبسطة إن لم يكن رقماً صحيحاً
-             return str(float_val) 
-        except Exception:
-             pass
-
-    except ValueError:
-        pass 
-
-    return t
+    """تحويل القيمة إلى نص نظيف مع معالجة الأرقام العشرية والأسية بتبسيط (انظر utils/text_clean.py)."""
+    return text_clean.textify_reports(v)
 
 
 def _coerce_text_df(df: pd.DataFrame) -> pd.DataFrame:
     # 💡 تم التعديل هنا: إضافة تحقق صريح باستخدام isinstance لحل مشكلة 'function' object has no attribute 'empty'
     if df is None or not isinstance(df, pd.DataFrame) or df.empty: 
         return pd.DataFrame()
-        
-    out = df.copy()
-    
+
     # 1. تنظيف أسماء الأعمدة
-    out.columns = [str(c).strip().replace("\n"," ").replace("\r"," ") for c in out.columns]
-    
-    # 2. ضمان تفرد أسماء الأعمدة (قد تكون الأعمدة المكررة تسبب مشاكل)
-    seen = set()
-    new_cols = []
-    for col in out.columns:
-        if col in seen:
-            continue
-        seen.add(col)
-        new_cols.append(col)
-        
-    out = out[new_cols] 
-    
-    # 3. تطبيق _textify
-    for c in out.columns:
-        out[c] = out[c].map(_textify)
-        
+    cols = text_clean.clean_columns(df.columns)
+
+    # جدول ناتج عن نفس التنظيف (أو نسخة منه) بأسماء نظيفة وفريدة: لا حاجة لتمريرة أخرى
+    if text_clean.is_clean(df, "reports") and cols == list(df.columns) and len(set(cols)) == len(cols):
+        return df
+
+    # 2. الأسماء المكررة بعد التنظيف: نفس اختيار الأعمدة السابق (out[أسماء فريدة])
+    if len(set(cols)) != len(cols):
+        df = df.set_axis(cols, axis=1)[list(dict.fromkeys(cols))]
+        cols = list(df.columns)
+
+    # 3. تحويل كل الأعمدة إلى نص (محرك عمودي بنفس نتيجة _textify)
+    out = text_clean.coerce_text_frame(df, "reports")
+    out.columns = cols
     return out
 
 # ========== State (الحالة) ==========
@@ -171,6 +145,74 @@ def _json_to_df(js: str) -> pd.DataFrame:
     df = pd.DataFrame(json.loads(js))
     return _coerce_text_df(df)
 
+# اسم دالة التنظيف المسجّل مع البيانات في المخزن العمودي (انظر utils/dataset_store.py)
+_STORE_CLEANER = "reports"
+
+def _row_has_data(row) -> bool:
+    """هل يحتوي سجل الحالة على بيانات (في المخزن العمودي أو data_json القديم)."""
+    return dataset_store.has_data(row)
+
+def _decode_row(row) -> pd.DataFrame:
+    """فك ترميز بيانات السجل: المخزن العمودي أولاً (بدون إعادة تنظيف إذا حُفظ بنفس دالة التنظيف)، ثم data_json القديم."""
+    df, cleaner = dataset_store.load_frame(row)
+    if df is None:
+        return _json_to_df(row.data_json)
+    # البيانات المحفوظة بنفس دالة التنظيف نظيفة أصلاً: تُعلّم حتى لا تُعاد تمريرة التنظيف لاحقاً
+    return text_clean.mark_clean(df, "reports") if cleaner == _STORE_CLEANER else _coerce_text_df(df)
+
+def _row_to_df(row) -> pd.DataFrame:
+    """تحميل بيانات سجل الحالة كـ DataFrame نظيف (عبر الكاش المشترك FRAME_CACHE)."""
+    if row is None:
+        return pd.DataFrame()
+    return FRAME_CACHE.get_or_load(row, lambda: _decode_row(row), variant=_STORE_CLEANER)
+
+def _row_to_mapped_df(row, mapping: dict, copy: bool = True) -> pd.DataFrame:
+    """بيانات السجل بعد تطبيق المابنج (مخزنة في الكاش حسب توقيع المابنج).
+    copy=False: الإطار المخزن نفسه للقراءة فقط (لا يُعدّل)."""
+    if row is None:
+        return pd.DataFrame()
+    variant = f"{_STORE_CLEANER}|{_mapping_signature(mapping)}"
+    return FRAME_CACHE.get_or_load(row, lambda: _apply_mapping(_row_to_df(row), mapping), variant=variant, copy=copy)
+
+def _store_df(row, df: pd.DataFrame) -> int:
+    """حفظ DataFrame لسجل الحالة في المخزن العمودي (بدون commit) مع أعمدة الظل المُطبّعة."""
+    return _store_frames(row, [df])
+
+def _store_frames(row, frames) -> int:
+    """مثل _store_df لجدول يصل على دفعات (استيراد متتابع): كل دفعة تُنظف وتُحفظ ثم تُترك. يعيد عدد الصفوف."""
+    total = dataset_store.save_frames(row, (_coerce_text_df(df) for df in frames), cleaner=_STORE_CLEANER,
+                                      shadow=lambda part: norm_keys.build_shadow(part, _textify))
+    FRAME_CACHE.invalidate(row.category)
+    FILTER_CACHE.invalidate(row.category)
+    search_index.SEARCH_INDEX_CACHE.invalidate(row.category)
+    EXPORT_CACHE.invalidate(row.category)
+    return total
+
+def _row_text_index(row, mapping: dict, df: pd.DataFrame):
+    """فهرس البحث في كل الأعمدة لبيانات السجل بعد المابنج (df = _row_to_mapped_df لنفس السجل والمابنج)."""
+    variant = f"{_STORE_CLEANER}|{_mapping_signature(mapping)}"
+    return search_index.SEARCH_INDEX_CACHE.get_or_schedule(row, lambda: search_index.build(df, norm_keys.norm_key_array),
+                                                        variant=variant)
+
+def _row_profile(row, mapping: dict, df: pd.DataFrame) -> dict | None:
+    """عدد الخلايا غير الفارغة لكل عمود من df = _row_to_mapped_df(row, mapping) كما حُسب عند الحفظ،
+    أو None (بيانات أقدم من الملف، أو أعيد تنظيفها عند التحميل فتغيرت قيمها)."""
+    counts, cleaner = dataset_store.load_profile(row)
+    if counts is None or cleaner != _STORE_CLEANER or not text_clean.is_clean(df, _STORE_CLEANER):
+        return None
+    return column_profile.mapped_counts(counts, (mapping or {}).get("rename"))
+
+def _row_shadow(row, mapping: dict | None = None) -> pd.DataFrame:
+    """أعمدة الظل المُطبّعة للسجل بأسماء الأعمدة بعد المابنج (فارغ للبيانات المحفوظة قبل أعمدة الظل)."""
+    if row is None:
+        return pd.DataFrame()
+    rename = (mapping or {}).get("rename") or {}
+
+    def _load():
+        shadow, sources = dataset_store.load_shadow(row)
+        return pd.DataFrame(norm_keys.mapped_shadow(shadow, sources, rename))
+    return FRAME_CACHE.get_or_load(row, _load, variant=f"shadow|{_mapping_signature(mapping or {})}")
+
 def _load_state(category: str):
     """
     تحميل سجل حالة التقرير للفئة المحددة.
@@ -193,25 +235,59 @@ def _load_state(category: str):
     except Exception:
         return None
 
-def _save_state(category: str, df: pd.DataFrame = None, mapping: dict = None):
+def _load_state_meta(category: str):
+    """نسخة خفيفة من _load_state لفحص صلاحية الكاش: تقرأ الإصدار (id/updated_at) والمابنج فقط بدون أعمدة البيانات.
+    تعيد dict {id, updated_at, mapping_json, has_data} أو None.
+    """
+    _ensure_tables()
+    try:
+        base = db.session.query(ReportState.id, ReportState.updated_at, ReportState.mapping_json,
+                                ReportState.data_json.isnot(None).label('has_legacy'))
+        meta = None
+        if current_user.is_authenticated:
+            meta = base.filter(ReportState.category == category, ReportState.user_id == current_user.id).first()
+        if meta is None:
+            meta = base.filter(ReportState.category == category).order_by(ReportState.id.desc()).first()
+        if meta is None:
+            return None
+        has_data = bool(meta.has_legacy) or (
+            db.session.query(ReportDataset.id).filter(ReportDataset.state_id == meta.id).first() is not None)
+        return {'id': meta.id, 'updated_at': meta.updated_at, 'mapping_json': meta.mapping_json, 'has_data': has_data}
+    except Exception:
+        return None
+
+def _save_state(category: str, df: pd.DataFrame = None, mapping: dict = None, frames=None, user_id=None):
     """
     حفظ سجل حالة التقرير الخاص بالمستخدم الحالي والفئة المحددة.
+    frames: بديل df لجدول يصل على دفعات (يُحفظ دفعة بدفعة). يعيد عدد الصفوف المحفوظة (أو None).
+    user_id: صاحب الحالة عند الحفظ خارج الطلب (مهام الاستيراد في الخلفية)، والافتراضي المستخدم الحالي.
     """
-    if not current_user.is_authenticated:
-        return
-        
+    if user_id is None:
+        if not current_user.is_authenticated:
+            return None
+        user_id = current_user.id
+    total = None
+
     # 💡 تم التعديل: يستخدم user_id
-    row = ReportState.query.filter_by(category=category, user_id=current_user.id).first()
+    row = ReportState.query.filter_by(category=category, user_id=user_id).first()
     if not row:
-        row = ReportState(category=category, user_id=current_user.id)
+        row = ReportState(category=category, user_id=user_id)
         db.session.add(row)
         
-    if df is not None:
-        row.data_json = _df_to_json(df)
+    if frames is not None:
+        try:
+            total = _store_frames(row, frames)
+        except Exception:
+            db.session.rollback()
+            raise
+    elif df is not None:
+        total = _store_df(row, df)
     if mapping is not None:
         row.mapping_json = json.dumps(mapping, ensure_ascii=False)
         
     db.session.commit()
+    FRAME_CACHE.invalidate(category)
+    return total
 
 def _apply_mapping(df: pd.DataFrame, mapping: dict) -> pd.DataFrame:
     """تطبيق إعادة تسمية وترتيب الأعمدة"""
@@ -219,32 +295,32 @@ def _apply_mapping(df: pd.DataFrame, mapping: dict) -> pd.DataFrame:
         return df
     rename = mapping.get("rename") or {}
     order  = [c for c in (mapping.get("order") or []) if c]
-    out = df.copy()
-    if rename: out = out.rename(columns=rename)
+    # نسخة واحدة فقط (إعادة التسمية أو اختيار الأعمدة ينسخان أصلاً) مع الإبقاء على علامة النظافة
+    out = df.rename(columns=rename) if rename else df
     if order:
         front = [c for c in order if c in out.columns]
         # إظهار الأعمدة المحفوظة فقط وإخفاء الباقي من العرض/التصدير
         out = out[front] if front else out
+    if out is df:
+        out = text_clean.copy_frame(df, "apply_mapping")
+    else:
+        text_clean.count_copy("apply_mapping")
+        text_clean.carry(df, out)
     return _coerce_text_df(out)
 
-def _drop_empty_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """إزالة الأعمدة التي لا تحتوي على أي بيانات"""
+def _drop_empty_columns(df: pd.DataFrame, counts: dict | None = None) -> pd.DataFrame:
+    """إزالة الأعمدة التي لا تحتوي على أي بيانات.
+    counts: عدد الخلايا غير الفارغة لكل عمود إن كان معروفاً لكل df (_row_profile) فلا تُمسح هذه الأعمدة."""
     if df is None or df.empty: return df
-    
-    def _is_empty_series(s: pd.Series) -> bool:
-        if not isinstance(s, pd.Series):
-             return s.empty if hasattr(s, 'empty') else True
-             
-        vals = s.fillna("").astype(str).str.strip().str.lower()
-        return ((vals == "") | (vals.isin(_EMPTY_TOKENS))).all()
-    
-    keep = [c for c in df.columns if not _is_empty_series(df[c])]
-    return df[keep] if keep else df.iloc[:, 0:0]
+    keep = column_profile.nonempty_columns(df, counts)
+    return text_clean.carry(df, df[keep] if keep else df.iloc[:, 0:0])
 
-def _filter_dataframe(df: pd.DataFrame, query: str, search_cols: list[str] | None = None) -> pd.DataFrame:
+def _filter_dataframe(df: pd.DataFrame, query: str, search_cols: list[str] | None = None, text_index=None) -> pd.DataFrame:
     """تصفية سريعة مع توحيد عربي، بأقل عدد من العمليات.
     - تجمع نص الصف مرة واحدة عبر الأعمدة المستهدفة ثم تطبق contains.
     - تقلل التكلفة من O(rows * cols) إلى O(rows).
+    - text_index: دالة تعيد فهرس كل الأعمدة لهذا الجدول (_row_text_index)؛ البحث في كل الأعمدة يمر به
+      فتتناسب التكلفة مع عدد النتائج لا حجم الجدول.
     """
     if not query:
         return df
@@ -262,6 +338,20 @@ def _filter_dataframe(df: pd.DataFrame, query: str, search_cols: list[str] | Non
     if not cols_to_search:
         return pd.DataFrame(columns=df.columns)
 
+    # المسار المفهرس (كل الأعمدة): نفس نتيجة contains على نص الصف المجمّع بمسافات
+    if text_index is not None and cols_to_search == list(df.columns):
+        def _verify(cand, q):
+            rows_text = df.iloc[cand].fillna("").astype(str).to_numpy(dtype=object)
+            all_text = pd.Series([" ".join(r) for r in rows_text.tolist()], dtype=object)
+            return _norm_key_series(all_text).str.lower().str.contains(q, regex=False).to_numpy()
+        try:
+            pos = search_index.search(text_index(), q, sep=" ", verify=_verify)
+        except Exception:
+            current_app.logger.exception("[Search] text index failed; falling back to a full scan")
+            pos = None
+        if pos is not None:
+            return text_clean.carry(df, df.iloc[pos])
+
     # المسار السريع: تجميع نص الصف مرة واحدة ثم التوحيد والبحث
     try:
         # تحويل إلى نص وتعبئة الفراغات ثم تجميع الصفوف
@@ -269,17 +359,17 @@ def _filter_dataframe(df: pd.DataFrame, query: str, search_cols: list[str] | Non
         # تجميع نص الصف مرة واحدة
         all_text = rows_text.apply(lambda r: " ".join(r.values.tolist()), axis=1)
         # توحيد عربي + تصغير ثم contains
-        all_text_norm = all_text.map(_norm_key_text).str.lower()
+        all_text_norm = _norm_key_series(all_text).str.lower()
         mask = all_text_norm.str.contains(q, na=False)
-        return df[mask]
+        return text_clean.carry(df, df[mask])
     except Exception:
         # مسار احتياطي: نفس المنهج السابق عمودًا بعمود
         try:
             df_text_normalized = df[cols_to_search].astype(str).apply(
-                lambda col: col.map(lambda v: _norm_key_text(v).lower())
+                lambda col: _norm_key_series(col).str.lower()
             )
             mask = df_text_normalized.apply(lambda col: col.str.contains(q, na=False))
-            return df[mask.any(axis=1)]
+            return text_clean.carry(df, df[mask.any(axis=1)])
         except Exception:
             # في حال حدوث خطأ غير متوقع، أعد الإطار كما هو لتجنب كسر الواجهة
             return df
@@ -387,23 +477,25 @@ def _pick_machine_keys(df1_cols: list, df2_cols: list) -> list[str]:
     return [] # لا يوجد مفتاح ماكينة مشترك يمكن استخدامه
 
 
-def _group_search_results(filtered_df: pd.DataFrame, category: str) -> list[dict]:
-    """تجميع سجلات DataFrame"""
-    if filtered_df.empty: return []
-
+def _entity_group_ids(filtered_df: pd.DataFrame, category: str) -> tuple[list, np.ndarray]:
+    """مفاتيح الكيان الصالحة + رقم الكيان لكل صف (بترتيب groupby)."""
     group_keys = _get_entity_grouping_keys(filtered_df, category)
-    
     valid_group_keys = [k for k in group_keys if k in filtered_df.columns]
-    
     if len(valid_group_keys) < 2:
         # إذا لم يتم العثور على مفاتيح كيان ثنائية (رقم واسم)، نعتبر كل صف كياناً مستقلاً
-        grouped = [(i, filtered_df.iloc[[i]]) for i in range(len(filtered_df))]
-        valid_group_keys = []
-    else:
-        grouped = filtered_df.groupby(valid_group_keys, dropna=False).__iter__()
+        return [], np.arange(len(filtered_df))
+    return valid_group_keys, filtered_df.groupby(valid_group_keys, dropna=False).ngroup().to_numpy()
+
+
+def _group_search_results(filtered_df: pd.DataFrame, category: str) -> list[dict]:
+    """تجميع سجلات DataFrame في كيانات (بيانات مشتركة + تفاصيل ماكينات).
+    التنفيذ عمودي: كل عمود يُحوّل لنص مرة واحدة، وتُحسم البدائل من MACHINE_DATA_SOURCE_MAPPING على مستوى الإطار.
+    """
+    if filtered_df.empty: return []
+
+    valid_group_keys, group_ids = _entity_group_ids(filtered_df, category)
+    n = len(filtered_df)
 
-    result_list = []
-    
     EXCLUDE_FROM_COMMON = [
         # أعمدة المسلسلات
         *MACHINE_DETAIL_COLS, 
@@ -412,89 +504,148 @@ def _group_search_results(filtered_df: pd.DataFrame, category: str) -> list[dict
         'timestamp', 'report_data',
         'CS_1', 'CS_2', # يتم استبعادها لأنها أصبحت بدائل لـ شريحة 1 و شريحة 2
     ] 
-    
-    for _, group_df in grouped:
-        first_record = group_df.iloc[0].to_dict()
-        common_data = {}
-        
-        # استخراج البيانات المشتركة (تظهر مرة واحدة للكيان)
-        for col in group_df.columns:
-              if col in first_record and col not in EXCLUDE_FROM_COMMON:
-                  common_data[col] = first_record[col]
-
-        # 💡 FIX: منطق استخلاص الشرائح عبر كود الماكينة (رقم الماكينة)
-        # 1. إنشاء جدول بحث للشرائح بناءً على رقم الماكينة في المجموعة بأكملها
-        slice_lookup = {}
-        # تحديد اسم عمود "رقم الماكينة" الفعلي في بيانات العميل (Group_df)
-        actual_machine_code_col = next((c for c in MACHINE_DATA_SOURCE_MAPPING[MACHINE_CODE_COL] if c in group_df.columns), MACHINE_CODE_COL)
-
-        for _, r in group_df.iterrows():
-            machine_code = _textify(r.get(actual_machine_code_col))
-            if machine_code:
-                row_slices = {}
-                for slice_col in SLICE_COLS:
-                    value = r.get(slice_col) # 1. تحقق من الاسم الأساسي
-                    
-                    # 2. تحقق من أسماء الأعمدة البديلة في نفس الصف
-                    if _textify(value) == '':
-                        for alt_col in MACHINE_DATA_SOURCE_MAPPING.get(slice_col, []):
-                            alt_value = r.get(alt_col)
-                            if _textify(alt_value) != '':
-                                value = alt_value
-                                break
-                                
-                    if _textify(value) != '':
-                         row_slices[slice_col] = value
-
-                # دمج النتائج: الأولوية للقيمة غير الفارغة المكتشفة أولاً
-                if machine_code not in slice_lookup:
-                     slice_lookup[machine_code] = row_slices
-                else:
-                     for k, v in row_slices.items():
-                          if _textify(v) != '':
-                               slice_lookup[machine_code][k] = v
 
+    # نص كل عمود (بعد _textify) يُحسب مرة واحدة؛ العمود غير الموجود = نصوص فارغة
+    text_cache: dict[str, np.ndarray] = {}
+    def _text(col: str) -> np.ndarray:
+        if col not in text_cache:
+            if col in filtered_df.columns:
+                text_cache[col] = np.array([_textify(v) for v in filtered_df[col].tolist()], dtype=object)
+            else:
+                text_cache[col] = np.full(n, '', dtype=object)
+        return text_cache[col]
+
+    def _first_non_empty(cols: list[str]) -> np.ndarray:
+        out = np.full(n, '', dtype=object)
+        for c in cols:
+            empty = out == ''
+            if not empty.any():
+                break
+            out[empty] = _text(c)[empty]
+        return out
+
+    # تحديد اسم عمود "رقم الماكينة" الفعلي
+    actual_machine_code_col = next((c for c in MACHINE_DATA_SOURCE_MAPPING[MACHINE_CODE_COL] if c in filtered_df.columns), MACHINE_CODE_COL)
+    machine_codes = _text(actual_machine_code_col)
+    has_code = machine_codes != ''
+
+    details = {}
+    for col in MACHINE_DETAIL_COLS:
+        # 1. القيمة الأساسية (القيمة الفارغة تُعامل كـ '-' وهو رمز فارغ)
+        if col in filtered_df.columns:
+            value = np.array([_textify(v or '-') for v in filtered_df[col].tolist()], dtype=object)
+        else:
+            value = np.full(n, _textify('-'), dtype=object)
+
+        # 2. منطق الشرائح: آخر قيمة غير فارغة لنفس رقم الماكينة داخل نفس الكيان
+        if col in SLICE_COLS:
+            slice_vals = _first_non_empty(MACHINE_DATA_SOURCE_MAPPING.get(col, [col]))
+            known = has_code & (slice_vals != '')
+            if known.any():
+                lookup = (pd.DataFrame({'g': group_ids[known], 'm': machine_codes[known], 'v': slice_vals[known]})
+                          .groupby(['g', 'm'], sort=False)['v'].last())
+                need = (value == '') & has_code
+                if need.any():
+                    keys = pd.MultiIndex.from_arrays([group_ids[need], machine_codes[need]])
+                    filled = lookup.reindex(keys).to_numpy(dtype=object)
+                    filled[pd.isna(filled)] = ''
+                    value[need] = filled
+
+        # 3. البحث في البدائل الأخرى (يشمل المسلسل ورقم الماكينة وغيرهما)
+        if col in MACHINE_DATA_SOURCE_MAPPING:
+            empty = value == ''
+            if empty.any():
+                value[empty] = _first_non_empty(MACHINE_DATA_SOURCE_MAPPING[col])[empty]
+
+        # 4. حفظ القيمة النهائية
+        value[value == ''] = '-'
+        details[col] = value
+
+    detail_records = pd.DataFrame(details, columns=MACHINE_DETAIL_COLS).to_dict('records')
+
+    # ترتيب الصفوف حسب الكيان مع الحفاظ على ترتيبها الأصلي داخل كل كيان
+    order = np.argsort(group_ids, kind='stable')
+    sorted_ids = group_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    bounds = np.r_[starts, n]
+
+    # استخراج البيانات المشتركة (تظهر مرة واحدة للكيان) من أول صف في كل كيان
+    common_cols = [c for c in filtered_df.columns if c not in EXCLUDE_FROM_COMMON]
+    common_records = filtered_df.iloc[order[starts]][common_cols].to_dict('records')
 
-        # استخراج تفاصيل الماكينات
-        machine_details = []
-        for _, row in group_df.iterrows():
-            detail = {}
-            
-            current_machine_code = _textify(row.get(actual_machine_code_col))
-            
-            for col in MACHINE_DETAIL_COLS:
-                # 1. القيمة الأساسية
-                value = row.get(col) or '-' 
-                
-                # 2. منطق الشرائح: البحث في جدول الـ Lookup إذا كانت القيمة مفقودة
-                if col in SLICE_COLS:
-                    # إذا كانت القيمة الأساسية فارغة، نبحث في جدول الـ Lookup المجمّع
-                    if _textify(value) == '' and current_machine_code and current_machine_code in slice_lookup:
-                        lookup_value = slice_lookup[current_machine_code].get(col)
-                        if _textify(lookup_value) != '':
-                             value = lookup_value
-                             
-                # 3. البحث في البدائل الأخرى (يشمل المسلسل ورقم الماكينة وغيرهما)
-                if _textify(value) == '' and col in MACHINE_DATA_SOURCE_MAPPING:
-                    for alt_col in MACHINE_DATA_SOURCE_MAPPING[col]:
-                        alt_value = row.get(alt_col)
-                        if _textify(alt_value) != '':
-                            value = alt_value
-                            break
-                            
-                # 4. حفظ القيمة النهائية
-                detail[col] = _textify(value) or '-'
-                
-            machine_details.append(detail)
-            
+    result_list = []
+    for i, common_data in enumerate(common_records):
+        rows = order[bounds[i]:bounds[i + 1]]
         result_list.append({
             'common_data': common_data,
-            'machine_details': machine_details,
+            'machine_details': [detail_records[r] for r in rows],
             'group_keys': valid_group_keys,
         })
 
     return result_list
 
+def _entity_row_positions(filtered_df: pd.DataFrame, category: str) -> list[np.ndarray]:
+    """مواضع صفوف كل كيان بنفس ترتيب _group_search_results، بدون بناء التفاصيل."""
+    if filtered_df.empty:
+        return []
+    _, group_ids = _entity_group_ids(filtered_df, category)
+    order = np.argsort(group_ids, kind='stable')
+    sorted_ids = group_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    return np.split(order, starts[1:])
+
+
+def _materialize_entity(filtered_df: pd.DataFrame, category: str, entity_rows: list[np.ndarray], index: int) -> dict:
+    """بناء الكيان رقم index فقط (common_data + machine_details) من صفوفه."""
+    # التجميع داخل صفوف كيان واحد يعطي نفس نتيجة التجميع الكامل لهذا الكيان
+    return _group_search_results(filtered_df.iloc[entity_rows[index]], category)[0]
+
+
+def _entity_keys(filtered_df: pd.DataFrame, category: str, entity_rows: list[np.ndarray]) -> list[list[str]]:
+    """قائمة خفيفة [رقم، اسم] لكل كيان (من أول صف فيه) لعرض العداد والتنقل."""
+    key_cols = [c for c in _get_entity_grouping_keys(filtered_df, category) if c in filtered_df.columns][:2]
+    if not entity_rows or not key_cols:
+        return []
+    first_rows = filtered_df.iloc[[int(rows[0]) for rows in entity_rows]]
+    values = [[_textify(v) for v in first_rows[c].tolist()] for c in key_cols]
+    return [list(k) for k in zip(*values)]
+
+
+# مؤشرات نتائج الاستعلام (cursor → الصفوف المطابقة وتقسيمها إلى كيانات) داخل العملية.
+# الإخلاء LRU حسب الحجم التقديري للإطارات (INQUIRY_CURSORS_MB لكل worker، الافتراضي 64).
+_ENTITY_CURSORS: OrderedDict = OrderedDict()
+try:
+    _ENTITY_CURSORS_MAX_BYTES = int(float(os.environ.get("INQUIRY_CURSORS_MB", 64)) * 1024 * 1024)
+except ValueError:
+    _ENTITY_CURSORS_MAX_BYTES = 64 * 1024 * 1024
+_ENTITY_CURSORS_BYTES = 0
+_ENTITY_CURSORS_LOCK = threading.Lock()
+
+
+def _put_entity_cursor(category: str, filtered_df: pd.DataFrame, entity_rows: list[np.ndarray]) -> str:
+    global _ENTITY_CURSORS_BYTES
+    cursor = uuid.uuid4().hex
+    nbytes = estimate_bytes(filtered_df) + sum(r.nbytes for r in entity_rows)
+    with _ENTITY_CURSORS_LOCK:
+        _ENTITY_CURSORS[cursor] = {'category': category, 'df': filtered_df, 'rows': entity_rows, 'nbytes': nbytes}
+        _ENTITY_CURSORS_BYTES += nbytes
+        # المؤشر الجديد يبقى دائماً (حتى لو تجاوز الحد وحده) حتى يعمل التنقل في نتيجته
+        while _ENTITY_CURSORS_BYTES > _ENTITY_CURSORS_MAX_BYTES and len(_ENTITY_CURSORS) > 1:
+            _, old = _ENTITY_CURSORS.popitem(last=False)
+            _ENTITY_CURSORS_BYTES -= old['nbytes']
+    return cursor
+
+
+def _get_entity_cursor(cursor: str, category: str) -> dict | None:
+    with _ENTITY_CURSORS_LOCK:
+        entry = _ENTITY_CURSORS.get(cursor or '')
+        if entry is not None:
+            _ENTITY_CURSORS.move_to_end(cursor)
+    if entry is None or entry['category'] != category:
+        return None
+    return entry
+
+
 # ==================== (3) الدوال المساعدة لجلب البيانات الخارجية - محاكاة مؤقتة ====================
 
 def _fetch_visit_data(customer_code: str, visit_history_df: pd.DataFrame, visit_period: str = 'month', month_label: str | None = None, year_label: str | None = None) -> dict:
@@ -749,11 +900,217 @@ def _standardize_visit_df(df: pd.DataFrame) -> pd.DataFrame:
     return _drop_empty_columns(out)
 
 
-def _inquiry_search(category: str, search_type: str, query: str, visit_period: str = 'recent_program') -> dict:
-    """تنفيذ البحث السريع داخل بيانات التقرير المخزنة وإعادة هيكلة النتائج.
-    تم تحسين الأداء باستخدام فهارس كاش في الذاكرة لمسار سريع، مع مسار احتياطي للتصفية التقليدية عند الحاجة.
+# ==================== مخزن تجميعات الزيارات ====================
+# يُبنى مرة واحدة لكل إصدار من بيانات الزيارات (trader_frequent:*)، ويحوّل الاستعلام من مسح كامل
+# لسجل الزيارات إلى بحث في القواميس + عدّ على الصفوف المطابقة فقط.
+_VISIT_AGG: dict = {'version': None, 'agg': None}
+_VISIT_AGG_LOCK = threading.Lock()
+
+_VISIT_KEY_COLS = {'code': 'رقم العميل', 'name': 'اسم العميل', 'serial': 'مسلسل', 'type': 'النوع'}
+
+
+def _visit_data_version() -> tuple:
+    """بصمة بيانات الزيارات من الميتاداتا فقط (المعرّف + آخر تحديث) + الشهر الحالي (يحدد مصدر الفترة)."""
+    now = datetime.now()
+    try:
+        rows = (db.session.query(ReportState.id, ReportState.category, ReportState.updated_at)
+                .filter(db.or_(ReportState.category.like('trader_frequent:%'),
+                               ReportState.category.like('visit_history%')))
+                .order_by(ReportState.id)
+                .all())
+        stamp = tuple((r.id, r.category, r.updated_at) for r in rows)
+    except Exception:
+        # عند تعذر قراءة الميتاداتا نرجع لسلوك الكاش الزمني
+        stamp = ('ttl', int(time() // _VISIT_CACHE_TTL_SEC))
+    return (now.year, now.month, stamp)
+
+
+def _visit_key_array(s: pd.Series) -> np.ndarray:
+    """_norm_key_text(_textify(v)) لكل صف، محسوبة مرة واحدة لكل قيمة مميزة."""
+    codes, uniques = pd.factorize(s.to_numpy(dtype=object))
+    norm = norm_keys.norm_key_array([_textify(v) for v in uniques] + [''])
+    return norm[codes]
+
+
+def _build_visit_aggregates(visit_history_df: pd.DataFrame, meta: dict) -> dict:
+    """توحيد سجل الزيارات مرة واحدة وبناء فهارس (رقم/اسم/مسلسل/نوع مُطبّع → مواضع الصفوف) + التواريخ المحللة."""
+    agg = {'meta': meta if isinstance(meta, dict) else {}, 'empty': visit_history_df is None or visit_history_df.empty,
+           'n': 0, 'cols': set(), 'flags': {}}
+    if agg['empty']:
+        return agg
+    dfv = _standardize_visit_df(visit_history_df)
+    n = int(dfv.shape[0])
+    positions = np.arange(n, dtype=np.int32)
+    agg.update({
+        'n': n,
+        'cols': set(dfv.columns),
+        'source_cols': list(visit_history_df.columns),
+        'std_cols': list(dfv.columns),
+        'source_rows': int(visit_history_df.shape[0]),
+    })
+    for name, col in _VISIT_KEY_COLS.items():
+        if col in dfv.columns:
+            keys = _visit_key_array(dfv[col])
+            agg[name] = PostingIndex.build(keys, positions)
+            agg[name + '_keys'] = keys
+    if 'مسلسل' in dfv.columns:
+        agg['serial_raw'] = dfv['مسلسل'].to_numpy(dtype=object)
+    if 'التاريخ' in dfv.columns:
+        try:
+            dates = pd.to_datetime(dfv['التاريخ'], errors='coerce', dayfirst=True)
+        except Exception:
+            dates = pd.to_datetime(dfv['التاريخ'].astype(str), errors='coerce', dayfirst=True)
+        agg['dt'] = pd.DatetimeIndex(dates)
+        agg['date_raw'] = dfv['التاريخ'].to_numpy(dtype=object)
+    if '_الفترة' in dfv.columns:
+        agg['period'] = dfv['_الفترة'].to_numpy(dtype=object)
+    return agg
+
+
+def _get_visit_aggregates(loader) -> dict:
+    """مخزن التجميعات للإصدار الحالي؛ يُعاد بناؤه (عبر loader → (df, meta)) فقط عند تغير بيانات الزيارات."""
+    global _VISIT_CACHE
+    version = _visit_data_version()
+    with _VISIT_AGG_LOCK:
+        if _VISIT_AGG['version'] == version and _VISIT_AGG['agg'] is not None:
+            return _VISIT_AGG['agg']
+        # البيانات تغيّرت: تجاهل كاش الإطار الزمني حتى لا نبني من نسخة قديمة
+        _VISIT_CACHE = {'df': None, 'meta': None, 'ts': 0}
+        visit_history_df, meta = loader()
+        agg = _build_visit_aggregates(visit_history_df, meta)
+        _VISIT_AGG.update({'version': version, 'agg': agg})
+        return agg
+
+
+def _visit_rows_eq(agg: dict, name: str, value: str) -> np.ndarray:
+    if value == '':
+        return np.flatnonzero(agg[name + '_keys'] == '').astype(np.int32)
+    return _index_lookup(agg, name, value)
+
+
+def _visit_match_rows(agg: dict, code_norm: str | None, name_norm: str | None, type_norm: str | None, serials_norm: set) -> tuple[np.ndarray, dict]:
+    """نفس منطق المطابقة السابق (رقم ∧ اسم ∧ نوع ← اتحاد رقم/اسم داخل النوع ← المسلسلات) عبر تقاطع قوائم المواضع."""
+    all_rows = np.arange(agg['n'], dtype=np.int32)
+    type_rows = _visit_rows_eq(agg, 'type', type_norm) if ('type' in agg and type_norm is not None) else None
+    pre_rows = type_rows if type_rows is not None else all_rows
+    code_rows = _visit_rows_eq(agg, 'code', code_norm) if ('code' in agg and code_norm is not None) else None
+    name_rows = _visit_rows_eq(agg, 'name', name_norm) if ('name' in agg and name_norm is not None) else None
+
+    if code_rows is None and name_rows is None:
+        rows = all_rows
+    else:
+        rows = code_rows if name_rows is None else (name_rows if code_rows is None else np.intersect1d(code_rows, name_rows))
+        if type_rows is not None:
+            rows = np.intersect1d(rows, type_rows)
+    # إن لم تُنتج نتيجة، جرّب اتحاد الشرطين
+    if not rows.size and ('code' in agg or 'name' in agg):
+        union = [r for r in (code_rows, name_rows) if r is not None]
+        if union:
+            rows = np.intersect1d(np.unique(np.concatenate(union)), pre_rows)
+    serial_rows = None
+    if 'serial' in agg and serials_norm:
+        parts = [_visit_rows_eq(agg, 'serial', s) for s in serials_norm]
+        serial_rows = np.intersect1d(np.unique(np.concatenate(parts)), pre_rows)
+    # وإن بقيت فارغة، اعتمد المسلسلات كحل أخير
+    if not rows.size and serial_rows is not None:
+        rows = serial_rows
+    counts = {
+        'type_rows': int(pre_rows.size),
+        'code_count': int(np.intersect1d(code_rows, pre_rows).size) if code_rows is not None else 0,
+        'serial_count': int(serial_rows.size) if serial_rows is not None else 0,
+    }
+    return rows, counts
+
+
+def _visit_period_flags(agg: dict, visit_period: str, month_label: str | None, year_label: str | None) -> tuple[np.ndarray, np.ndarray]:
+    """أقنعة (الشهر، السنة) لكل صف بنفس قواعد _fetch_visit_data؛ تُحسب مرة لكل فترة وتُحفظ في المخزن."""
+    key = (visit_period, month_label, year_label)
+    if key in agg['flags']:
+        return agg['flags'][key]
+    now = datetime.now()
+    target_year, target_month = now.year, now.month
+    if month_label and isinstance(month_label, str) and len(month_label) == 7:
+        try:
+            target_year, target_month = int(month_label.split('-')[0]), int(month_label.split('-')[1])
+        except Exception:
+            target_year, target_month = now.year, now.month
+    target_year_for_year = target_year
+    if year_label and isinstance(year_label, str) and len(year_label) == 4 and year_label.isdigit():
+        target_year_for_year = int(year_label)
+
+    dt = agg['dt']
+    year = np.asarray(dt.year == target_year)
+    month_mask = year & np.asarray(dt.month == target_month)
+    year_mask = np.asarray(dt.year == target_year_for_year)
+    by_label = ('period' in agg) and bool(month_label)
+    if visit_period == 'recent_program':
+        flags = (np.ones(agg['n'], dtype=bool), np.zeros(agg['n'], dtype=bool))
+    else:
+        in_month = (agg['period'] == month_label) if by_label else month_mask
+        flags = (np.asarray(in_month, dtype=bool), year_mask)
+    agg['flags'][key] = flags
+    return flags
+
+
+def _visit_counts(agg: dict, rows: np.ndarray, visit_period: str, month_label: str | None = None, year_label: str | None = None) -> dict:
+    """مكافئ _fetch_visit_data على صفوف مطابقة من مخزن التجميعات (العدّ على الصفوف المطابقة فقط)."""
+    if not rows.size:
+        return {'current_month': {'total': 0, 'details': {}}, 'current_year': {'total': 0, 'details': {}}}
+    has_serial = 'serial_raw' in agg
+
+    def _serial_counts(r: np.ndarray) -> dict:
+        if not has_serial:
+            return {}
+        s = pd.Series(agg['serial_raw'][r])
+        return s.groupby(s).size().to_dict()
+
+    if 'dt' not in agg:
+        # لا يوجد تاريخ: إجمالي واحد يُستخدم لكلا الفترتين
+        serial_counts = _serial_counts(rows)
+        return {
+            'current_month': {'total': int(rows.size), 'details': serial_counts},
+            'current_year':  {'total': int(rows.size), 'details': serial_counts}
+        }
+
+    in_month, in_year = _visit_period_flags(agg, visit_period, month_label, year_label)
+    month_rows = rows[in_month[rows]]
+    year_rows = rows[in_year[rows]]
+
+    latest_dt_str = ""
+    latest_serial = ""
+    latest_by_serial = {}
+    dt = agg['dt']
+    valid = month_rows[~np.asarray(dt[month_rows].isna())]
+    if valid.size:
+        # idxmax يعيد أول موضع للقيمة العظمى؛ argmax كذلك
+        i_latest = valid[int(np.argmax(dt[valid].asi8))]
+        latest_dt_str = str(agg['date_raw'][i_latest]).strip()
+        if has_serial:
+            latest_serial = str(agg['serial_raw'][i_latest]).strip()
+            try:
+                by_serial = pd.Series(dt[valid].asi8, index=valid).groupby(agg['serial_raw'][valid]).idxmax()
+                latest_by_serial = {s: str(agg['date_raw'][p]).strip() for s, p in by_serial.items()}
+            except Exception:
+                pass
+
+    return {
+        'current_month': {'total': int(month_rows.size), 'details': _serial_counts(month_rows)},
+        'current_year':  {'total': int(year_rows.size),  'details': _serial_counts(year_rows)},
+        'latest_datetime': latest_dt_str,
+        'latest_serial': latest_serial,
+        'latest_serial_times': latest_by_serial
+    }
+
+
+def _full_frame(df):
+    """الجدول كاملاً كـ DataFrame (الفهرس المشترك يفك الصفوف عند الطلب فقط)."""
+    return df.to_frame() if isinstance(df, shared_index.SharedFrame) else df
+
+
+def _inquiry_filter(category: str, search_type: str, query: str) -> tuple[pd.DataFrame | None, list, dict | None]:
+    """المرحلة الأولى من الاستعلام: إيجاد الصفوف المطابقة (بعد حذف الأعمدة الفارغة).
+    تعيد (filtered_df, أعمدة البيانات, None) أو (None, [], رد الخطأ الجاهز للواجهة).
     """
-    
     # استخدم الكاش المُفهرس بدلاً من إعادة بناء المابنج في كل طلب
     cached = _get_inquiry_cache(category)
     # تجنب تقييم الحقيقة الغامض لـ DataFrame عند استخدام "or"
@@ -762,7 +1119,7 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
     indexes = cached.get('indexes') or {}
 
     if mapped_df.empty:
-        return {'success': False, 'message': f'لا توجد بيانات مستوردة لقسم {CATEGORIES.get(category, category)}.', 'items': []}
+        return None, [], {'success': False, 'message': f'لا توجد بيانات مستوردة لقسم {CATEGORIES.get(category, category)}.', 'items': []}
     
     # 1. تحديد أعمدة البحث بناءً على النوع (Search_Type)
     target_cols = []
@@ -820,7 +1177,7 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
 
     # 2. تنفيذ البحث (مسار سريع عبر الفهارس + مسار احتياطي بالتصفية)
     q_norm = _norm_key_text(query).lower()
-    hit_indexes: set[int] = set()
+    hit_parts: list[np.ndarray] = []
     try:
         print(f"[inquiry_debug] start search_type={search_type} q_norm={q_norm} target_cols={target_cols} use_comp={use_comprehensive_search}")
     except Exception:
@@ -829,110 +1186,132 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
     if q_norm:
             if search_type == 'code':
                 # مطابقة دقيقة أولاً
-                exact_hits = indexes.get('code', {}).get(q_norm, [])
-                if exact_hits:
-                    hit_indexes.update(exact_hits)
+                exact_hits = _index_lookup(indexes, 'code', q_norm)
+                if len(exact_hits):
+                    hit_parts.append(exact_hits)
                     try:
                         print(f"[inquiry_debug] path=index_exact_code q={q_norm} hits={len(exact_hits)}")
                     except Exception:
                         pass
             elif search_type == 'serial':
                 # تفضيل المطابقة التامة؛ استخدام البادئات فقط إذا لم توجد مطابقة تامة
-                exact_hits = indexes.get('serial', {}).get(q_norm, [])
-                if exact_hits:
-                    hit_indexes.update(exact_hits)
+                exact_hits = _index_lookup(indexes, 'serial', q_norm)
+                if len(exact_hits):
+                    hit_parts.append(exact_hits)
                     try:
                         print(f"[inquiry_debug] path=index_exact_serial q={q_norm} hits={len(exact_hits)}")
                     except Exception:
                         pass
                 else:
                     if len(q_norm) >= 5:
-                        pref5 = indexes.get('serial_prefix5', {}).get(q_norm[:5], [])
-                        hit_indexes.update(pref5)
+                        pref5 = _index_lookup(indexes, 'serial_prefix5', q_norm[:5])
+                        hit_parts.append(pref5)
                         try:
                             print(f"[inquiry_debug] path=index_prefix_serial_5 q={q_norm[:5]} hits={len(pref5)}")
                         except Exception:
                             pass
                     if len(q_norm) >= 3:
-                        pref3 = indexes.get('serial_prefix3', {}).get(q_norm[:3], [])
-                        hit_indexes.update(pref3)
+                        pref3 = _index_lookup(indexes, 'serial_prefix3', q_norm[:3])
+                        hit_parts.append(pref3)
                         try:
                             print(f"[inquiry_debug] path=index_prefix_serial_3 q={q_norm[:3]} hits={len(pref3)}")
                         except Exception:
                             pass
             elif search_type == 'machine_code':
                 # تفضيل المطابقة التامة؛ استخدام البادئات فقط إذا غابت المطابقة التامة
-                exact_hits = indexes.get('machine_code', {}).get(q_norm, [])
-                if exact_hits:
-                    hit_indexes.update(exact_hits)
+                exact_hits = _index_lookup(indexes, 'machine_code', q_norm)
+                if len(exact_hits):
+                    hit_parts.append(exact_hits)
                     try:
                         print(f"[inquiry_debug] path=index_exact_machine_code q={q_norm} hits={len(exact_hits)}")
                     except Exception:
                         pass
                 else:
                     if len(q_norm) >= 5:
-                        pref5 = indexes.get('machine_code_prefix5', {}).get(q_norm[:5], [])
-                        hit_indexes.update(pref5)
+                        pref5 = _index_lookup(indexes, 'machine_code_prefix5', q_norm[:5])
+                        hit_parts.append(pref5)
                         try:
                             print(f"[inquiry_debug] path=index_prefix_machine_code_5 q={q_norm[:5]} hits={len(pref5)}")
                         except Exception:
                             pass
                     if len(q_norm) >= 3:
-                        pref3 = indexes.get('machine_code_prefix3', {}).get(q_norm[:3], [])
-                        hit_indexes.update(pref3)
+                        pref3 = _index_lookup(indexes, 'machine_code_prefix3', q_norm[:3])
+                        hit_parts.append(pref3)
                         try:
                             print(f"[inquiry_debug] path=index_prefix_machine_code_3 q={q_norm[:3]} hits={len(pref3)}")
                         except Exception:
                             pass
             elif search_type == 'name':
                 # الاسم الكامل أولاً
-                name_hits = indexes.get('name', {}).get(q_norm, [])
-                hit_indexes.update(name_hits)
+                name_hits = _index_lookup(indexes, 'name', q_norm)
+                hit_parts.append(name_hits)
                 try:
                     print(f"[inquiry_debug] path=index_exact_name q={q_norm} hits={len(name_hits)}")
                 except Exception:
                     pass
                 # كلمات الاسم (مطابقة كاملة)
                 for tok in [t for t in q_norm.split(' ') if t]:
-                    tok_hits = indexes.get('name_token', {}).get(tok, [])
-                    hit_indexes.update(tok_hits)
+                    tok_hits = _index_lookup(indexes, 'name_token', tok)
+                    hit_parts.append(tok_hits)
                     # بادئة للكلمات
                     if len(tok) >= 5:
-                        pref5 = indexes.get('name_token_prefix5', {}).get(tok[:5], [])
-                        hit_indexes.update(pref5)
+                        pref5 = _index_lookup(indexes, 'name_token_prefix5', tok[:5])
+                        hit_parts.append(pref5)
                     if len(tok) >= 3:
-                        pref3 = indexes.get('name_token_prefix3', {}).get(tok[:3], [])
-                        hit_indexes.update(pref3)
+                        pref3 = _index_lookup(indexes, 'name_token_prefix3', tok[:3])
+                        hit_parts.append(pref3)
     
     
+    def _substring_positions():
+        """البحث الجزئي عبر فهرس trigram بدل contains على كامل البيانات.
+        يعيد None إذا لم يكن الفهرس مطابقاً لأعمدة البحث أو كان الاستعلام يحتاج تفسير regex/مسافات.
+        """
+        sub = indexes.get(f'{search_type}_substr')
+        if sub is None or not target_cols or sub.cols != target_cols:
+            return None
+        if re.escape(q_norm) != q_norm:
+            return None
+        return sub.search(q_norm)
+
     filtered_df = None
     # عند البحث بنوع 'code' نستخدم مطابقة contains عبر الأعمدة المحددة
-    if search_type == 'code' and q_norm:
+    sub_hits = _substring_positions() if (search_type == 'code' and q_norm) else None
+    if sub_hits is not None:
+        filtered_df = mapped_df.iloc[sub_hits]
+        try:
+            print(f"[inquiry_debug] path=index_substring_code q={q_norm} count={len(filtered_df)}")
+        except Exception:
+            pass
+    elif search_type == 'code' and q_norm:
         try:
             # استخدم دالة التصفية الموحدة للبحث الجزئي داخل الأعمدة المستهدفة
-            filtered_df = _filter_dataframe(mapped_df, query, search_cols=(target_cols or []))
+            filtered_df = _filter_dataframe(_full_frame(mapped_df), query, search_cols=(target_cols or []))
             try:
                 print(f"[inquiry_debug] path=code_contains_target_cols q={query} cols={target_cols} count={len(filtered_df) if filtered_df is not None else 0}")
             except Exception:
                 pass
         except Exception:
             filtered_df = mapped_df.iloc[0:0]
-    if (filtered_df is None) and hit_indexes:
-        try:
-            filtered_df = mapped_df.loc[sorted(hit_indexes)]
-        except Exception:
-            # في حال فشل التقطيع بالمؤشرات، نستخدم الإسقاط عبر mask
-            mask = mapped_df.index.isin(list(hit_indexes))
-            filtered_df = mapped_df[mask]
+    hit_positions = np.unique(np.concatenate(hit_parts)) if hit_parts else np.empty(0, dtype=np.int32)
+    if (filtered_df is None) and len(hit_positions):
+        filtered_df = mapped_df.iloc[hit_positions]
         
     elif filtered_df is None:
-        # تصفية ذكية عبر الأعمدة المستهدفة؛ وإذا لم تُحدد أعمدة، استخدم البحث الشامل عبر كل الأعمدة
-        filtered_df = _filter_dataframe(mapped_df, query, search_cols=(None if use_comprehensive_search else target_cols))
-        try:
-            path = 'comprehensive_contains' if use_comprehensive_search else 'target_cols_contains'
-            print(f"[inquiry_debug] path={path} q={query} cols={None if use_comprehensive_search else target_cols} count={len(filtered_df)}")
-        except Exception:
-            pass
+        sub_hits = _substring_positions() if (search_type in ('serial', 'machine_code') and q_norm) else None
+        if sub_hits is not None:
+            filtered_df = mapped_df.iloc[sub_hits]
+            try:
+                print(f"[inquiry_debug] path=index_substring_{search_type} q={q_norm} count={len(filtered_df)}")
+            except Exception:
+                pass
+        else:
+            # تصفية ذكية عبر الأعمدة المستهدفة؛ وإذا لم تُحدد أعمدة، استخدم البحث الشامل عبر كل الأعمدة
+            filtered_df = _filter_dataframe(_full_frame(mapped_df), query, search_cols=(None if use_comprehensive_search else target_cols))
+            try:
+                path = 'comprehensive_contains' if use_comprehensive_search else 'target_cols_contains'
+                print(f"[inquiry_debug] path={path} q={query} cols={None if use_comprehensive_search else target_cols} count={len(filtered_df)}")
+            except Exception:
+                pass
 
     filtered_df = filtered_df.copy()
 
@@ -941,25 +1320,34 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
             print(f"[inquiry_debug] empty_result q={query} search_type={search_type}")
         except Exception:
             pass
-        return {'success': False, 'message': f'لم يتم العثور على نتائج للبحث عن "{query}".', 'items': []}
+        return None, [], {'success': False, 'message': f'لم يتم العثور على نتائج للبحث عن "{query}".', 'items': []}
 
-    
-    filtered_df = _drop_empty_columns(filtered_df) 
+    return _drop_empty_columns(filtered_df), list(mapped_df.columns), None
 
-    # 4. التجميع الأصلي للبيانات
-    grouped_nested_results = _group_search_results(filtered_df, category)
-    
-    total_found_entities = len(grouped_nested_results)
+
+def _inquiry_search(category: str, search_type: str, query: str, visit_period: str = 'recent_program') -> dict:
+    """تنفيذ البحث السريع داخل بيانات التقرير المخزنة وإعادة هيكلة النتائج.
+    تم تحسين الأداء باستخدام فهارس كاش في الذاكرة لمسار سريع، مع مسار احتياطي للتصفية التقليدية عند الحاجة.
+    الكيان الأول فقط يُبنى بالكامل؛ باقي الكيانات تُعاد كمفاتيح خفيفة + cursor وتُجلب عند الطلب عبر /api/inquiry_entity.
+    """
+    filtered_df, data_cols, error = _inquiry_filter(category, search_type, query)
+    if error is not None:
+        return error
+
+    # 4. تقسيم الصفوف إلى كيانات (بدون بناء تفاصيلها)
+    entity_rows = _entity_row_positions(filtered_df, category)
+    total_found_entities = len(entity_rows)
     
-    if not grouped_nested_results:
+    if not entity_rows:
         try:
             print(f"[inquiry_debug] grouped_empty q={query} filtered_count={len(filtered_df)}")
         except Exception:
             pass
         return {'success': False, 'message': 'تم العثور على سجلات، لكن لم يتم تجميعها في كيان صالح (برجاء التحقق من أعمدة رقم العميل/اسم العميل).', 'items': []}
 
-    # 5. إعادة هيكلة النتيجة للواجهة (نستخدم النتيجة الأولى فقط)
-    first_group = grouped_nested_results[0]
+    # 5. إعادة هيكلة النتيجة للواجهة (الكيان الأول فقط يُبنى بالكامل)
+    first_group = _materialize_entity(filtered_df, category, entity_rows, 0)
+    cursor = _put_entity_cursor(category, filtered_df, entity_rows)
     common_data = first_group['common_data']
     
     # تحديد مفاتيح الكيان
@@ -991,18 +1379,19 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
              del common_data[col_in_data] 
 
     # تحميل الماكينات الأساسية من خدمات التجار (trader_primary) ومطابقة الكود/الاسم
-    def _load_primary_df() -> pd.DataFrame:
+    def _load_primary_df() -> tuple[pd.DataFrame, pd.DataFrame]:
+        """بيانات الماكينات الأساسية بعد المابنج + أعمدة الظل المُطبّعة (إن وُجدت)."""
         try:
             row = _load_state("trader_primary")
-            if not row or not row.data_json:
-                return pd.DataFrame()
-            dfp = _json_to_df(row.data_json)
+            if not _row_has_data(row):
+                return pd.DataFrame(), pd.DataFrame()
+            dfp = _row_to_df(row)
             map_row = _load_state("trader_primary:__mapping__")
             mapping = json.loads(map_row.mapping_json) if (map_row and map_row.mapping_json) else {}
             dfp = _apply_mapping(dfp, mapping)
-            return _drop_empty_columns(dfp)
+            return _drop_empty_columns(dfp), _row_shadow(row, mapping)
         except Exception:
-            return pd.DataFrame()
+            return pd.DataFrame(), pd.DataFrame()
 
     def _detect_primary_key_cols(cols: list[str]) -> tuple[str|None, str|None]:
         """تحديد أعمدة الكود والاسم بذكاء من أسماء الأعمدة الفعلية.
@@ -1106,16 +1495,19 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
     primary_debug = {}
     primary_record = {}
     primary_match_mode = 'none'
-    _primary_df = _load_primary_df()
+    _primary_df, _primary_shadow = _load_primary_df()
     if not _primary_df.empty:
         code_col, name_col = _detect_primary_key_cols(list(_primary_df.columns))
         code_norm = _norm_key_text(str(customer_code)) if _textify(customer_code) != '' else None
         name_norm = _norm_key_text(str(customer_name)) if _textify(customer_name) != '' else None
+        # القيم المُطبّعة من أعمدة الظل (بدون إعادة تطبيع العمود كاملاً في كل استعلام)
+        primary_keys = {c: pd.Series(_key_array(_primary_df, c, _primary_shadow), index=_primary_df.index)
+                        for c in (code_col, name_col) if c}
         mask = None
         if code_col and code_norm is not None:
-            mask = (_primary_df[code_col].astype(str).apply(_norm_key_text) == code_norm)
+            mask = (primary_keys[code_col] == code_norm)
         if name_col and name_norm is not None:
-            nm = (_primary_df[name_col].astype(str).apply(_norm_key_text) == name_norm)
+            nm = (primary_keys[name_col] == name_norm)
             mask = (mask & nm) if mask is not None else nm
         filtered_primary = _primary_df[mask] if mask is not None else pd.DataFrame()
         primary_debug = {
@@ -1129,9 +1521,9 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
         if (filtered_primary.empty) and (code_col or name_col):
             union_mask = None
             if code_col and code_norm is not None:
-                union_mask = (_primary_df[code_col].astype(str).apply(_norm_key_text) == code_norm)
+                union_mask = (primary_keys[code_col] == code_norm)
             if name_col and name_norm is not None:
-                nm2 = (_primary_df[name_col].astype(str).apply(_norm_key_text) == name_norm)
+                nm2 = (primary_keys[name_col] == name_norm)
                 union_mask = (union_mask | nm2) if union_mask is not None else nm2
             if union_mask is not None:
                 filtered_primary = _primary_df[union_mask]
@@ -1146,13 +1538,13 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
                 if filtered_primary.shape[0] > 1:
                     # حاول مطابقة الاسم بدقة إذا توفر
                     if name_col and name_norm is not None and name_col in filtered_primary.columns:
-                        exact_name = filtered_primary[name_col].astype(str).apply(_norm_key_text) == name_norm
+                        exact_name = primary_keys[name_col].loc[filtered_primary.index] == name_norm
                         match_idxs = list(filtered_primary[exact_name].index)
                         if match_idxs:
                             best_idx = match_idxs[0]
                     # أو مطابقة الكود بدقة إذا توفر
                     elif code_col and code_norm is not None and code_col in filtered_primary.columns:
-                        exact_code = filtered_primary[code_col].astype(str).apply(_norm_key_text) == code_norm
+                        exact_code = primary_keys[code_col].loc[filtered_primary.index] == code_norm
                         match_idxs = list(filtered_primary[exact_code].index)
                         if match_idxs:
                             best_idx = match_idxs[0]
@@ -1301,9 +1693,9 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
                 mapping = json.loads(map_row.mapping_json) if (map_row and map_row.mapping_json) else {}
                 df = pd.DataFrame()
                 for r in rp_rows:
-                    if not r.data_json:
+                    if not _row_has_data(r):
                         continue
-                    d = _json_to_df(r.data_json)
+                    d = _row_to_df(r)
                     if not d.empty:
                         d = _apply_mapping(d, mapping)
                         try:
@@ -1361,7 +1753,7 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
             df_year = pd.DataFrame()
             if year_rows:
                 for r in year_rows:
-                    d = _json_to_df(r.data_json)
+                    d = _row_to_df(r)
                     if not d.empty:
                         d = _apply_mapping(d, mapping)
                         try:
@@ -1371,7 +1763,7 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
                         df_year = pd.concat([df_year, d], ignore_index=True) if not df_year.empty else d
             elif months_of_year_rows:
                 for r in months_of_year_rows:
-                    d = _json_to_df(r.data_json)
+                    d = _row_to_df(r)
                     if not d.empty:
                         d = _apply_mapping(d, mapping)
                         try:
@@ -1387,7 +1779,7 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
             df_month = pd.DataFrame()
             if selected_month_row is not None:
                 selected_month_label = _label_of(selected_month_row.category).replace('/', '-')
-                d = _json_to_df(selected_month_row.data_json)
+                d = _row_to_df(selected_month_row)
                 if not d.empty:
                     d = _apply_mapping(d, mapping)
                     try:
@@ -1405,18 +1797,18 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
                                     .all())
                 rp_df_sets = pd.DataFrame()
                 for rr in rp_rows_for_sets:
-                    if not rr.data_json:
+                    if not _row_has_data(rr):
                         continue
-                    dd = _json_to_df(rr.data_json)
+                    dd = _row_to_df(rr)
                     if not dd.empty:
                         dd = _apply_mapping(dd, mapping)
                         rp_df_sets = pd.concat([rp_df_sets, dd], ignore_index=True) if not rp_df_sets.empty else dd
                 if not rp_df_sets.empty:
                     std_rp = _standardize_visit_df(rp_df_sets)
                     if 'رقم العميل' in std_rp.columns:
-                        code_set = set(std_rp['رقم العميل'].astype(str).apply(_norm_key_text))
+                        code_set = set(_norm_key_series(std_rp['رقم العميل'].astype(str)))
                     if 'مسلسل' in std_rp.columns:
-                        serial_set = set(std_rp['مسلسل'].astype(str).apply(_norm_key_text))
+                        serial_set = set(_norm_key_series(std_rp['مسلسل'].astype(str)))
             except Exception:
                 pass
 
@@ -1429,8 +1821,8 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
                 # فلترة السنة وفق عضوية recent_program إن توفرت مجموعات عضوية
                 if code_set or serial_set:
                     std_y = _standardize_visit_df(df_year)
-                    mask_code = std_y['رقم العميل'].astype(str).apply(_norm_key_text).isin(code_set) if ('رقم العميل' in std_y.columns and code_set) else None
-                    mask_serial = std_y['مسلسل'].astype(str).apply(_norm_key_text).isin(serial_set) if ('مسلسل' in std_y.columns and serial_set) else None
+                    mask_code = _norm_key_series(std_y['رقم العميل'].astype(str)).isin(code_set) if ('رقم العميل' in std_y.columns and code_set) else None
+                    mask_serial = _norm_key_series(std_y['مسلسل'].astype(str)).isin(serial_set) if ('مسلسل' in std_y.columns and serial_set) else None
                     if mask_code is not None and mask_serial is not None:
                         year_mask = (mask_code | mask_serial)
                     elif mask_code is not None:
@@ -1451,8 +1843,8 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
                 # فلترة الشهر وفق عضوية recent_program إن توفرت مجموعات عضوية
                 if code_set or serial_set:
                     std_m = _standardize_visit_df(df_month)
-                    mask_code = std_m['رقم العميل'].astype(str).apply(_norm_key_text).isin(code_set) if ('رقم العميل' in std_m.columns and code_set) else None
-                    mask_serial = std_m['مسلسل'].astype(str).apply(_norm_key_text).isin(serial_set) if ('مسلسل' in std_m.columns and serial_set) else None
+                    mask_code = _norm_key_series(std_m['رقم العميل'].astype(str)).isin(code_set) if ('رقم العميل' in std_m.columns and code_set) else None
+                    mask_serial = _norm_key_series(std_m['مسلسل'].astype(str)).isin(serial_set) if ('مسلسل' in std_m.columns and serial_set) else None
                     if mask_code is not None and mask_serial is not None:
                         month_mask = (mask_code | mask_serial)
                     elif mask_code is not None:
@@ -1480,9 +1872,9 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
                 mapping = json.loads(map_row.mapping_json) if (map_row and map_row.mapping_json) else {}
                 df = pd.DataFrame()
                 for r in rp_rows:
-                    if not r.data_json:
+                    if not _row_has_data(r):
                         continue
-                    d = _json_to_df(r.data_json)
+                    d = _row_to_df(r)
                     if not d.empty:
                         d = _apply_mapping(d, mapping)
                         try:
@@ -1503,9 +1895,9 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
             # في أي خطأ، نعود لإستراتيجية قديمة (إن وُجدت) أو نُرجع فارغ
             try:
                 row_vis = _load_state("visit_history")
-                if not row_vis or not row_vis.data_json:
+                if not _row_has_data(row_vis):
                     return pd.DataFrame(), {'month_label': None, 'year_label': None, 'source': 'month'}
-                df_vis = _json_to_df(row_vis.data_json)
+                df_vis = _row_to_df(row_vis)
                 map_row = _load_state("visit_history:__mapping__")
                 mapping = json.loads(map_row.mapping_json) if (map_row and map_row.mapping_json) else {}
                 df_vis = _apply_mapping(df_vis, mapping)
@@ -1531,7 +1923,9 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
             pick(customer_name_candidates)
         )
 
-    visit_history_df, _period_meta = _load_visit_history_df()
+    # مخزن تجميعات الزيارات (يُبنى فقط عند تغيّر بيانات الزيارات)
+    visit_agg = _get_visit_aggregates(_load_visit_history_df)
+    _period_meta = visit_agg['meta']
 
     # جمع مسلسلات المجموعة الحالية لاستخدامها في التصفية إذا لم يتوفر رقم العميل في سجل الزيارات
     current_serials = set()
@@ -1548,74 +1942,27 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
         visit_debug['primary'] = primary_debug
     except Exception:
         pass
-    if not visit_history_df.empty:
-        # إعادة بناء المنطق: توحيد الأعمدة ثم مطابقة صارمة ومرنة
-        dfv = _standardize_visit_df(visit_history_df)
-        visit_debug['source_cols'] = list(visit_history_df.columns)
-        visit_debug['std_cols'] = list(dfv.columns)
-        visit_debug['source_rows'] = int(visit_history_df.shape[0])
+    if not visit_agg['empty']:
+        # المطابقة عبر فهارس المخزن بدل أقنعة على كامل سجل الزيارات
+        visit_debug['source_cols'] = visit_agg['source_cols']
+        visit_debug['std_cols'] = visit_agg['std_cols']
+        visit_debug['source_rows'] = visit_agg['source_rows']
         code_norm = _norm_key_text(str(customer_code)) if _textify(customer_code) != '' else None
         name_norm = _norm_key_text(str(customer_name)) if _textify(customer_name) != '' else None
         serials_norm = set(_norm_key_text(s) for s in current_serials) if current_serials else set()
-        # فلترة حسب النوع المطلوب (مخابز/تموين/استبدال) قبل بناء الأقنعة
-        pre_dfv = dfv
+        # فلترة حسب النوع المطلوب (مخابز/تموين/استبدال)
         target_type = CATEGORIES.get(category, category)
         type_norm = _norm_key_text(str(target_type)) if _textify(target_type) != '' else None
-        type_mask = None
-        if ('النوع' in pre_dfv.columns) and type_norm is not None:
-            try:
-                type_mask = (pre_dfv['النوع'].apply(_textify).apply(_norm_key_text) == type_norm)
-            except Exception:
-                type_mask = None
-        if type_mask is not None:
-            pre_dfv = pre_dfv[type_mask]
+        matched_rows, match_counts = _visit_match_rows(visit_agg, code_norm, name_norm, type_norm, serials_norm)
         visit_debug['type_norm'] = type_norm
-        visit_debug['type_rows'] = int(pre_dfv.shape[0])
-
-        mask = None
-        # استخدام _textify قبل _norm_key_text لضمان إزالة الأجزاء مثل ".0" وتحويل الأرقام إلى نص موحد
-        if 'رقم العميل' in dfv.columns and code_norm is not None:
-            mask = (dfv['رقم العميل'].apply(_textify).apply(_norm_key_text) == code_norm)
-        if 'اسم العميل' in dfv.columns and name_norm is not None:
-            nm = (dfv['اسم العميل'].apply(_textify).apply(_norm_key_text) == name_norm)
-            mask = (mask & nm) if mask is not None else nm
-        # طبّق التقاطع إن توفر كلا العمودين
-        if mask is not None:
-            dfv = dfv[mask]
-            # بعد تطبيق التقاطع، طبّق فلترة النوع إن وُجدت
-            if type_mask is not None:
-                dfv = dfv[type_mask]
-        # إن لم تُنتج نتيجة، جرّب اتحاد الشرطين إن كانا متوفرين
-        if dfv.empty and ('رقم العميل' in pre_dfv.columns or 'اسم العميل' in pre_dfv.columns):
-            union_mask = None
-            if 'رقم العميل' in pre_dfv.columns and code_norm is not None:
-                union_mask = (pre_dfv['رقم العميل'].apply(_textify).apply(_norm_key_text) == code_norm)
-            if 'اسم العميل' in pre_dfv.columns and name_norm is not None:
-                nm = (pre_dfv['اسم العميل'].apply(_textify).apply(_norm_key_text) == name_norm)
-                union_mask = (union_mask | nm) if union_mask is not None else nm
-            if union_mask is not None:
-                dfv = pre_dfv[union_mask]
-        # وإن بقيت فارغة، اعتمد المسلسلات كحل أخير
-        if dfv.empty and ('مسلسل' in pre_dfv.columns) and serials_norm:
-            dfv = pre_dfv[pre_dfv['مسلسل'].apply(_textify).apply(_norm_key_text).isin(serials_norm)]
-        # سجّل عدّ مفصول للرقم وللمسلسل مع فلترة النوع
-        try:
-            code_count = 0
-            if ('رقم العميل' in pre_dfv.columns) and (code_norm is not None):
-                code_count = int((pre_dfv['رقم العميل'].apply(_textify).apply(_norm_key_text) == code_norm).sum())
-            serial_count = 0
-            if ('مسلسل' in pre_dfv.columns) and serials_norm:
-                serial_count = int(pre_dfv['مسلسل'].apply(_textify).apply(_norm_key_text).isin(serials_norm).sum())
-            visit_debug['code_count'] = code_count
-            visit_debug['serial_count'] = serial_count
-        except Exception:
-            pass
+        visit_debug['type_rows'] = match_counts['type_rows']
+        visit_debug['code_count'] = match_counts['code_count']
+        visit_debug['serial_count'] = match_counts['serial_count']
         visit_debug['code_norm'] = code_norm
         visit_debug['name_norm'] = name_norm
         visit_debug['serials_norm_count'] = len(serials_norm)
-        visit_debug['matched_rows'] = int(dfv.shape[0])
+        visit_debug['matched_rows'] = int(matched_rows.size)
         visit_debug['count_mode'] = 'textify_norm_matching'
-        # ملاحظة: سنمرر إطار البيانات الموحّد بالكامل إلى دالة العد التي تتعامل مع وجود/غياب التاريخ والمسلسل.
         # تحديد الفترة تلقائياً من الميتاداتا: السنة ← year، الحديثة ← recent_program، وإلا شهر
         if isinstance(_period_meta, dict) and _period_meta.get('source') in ['year','month','recent_program']:
             if _period_meta.get('source') == 'year':
@@ -1624,7 +1971,7 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
                 visit_period = 'recent_program'
             else:
                 visit_period = 'month'
-        visit_data = _fetch_visit_data(customer_code, dfv, visit_period, _period_meta.get('month_label'), _period_meta.get('year_label')) if (not dfv.empty) else {'current_month': {'total': 0, 'details': {}}, 'current_year': {'total': 0, 'details': {}}}
+        visit_data = _visit_counts(visit_agg, matched_rows, visit_period, _period_meta.get('month_label'), _period_meta.get('year_label'))
         visit_debug['month_total'] = int(visit_data['current_month']['total'])
         visit_debug['year_total'] = int(visit_data['current_year']['total'])
     else:
@@ -1649,9 +1996,12 @@ def _inquiry_search(category: str, search_type: str, query: str, visit_period: s
         'visit_data': visit_data,
         'visit_debug': visit_debug,
         'serial_list': serial_list,
-        'cols': list(mapped_df.columns),
-        # إضافة نتيجة التجميع بالكامل للسماح للـ JS بالتعامل مع الكيانات المتعددة إذا لزم الأمر
-        'items': grouped_nested_results, 
+        'cols': data_cols,
+        # الكيان الأول كاملاً؛ باقي الكيانات تُجلب عند التنقل عبر cursor
+        'items': [first_group],
+        'total_entities': total_found_entities,
+        'entity_keys': _entity_keys(filtered_df, category, entity_rows),
+        'cursor': cursor,
     }
 
 @machine_reports_bp.route('/inquiry', methods=['GET'])
@@ -1690,6 +2040,43 @@ def api_inquiry_search():
     return jsonify(result)
 
 
+@machine_reports_bp.route('/api/inquiry_entity', methods=['POST'])
+@login_required
+@role_required(['admin', 'data_entry', 'user'])
+@permission_required('can_inquiry')
+def api_inquiry_entity():
+    """جلب كيان واحد (رقم index) من نتيجة استعلام سابقة عبر cursor.
+    إذا لم يعد الـ cursor موجوداً (worker آخر أو تم استبداله) يُعاد تنفيذ التصفية بنفس مدخلات البحث.
+    """
+    data = request.json or {}
+    category = data.get('category')
+    try:
+        index = int(data.get('index'))
+    except (TypeError, ValueError):
+        index = -1
+    if category not in CATEGORIES or index < 0:
+        return jsonify({'success': False, 'message': 'بيانات طلب غير صالحة.'}), 400
+
+    entry = _get_entity_cursor(data.get('cursor'), category)
+    cursor = data.get('cursor')
+    if entry is None:
+        search_type = data.get('search_type')
+        query = data.get('query')
+        if search_type not in ['code', 'serial', 'name', 'machine_code'] or not query:
+            return jsonify({'success': False, 'message': 'انتهت صلاحية نتيجة البحث، يرجى إعادة البحث.'}), 410
+        filtered_df, _, error = _inquiry_filter(category, search_type, query)
+        if error is not None:
+            return jsonify(error), 404
+        entity_rows = _entity_row_positions(filtered_df, category)
+        cursor = _put_entity_cursor(category, filtered_df, entity_rows)
+        entry = {'df': filtered_df, 'rows': entity_rows}
+
+    if index >= len(entry['rows']):
+        return jsonify({'success': False, 'message': 'رقم السجل خارج نطاق النتائج.'}), 404
+    item = _materialize_entity(entry['df'], category, entry['rows'], index)
+    return jsonify({'success': True, 'index': index, 'total_entities': len(entry['rows']), 'cursor': cursor, 'item': item})
+
+
 @machine_reports_bp.route('/api/service_tickets/save', methods=['POST'])
 @login_required
 @role_required(['admin', 'data_entry', 'user'])
@@ -1871,7 +2258,7 @@ def api_save_service_tickets():
                     existing_df = pd.DataFrame()
                 else:
                     try:
-                        existing_df = _json_to_df(row.data_json) if row.data_json else pd.DataFrame()
+                        existing_df = _row_to_df(row) if _row_has_data(row) else pd.DataFrame()
                     except Exception:
                         existing_df = pd.DataFrame()
 
@@ -1883,7 +2270,7 @@ def api_save_service_tickets():
                     else:
                         combined = combined.drop_duplicates(keep='last')
 
-                row.data_json = _df_to_json(combined) if not combined.empty else _df_to_json(pd.DataFrame())
+                _store_df(row, combined if not combined.empty else pd.DataFrame())
                 db.session.commit()
         except Exception as ex2:
             # لا نفشل الحفظ الرئيسي بسبب مشكلة ترحيل البيانات المساعدة
@@ -1932,7 +2319,7 @@ def api_reset_recent_program():
             row = ReportState(category='trader_frequent:recent_program', user_id=user_id)
             db.session.add(row)
 
-        row.data_json = _df_to_json(df_empty)
+        _store_df(row, df_empty)
         db.session.commit()
 
         return jsonify({'success': True, 'message': 'تم تفريغ recent_program وإنشاؤه فارغًا بنفس الأعمدة.'})
@@ -1957,8 +2344,9 @@ def category_view(category):
     row = _load_state(category)
     is_admin = getattr(current_user, "role", None) == "admin"
 
-    df = _json_to_df(row.data_json) if row and row.data_json else pd.DataFrame()
     mapping = json.loads(row.mapping_json) if row and row.mapping_json else {}
+    # قراءة فقط: الصفحة تُقتطع من الإطار المخزن بمواضع الصفوف بدون نسخه كاملاً
+    df = _row_to_mapped_df(row, mapping, copy=False) if _row_has_data(row) else pd.DataFrame()
 
     q = request.args.get("q", "", type=str)
     search_in = request.args.get("search_in", "all")
@@ -1969,16 +2357,25 @@ def category_view(category):
     search_cols_for_view = [search_in] if search_in != 'all' else None
 
     if not df.empty:
-        mapped    = _apply_mapping(df, mapping)
-        filtered = _filter_dataframe(mapped, q, search_cols=search_cols_for_view)
-        visible  = _drop_empty_columns(filtered)
-        
-        if visible.empty:
+        # نتيجة البحث (مواضع الصفوف + الأعمدة غير الفارغة) تُحسب مرة لكل (إصدار البيانات، q، search_in)
+        # ثم يُقتطع منها كل تنقل بين الصفحات
+        def _compute():
+            filtered = _filter_dataframe(df, q, search_cols=search_cols_for_view,
+                                         text_index=lambda: _row_text_index(row, mapping, df))
+            # كل الصفوف: الأعمدة الفارغة معروفة من ملف الأعمدة المحفوظ بدون مسح
+            visible  = _drop_empty_columns(filtered, _row_profile(row, mapping, df) if filtered is df else None)
+            return subset_positions(df, filtered), list(visible.columns), len(filtered)
+        key = FILTER_CACHE.make_key(f"{category}:{row.id}", (row.updated_at, _mapping_signature(mapping)),
+                                    q, search_in, current_user.id)
+        result = FILTER_CACHE.get_or_compute(key, _compute)
+
+        if result.total == 0 or not result.columns:
             page_df = pd.DataFrame(); total_pages = 1; search_cols = []
         else:
-            page_df, total = _paginate(visible, page, page_size)
-            total_pages = max(1, (total + page_size - 1)//page_size)
-            search_cols = list(visible.columns)
+            start = max(0, (page - 1) * page_size)
+            page_df = df.iloc[result.page(start, start + page_size)][result.columns]
+            total_pages = max(1, (result.total + page_size - 1)//page_size)
+            search_cols = list(result.columns)
     else:
         page_df = pd.DataFrame(); total_pages = 1; search_cols = []
 
@@ -2069,64 +2466,159 @@ def import_files(category):
         flash("قسم غير موجود", "warning")
         return redirect(url_for("machine_reports_bp.index"))
 
-    # 1. تجميع الملفات المرفوعة ومعلوماتها
-    uploaded_files_info = []
+    # 1. تجميع الملفات المرفوعة (تُحفظ على القرص ويتم الاستيراد كمهمة في الخلفية)
+    uploads = []
     for i in range(1, MAX_FILES + 1):
         file_storage = request.files.get(f"file{i}")
         if file_storage and file_storage.filename:
-            uploaded_files_info.append({"file_storage": file_storage, "filename": file_storage.filename, "index": i})
+            uploads.append((f"file{i}", file_storage))
 
-    if len(uploaded_files_info) == 0:
+    if len(uploads) == 0:
         flash("برجاء اختيار ملف (المسلسلات) على الأقل.", "warning")
         return redirect(url_for("machine_reports_bp.import_view", category=category))
 
+    append_unmatched = request.form.get("append_unmatched") == "1"
+    job, files = import_jobs.create_job("reports", category, current_user.id, uploads,
+                                        result_url=url_for("machine_reports_bp.category_view", category=category))
+    import_jobs.submit(job.id, _run_reports_import, category, current_user.id, files, append_unmatched)
+    return _import_job_response(job.id)
+
+def _run_reports_import(ctx, category: str, user_id: int, files: list, append_unmatched: bool = False):
+    """مهمة استيراد ملفات القسم (قراءة ← دمج ← حفظ ← فهارس). تعيد (رسالة النتيجة، مستواها)."""
+    uploaded_files_info = [{"file_storage": import_jobs.open_upload(path, filename), "filename": filename,
+                            "index": int(field[len("file"):])} for field, filename, path in files]
+    try:
+        return _import_uploaded_files(ctx, category, user_id, uploaded_files_info, append_unmatched)
+    finally:
+        for item in uploaded_files_info:
+            item["file_storage"].close()
+
+def _import_uploaded_files(ctx, category: str, user_id: int, uploaded_files_info: list, append_unmatched: bool = False):
     # 2. قراءة الملفات وتجميع البيانات التي تم قراءتها بنجاح
-    dfs_all = [] 
+    # ملفات الإثراء (2..6) تُقرأ بالتوازي في مجمع العمليات، وملف الأساس (الأول) يُقرأ على دفعات هنا في نفس الوقت:
+    # dfs_all[0] هي الدفعة الأولى وbase_rest باقي الدفعات.
+    # وضع إلحاق الكيانات غير المطابقة يحتاج مفاتيح ملف الأساس كاملة، فيُقرأ الأساس كاملاً بدون دفعات.
+    ctx.stage("read")
+    dfs_all = [None] * len(uploaded_files_info)
     successful_files = []
     failed_filenames = []
-    
-    for item in uploaded_files_info:
+    base_rest = None
+    pending = {}
+    for pos, item in enumerate(uploaded_files_info[1:], start=1):
         try:
-            df = _read_any(item["file_storage"])
-            dfs_all.append(df)
+            args = (item["filename"], item["file_storage"].read())
+            pending[pos] = (import_pool.submit(_read_bytes, *args), args)
+        except Exception as ex:
+            pending[pos] = ex
+
+    for pos, item in enumerate(uploaded_files_info):
+        try:
+            if pos == 0:
+                streamed = None if append_unmatched else _stream_any(item["file_storage"])
+                if streamed is not None:
+                    df, base_rest = streamed
+                else:
+                    df = _read_any(item["file_storage"])
+            elif isinstance(pending[pos], Exception):
+                raise pending[pos]
+            else:
+                fut, args = pending[pos]
+                df = import_pool.result(fut, _read_bytes, *args)
+            dfs_all[pos] = df
             if df.empty:
                 failed_filenames.append(f'{item["filename"]} (الموقع: ملف {item["index"]} - فارغ/فشل في القراءة)')
             else:
                 successful_files.append(item["filename"])
         except Exception as ex:
              current_app.logger.exception(f"Error reading file {item['filename']}: {ex}")
-             dfs_all.append(pd.DataFrame()) 
+             dfs_all[pos] = pd.DataFrame()
              failed_filenames.append(f'{item["filename"]} (الموقع: ملف {item["index"]} - فشل حاد في القراءة)')
 
 
     # 3. الدمج
+    ctx.stage("merge")
     try:
-        out_df = _merge_all(dfs_all, category)
-        
-        if out_df.empty and successful_files:
-             flash("تم قراءة الملفات، لكن عملية الدمج لم تنتج عنها سجلات صالحة.", "warning")
-             return redirect(url_for("machine_reports_bp.category_view", category=category))
-        
-        # 💡 تم التعديل: هنا يتم استدعاء دالة الحفظ التي تستخدم user_id
-        _save_state(category, df=out_df)
+        total = None
+        if base_rest is not None and not dfs_all[0].empty:
+            # الدمج صف بصف (left join) فيُطبق على كل دفعة من ملف الأساس مع ملفات الإثراء كاملة، ثم تُحفظ مباشرة
+            others = dfs_all[1:]
+            merged = (_merge_all([chunk] + others, category) for chunk in itertools.chain([dfs_all[0]], base_rest))
+            try:
+                total = _save_state(category, frames=ctx.track(merged), user_id=user_id)
+            except stream_ingest.StreamUnsupported as ex:
+                # صف أعرض من العناوين ظهر أثناء القراءة: إعادة القراءة كاملة بنفس نتيجة read_excel
+                current_app.logger.info(f"[Import] streaming fallback for {uploaded_files_info[0]['filename']}: {ex}")
+                uploaded_files_info[0]["file_storage"].stream.seek(0)
+                dfs_all[0] = _read_any(uploaded_files_info[0]["file_storage"])
+                ctx.set_rows(0)
+                base_rest = None
+        if base_rest is None or dfs_all[0].empty:
+            out_df = _merge_all(dfs_all, category, append_unmatched=append_unmatched)
+
+            if out_df.empty and successful_files:
+                 return "تم قراءة الملفات، لكن عملية الدمج لم تنتج عنها سجلات صالحة.", "warning"
+
+            ctx.stage("store")
+            # 💡 تم التعديل: هنا يتم استدعاء دالة الحفظ التي تستخدم user_id
+            _save_state(category, df=out_df, user_id=user_id)
+            total = len(out_df)
+            ctx.set_rows(total)
         # إبطال الكاش لضمان إعادة بناء الفهارس مع البيانات الجديدة
+        ctx.stage("index")
         try:
-            _invalidate_inquiry_cache(category)
+            FRAME_CACHE.invalidate(category)
+            # خارج الطلب لا يوجد current_user: إعادة البناء لسجل صاحب المهمة صراحةً
+            row = ReportState.query.filter_by(category=category, user_id=user_id).first()
+            schedule_inquiry_rebuild(category, state_id=getattr(row, "id", None))
+            if import_jobs.is_async():
+                # المهمة في الخلفية تنتهي بعد جاهزية فهارس الاستعلام للبيانات الجديدة
+                building = _INDEX_BUILDING.get(category)
+                if building is not None:
+                    building.wait(timeout=_INDEX_WAIT_SECONDS)
         except Exception:
             pass
-        
-        msg = f"تم استيراد ودمج {len(successful_files)} ملف(ات) بنجاح. إجمالي السجلات بعد الدمج: {len(out_df)}"
+
+        msg = f"تم استيراد ودمج {len(successful_files)} ملف(ات) بنجاح. إجمالي السجلات بعد الدمج: {total or 0}"
         if failed_filenames:
              msg += f". ملاحظة: لم يتم استخدام/قراءة الملفات التالية: {', '.join(failed_filenames)}"
-             flash(msg, "warning")
-        else:
-             flash(msg, "success")
-             
+             return msg, "warning"
+        return msg, "success"
+
     except Exception as ex:
+        db.session.rollback()
         current_app.logger.exception("Import error:")
-        flash(f"خطأ في دمج الملفات: {ex}", "danger")
+        return f"خطأ في دمج الملفات: {ex}", "danger"
 
-    return redirect(url_for("machine_reports_bp.category_view", category=category))
+def _import_job_response(job_id: int):
+    return import_jobs.job_response(job_id)
+
+def _job_for_user(job_id: int):
+    """المهمة إذا كانت للمستخدم الحالي (أو للأدمن)، وإلا None."""
+    job = db.session.get(ImportJob, job_id)
+    if job is None:
+        return None
+    if job.user_id != current_user.id and getattr(current_user, "role", None) != "admin":
+        return None
+    return job
+
+@machine_reports_bp.route("/jobs/<int:job_id>", methods=["GET"])
+@login_required
+def import_job_view(job_id):
+    """صفحة متابعة مهمة استيراد (تستعلم عن الحالة دورياً وتعرض النتيجة عند الانتهاء)."""
+    job = _job_for_user(job_id)
+    if job is None:
+        flash("مهمة الاستيراد غير موجودة.", "warning")
+        return redirect(url_for("main_bp.dashboard"))
+    return render_template("reports/import_job.html", job=import_jobs.job_status(job))
+
+@machine_reports_bp.route("/api/jobs/<int:job_id>", methods=["GET"])
+@login_required
+def api_import_job_status(job_id):
+    """حالة مهمة استيراد: المرحلة، عدد الصفوف المعالجة، الزمن المنقضي، ورسالة النتيجة عند الانتهاء."""
+    job = _job_for_user(job_id)
+    if job is None:
+        return jsonify({"error": "not found"}), 404
+    return jsonify(import_jobs.job_status(job))
 
 @machine_reports_bp.route("/<category>/export", methods=["GET"])
 @login_required
@@ -2137,80 +2629,36 @@ def export_excel(category):
 
     # 💡 تم التعديل: هنا يتم استدعاء دالة التحميل التي تستخدم user_id
     row = _load_state(category)
-    if not row or not row.data_json:
+    if not _row_has_data(row):
         flash("لا توجد بيانات لتصديرها. برجاء الاستيراد أولاً بواسطة الأدمن.", "warning")
         return redirect(url_for("machine_reports_bp.category_view", category=category))
 
-    df = _json_to_df(row.data_json)
     mapping = json.loads(row.mapping_json) if row and row.mapping_json else {}
     q = request.args.get("q", "", type=str)
     search_in = request.args.get("search_in", "all")
 
-    out = _apply_mapping(df, mapping)
+    # الصيغة: ?format=xlsx (الافتراضي) | csv (متدفق) | parquet (يحتاج pyarrow)
+    fmt = table_export.export_format(request.args.get("format"))
+    download_name = f"{CATEGORIES[category]}_export.{fmt}"
+    # نفس (إصدار البيانات، المابنج، البحث، الصيغة) يُرسل من كاش الملفات بدون تحميل البيانات أو تصفيتها
+    key = EXPORT_CACHE.make_key(row, _STORE_CLEANER, _mapping_signature(mapping), q, search_in, fmt)
+    cached = EXPORT_CACHE.respond(key, download_name)
+    if cached is not None:
+        return cached
+
+    # قراءة فقط: التصفية تُنتج إطاراً جديداً ولا تعدّل الإطار المخزن
+    mapped = _row_to_mapped_df(row, mapping, copy=False)
     search_cols_for_export = [search_in] if search_in != 'all' else None
-    out = _filter_dataframe(out, q, search_cols=search_cols_for_export)
-    out = _drop_empty_columns(out)
+    out = _filter_dataframe(mapped, q, search_cols=search_cols_for_export,
+                            text_index=lambda: _row_text_index(row, mapping, mapped))
+    out = _drop_empty_columns(out, _row_profile(row, mapping, mapped) if out is mapped else None)
     out = _coerce_text_df(out)
 
-    output = io.BytesIO()
     try:
-        import xlsxwriter
-        with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-            sheet = "data"
-            out.to_excel(writer, index=False, sheet_name=sheet)
-            ws = writer.sheets[sheet]
-            book = writer.book
-            header_fmt = book.add_format({"bold": True, "bg_color": "#E2E8F0", "align": "center", "valign": "vcenter", "border": 1, "num_format": "@"})
-            cell_fmt   = book.add_format({"align": "center", "valign": "vcenter", "border": 1, "num_format": "@"})
-            for i, c in enumerate(out.columns):
-                ws.write(0, i, c, header_fmt)
-            n_rows, n_cols = len(out.index), len(out.columns)
-            if n_rows > 0 and n_cols > 0:
-                from xlsxwriter.utility import xl_rowcol_to_cell
-                start = xl_rowcol_to_cell(1, 0); end = xl_rowcol_to_cell(n_rows, n_cols-1)
-                ws.conditional_format(f"{start}:{end}", {"type":"no_blanks", "format": cell_fmt})
-            for i, c in enumerate(out.columns):
-                series = out[c].astype(str)
-                width = min(max([len(str(c))] + [len(s) for s in series.tolist()]) + 2, 60)
-                ws.set_column(i, i, width)
-            ws.freeze_panes(1, 0)
-        output.seek(0)
+        return EXPORT_CACHE.store(key, download_name, out)
     except ModuleNotFoundError:
-        try:
-            from openpyxl.styles import Alignment, PatternFill, Font, Border, Side
-            from openpyxl.utils import get_column_letter
-            with pd.ExcelWriter(output, engine="openpyxl") as writer:
-                sheet = "data"
-                out.to_excel(writer, index=False, sheet_name=sheet)
-                ws = writer.sheets[sheet]
-                header_fill = PatternFill("solid", fgColor="E2E8F0")
-                header_font = Font(bold=True)
-                thin = Side(border_style="thin", color="CCCCCC")
-                border = Border(left=thin, right=thin, top=thin, bottom=thin)
-                center = Alignment(horizontal="center", vertical="center", wrap_text=False)
-                for cell in ws[1]:
-                    cell.fill = header_fill; cell.font = header_font
-                    cell.alignment = center; cell.border = border; cell.number_format = "@"
-                for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=1, max_col=ws.max_column):
-                    for cell in row:
-                        if cell.value not in (None, ""):
-                            cell.alignment = center; cell.border = border; cell.number_format = "@"
-                for i, c in enumerate(out.columns, start=1):
-                    series = out[c].astype(str).tolist() if not out.empty else []
-                    width = min(max([len(str(c))] + [len(s) for s in series]) + 2, 60) if series else len(str(c))
-                    ws.column_dimensions[get_column_letter(i)].width = width
-                ws.freeze_panes = "A2"
-            output.seek(0)
-        except Exception:
-             # في حال فشل الاستيراد والتنسيق، نكتفي بكتابة ملف Excel بدون تنسيق
-            with pd.ExcelWriter(output, engine="openpyxl") as writer:
-                out.to_excel(writer, index=False, sheet_name="data")
-            output.seek(0)
-
-
-    filename = f"{CATEGORIES[category]}_export.xlsx"
-    return send_file(output, as_attachment=True, download_name=filename,
-                             mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        flash("تصدير Parquet غير متاح على الخادم (يحتاج تثبيت مكتبة pyarrow).", "warning")
+        return redirect(url_for("machine_reports_bp.category_view", category=category, q=q, search_in=search_in))
 
 def _paginate(df: pd.DataFrame, page: int, page_size: int):
     """وظيفة التقسيم للصفحات"""
@@ -2223,23 +2671,26 @@ def _paginate(df: pd.DataFrame, page: int, page_size: int):
 
 _AR_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
 def _norm_key_text(s: str) -> str:
-    if s is None:
-        return ""
-    t = str(s).translate(_AR_DIGITS)
-    # توحيد أشكال الألف، إزالة التطويل
-    t = t.replace("\u0640", "").replace("أ", "ا").replace("إ", "ا").replace("آ", "ا")
-    # تحسين التطبيع للأحرف الشائعة في الأسماء العربية
-    # تحويل الياء المقصورة إلى ياء عادية، والتاء المربوطة إلى هاء لتقليل الفروق
-    t = t.replace("ى", "ي").replace("ة", "ه").replace("ئ", "ي").replace("ؤ", "و")
-    # إزالة المسافات الزائدة
-    t = re.sub(r"\s+", " ", t).strip()
-    return t
+    """توحيد عربي لقيمة واحدة (واجهة متوافقة فوق norm_keys.norm_key_text)."""
+    return norm_keys.norm_key_text(s)
+
+def _norm_key_series(s: pd.Series) -> pd.Series:
+    """نسخة عمودية من _norm_key_text: جدول ترجمة واحد + توحيد المسافات (split/join يطابق \\s+ ثم strip).
+    القيم الفارغة/NaN تصبح "".
+    """
+    return pd.Series(norm_keys.norm_key_array(s.to_numpy(dtype=object)), index=s.index, dtype=object)
+
+def _key_array(df: pd.DataFrame, col: str, shadow: pd.DataFrame | None = None) -> np.ndarray:
+    """قيم العمود المُطبّعة: من أعمدة الظل المحفوظة إن توفرت لنفس العمود، وإلا تُحسب."""
+    if shadow is not None and col in shadow.columns and len(shadow) == len(df):
+        return shadow[col].to_numpy(dtype=object)
+    return _norm_key_series(df[col]).to_numpy(dtype=object)
 
 def _normalize_key_cols(df: pd.DataFrame, join_cols: list[str]) -> pd.DataFrame:
     out = df.copy()
     for c in join_cols:
         if c in out.columns:
-            out[c] = out[c].map(lambda v: _norm_key_text("" if (pd.isna(v) or v is None) else str(v)))
+            out[c] = _norm_key_series(out[c])
         else:
             out[c] = ""
     return out
@@ -2312,79 +2763,140 @@ def _pick_office_keys(dfs):
 
 def _read_any(file_storage) -> pd.DataFrame:
     if not file_storage or not file_storage.filename: return pd.DataFrame()
-    name = file_storage.filename.lower()
-    bio = io.BytesIO(file_storage.read())
+    return _read_bytes(file_storage.filename, file_storage.read())
+
+def _read_bytes(filename: str, payload: bytes) -> pd.DataFrame:
+    """قراءة وتنظيف ملف مرفوع من محتواه (تعمل أيضاً داخل عمليات مجمع الاستيراد)."""
+    name = filename.lower()
+    bio = io.BytesIO(payload)
     df = pd.DataFrame()
     try:
         if name.endswith((".xlsx",".xls")):
             df = pd.read_excel(bio, dtype=str)
         else:
-            df = pd.read_csv(bio, dtype=str, encoding="utf-8", errors="ignore")
+            df = pd.read_csv(bio, dtype=str, encoding="utf-8", encoding_errors="ignore")
     except Exception:
         try:
             bio.seek(0); df = pd.read_excel(bio, dtype=str)
         except Exception:
-            bio.seek(0); df = pd.read_csv(bio, dtype=str, encoding="utf-8", errors="ignore")
+            bio.seek(0); df = pd.read_csv(bio, dtype=str, encoding="utf-8", encoding_errors="ignore")
             
     return _coerce_text_df(df)
 
+def _stream_any(file_storage):
+    """قراءة ملف مرفوع على دفعات بذاكرة محدودة (xlsx بوضع read_only أو csv بـ chunksize) بنفس نتيجة _read_any.
+    يعيد (أول دفعة نظيفة، مكرر باقي الدفعات النظيفة) أو None إذا تعذرت القراءة المتتابعة (xls، صف أعرض من العناوين).
+    """
+    if not file_storage or not file_storage.filename:
+        return None
+    try:
+        frames = stream_ingest.open_upload_frames(file_storage)
+    except stream_ingest.StreamUnsupported:
+        file_storage.stream.seek(0)
+        return None
+    if frames is None:
+        return pd.DataFrame(), iter(())
+    first = _coerce_text_df(next(frames))
+    return first, (_coerce_text_df(df) for df in frames)
+
 
-def _left_enrich(base: pd.DataFrame, data: pd.DataFrame, keys: list[str], suffix="__D") -> pd.DataFrame:
+def _key_positions(base_keys: list, data_keys: list) -> np.ndarray:
+    """موضع أول صف في data له نفس المفتاح المُطبّع لكل صف في base (-1 عند عدم التطابق).
+    خريطة المفتاح → الموضع تُبنى مرة واحدة من المفاتيح المميزة لـ data (hash join)."""
+    if len(data_keys) == 1:
+        didx, bidx = pd.Index(data_keys[0], dtype=object), pd.Index(base_keys[0], dtype=object)
+    else:
+        didx, bidx = pd.MultiIndex.from_arrays(data_keys), pd.MultiIndex.from_arrays(base_keys)
+    first = ~didx.duplicated(keep="first")
+    hit = didx[first].get_indexer(bidx)
+    return np.where(hit >= 0, np.flatnonzero(first)[hit], -1)
+
+def _left_enrich(base: pd.DataFrame, data: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    """إثراء base بأعمدة data (left join على المفاتيح المُطبّعة، أول صف لكل مفتاح في data).
+    - الأعمدة الجديدة تُجمع بمواضع الصفوف المطابقة، والأعمدة المشتركة تُملأ خلاياها الفارغة فقط (أقنعة numpy).
+    - باقي أعمدة base تُستخدم كما هي بدون نسخ، وأعمدة المفاتيح تخرج مُطبّعة كما في الدمج السابق.
+    الجداول النظيفة لا يُعاد تنظيفها، والناتج نظيف ومعلّم.
+    """
     if data is None or data.empty: 
         return base.copy()
     if not keys:
         return base.copy()
 
-    # 1. التنظيف وتوحيد المفاتيح
-    baseN  = _normalize_key_cols(base, keys)
-    dataN  = _normalize_key_cols(data, keys)
-
-    # 2. إزالة التكرارات من بيانات الإثراء
-    dataN = dataN.drop_duplicates(subset=keys, keep="first")
-
-    # 3. قائمة الأعمدة غير المفتاحية في بيانات الإثراء
-    enrich_cols = [c for c in dataN.columns if c not in keys]
-
-    # 4. دمج الـ DataFrame (سيعطي أسماء أعمدة بلاحقة __D للأعمدة المكررة غير المفتاحية)
-    merged = baseN.merge(dataN, how="left", on=keys, suffixes=("", suffix), copy=True)
-    
-    # 5. دمج البيانات من الأعمدة ذات اللاحقة (Enrichment) إلى الأعمدة الأساسية (Base) إذا كانت فارغة
-    for col in enrich_cols:
-        col_with_suffix = f"{col}{suffix}"
-        if col_with_suffix in merged.columns and col in merged.columns:
-            lvals = merged[col].astype(str).map(_textify)
-            rvals = merged[col_with_suffix].astype(str).map(_textify)
-            
-            merged[col] = lvals.where(lvals != "", rvals)
-            
-            merged.drop(columns=[col_with_suffix], inplace=True)
-        elif col_with_suffix in merged.columns and col not in merged.columns:
-             merged.rename(columns={col_with_suffix: col}, inplace=True)
-
-    # 6. إزالة أي أعمدة مكررة قد تكون بقيت (مثلاً إذا كان اسم العمود في BaseN مكررًا أصلاً)
-    return _coerce_text_df(merged)
+    # 1. التنظيف (بلا عمل للجداول المعلّمة) وتوحيد المفاتيح
+    base, data = _coerce_text_df(base), _coerce_text_df(data)
+    n = len(base)
+
+    def _norm(df, k):
+        if k not in df.columns:
+            return np.full(len(df), "", dtype=object)
+        return norm_keys.norm_key_array(df[k].to_numpy(dtype=object))
+    base_keys = [_norm(base, k) for k in keys]
+
+    # 2. موضع صف الإثراء لكل صف أساسي
+    pos = _key_positions(base_keys, [_norm(data, k) for k in keys])
+    matched = pos >= 0
+    take = pos[matched]
+
+    # 3. بناء الأعمدة: الأساسية كما هي، المفاتيح مُطبّعة، المشتركة تُملأ فراغاتها، الجديدة في النهاية
+    key_set = set(keys)
+    enrich_cols = [c for c in data.columns if c not in key_set]
+    enrich_set = set(enrich_cols)
+    columns = {}
+    for c in list(base.columns) + [k for k in keys if k not in base.columns]:
+        if c in key_set:
+            columns[c] = text_clean.textify_array(base_keys[keys.index(c)], "reports")
+            continue
+        col = base[c].to_numpy(dtype=object)
+        if c in enrich_set:
+            fill = matched & (col == "")
+            if fill.any():
+                col = col.copy()
+                col[fill] = data[c].to_numpy(dtype=object)[pos[fill]]
+        columns[c] = col
+    for c in enrich_cols:
+        if c not in columns:
+            col = np.full(n, "", dtype=object)
+            col[matched] = data[c].to_numpy(dtype=object)[take]
+            columns[c] = col
+
+    out = pd.DataFrame(columns, index=pd.RangeIndex(n), copy=False)
+    return text_clean.mark_clean(out, "reports")
 
 def _append_unmatched(base: pd.DataFrame, data: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    """إلحاق صفوف data التي لا يوجد مفتاحها المُطبّع في base (anti-join بعضوية المفاتيح عبر فهرس، بدون حلقة صفوف).
+    الصفوف المُلحقة تأخذ مفاتيحها مُطبّعة، والأعمدة غير الموجودة في أحد الجدولين تُملأ بـ "".
+    """
     if data is None or data.empty or not keys:
         return base.copy()
 
-    baseK = _normalize_key_cols(base, keys)
-    dataK = _normalize_key_cols(data, keys)
+    base, data = _coerce_text_df(base), _coerce_text_df(data)
 
-    base_keys = set(tuple(row) for row in baseK[keys].itertuples(index=False, name=None))
-    data_only = dataK[~dataK[keys].apply(lambda r: tuple(r) in base_keys, axis=1)]
+    def _norm(df, k):
+        if k not in df.columns:
+            return np.full(len(df), "", dtype=object)
+        return norm_keys.norm_key_array(df[k].to_numpy(dtype=object))
+    data_keys = [_norm(data, k) for k in keys]
 
-    if data_only.empty:
+    only = np.flatnonzero(_key_positions(data_keys, [_norm(base, k) for k in keys]) < 0)
+    if len(only) == 0:
         return base.copy()
 
-    union_cols = list(dict.fromkeys(list(base.columns) + [c for c in data_only.columns if c not in base.columns]))
-    out = pd.concat([
-        base.reindex(columns=union_cols),
-        data_only.reindex(columns=union_cols)
-    ], ignore_index=True)
+    union_cols = list(dict.fromkeys(list(base.columns) + [c for c in data.columns if c not in base.columns]
+                                    + [k for k in keys if k not in base.columns and k not in data.columns]))
+    columns = {}
+    for c in union_cols:
+        top = base[c].to_numpy(dtype=object) if c in base.columns else np.full(len(base), "", dtype=object)
+        if c in keys:
+            bottom = text_clean.textify_array(data_keys[keys.index(c)][only], "reports")
+        elif c in data.columns:
+            bottom = data[c].to_numpy(dtype=object)[only]
+        else:
+            bottom = np.full(len(only), "", dtype=object)
+        columns[c] = np.concatenate([top, bottom])
+
+    out = pd.DataFrame(columns, index=pd.RangeIndex(len(base) + len(only)), copy=False)
+    return text_clean.mark_clean(out, "reports")
 
-    return _coerce_text_df(out)
-    
 def _apply_standard_transformations(df: pd.DataFrame) -> pd.DataFrame:
     """
     تطبيق التحويلات القياسية المطلوبة على الأعمدة مباشرة بعد الاستيراد والدمج.
@@ -2393,7 +2905,8 @@ def _apply_standard_transformations(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
         return df
 
-    out = df.copy()
+    # القيم المحوّلة نظيفة أصلاً (ناتج _textify أو رئيسية/فرعية)، فتبقى علامة النظافة مع النسخة
+    out = text_clean.copy_frame(df, "standard_transformations")
     target_col = 'ماكينة رئيسية/فرعية' 
 
     if target_col in out.columns:
@@ -2415,12 +2928,16 @@ def _apply_standard_transformations(df: pd.DataFrame) -> pd.DataFrame:
         
     return out
 
-def _merge_all(files: list[pd.DataFrame], category: str) -> pd.DataFrame:
+def _merge_all(files: list[pd.DataFrame], category: str, append_unmatched: bool = False) -> pd.DataFrame:
+    """دمج ملفات القسم على ملف الأساس (left join).
+    append_unmatched: إلحاق كيانات ملفات 2–4 غير الموجودة في الأساس كصفوف جديدة بعد إثرائه.
+    """
     # لا تقم بتصفية القوائم للحفاظ على ترتيب الملفات (1..6)
     if not files or files[0] is None or files[0].empty:
         return pd.DataFrame()
 
-    base = files[0].copy()
+    # لا حاجة لنسخة: _left_enrich لا يعدّل مدخلاته ويبني جدولاً جديداً
+    base = files[0]
     
     def _has_keys(df: pd.DataFrame, keys: list[str]) -> bool:
         return keys and all(k in df.columns for k in keys)
@@ -2432,7 +2949,9 @@ def _merge_all(files: list[pd.DataFrame], category: str) -> pd.DataFrame:
             if df is not None and not df.empty:
                 keys = _pick_entity_keys(category, [base, df])
                 if _has_keys(base, keys) and _has_keys(df, keys):
-                    base = _left_enrich(base, df, keys, suffix=f"__D{idx+1}")
+                    base = _left_enrich(base, df, keys)
+                    if append_unmatched:
+                        base = _append_unmatched(base, df, keys)
 
     # الملفات 5، 6 — دمج بمفاتيح الإدارة/المكتب بمرادفات مرنة
     for idx in [4, 5]:
@@ -2441,7 +2960,7 @@ def _merge_all(files: list[pd.DataFrame], category: str) -> pd.DataFrame:
             if df is not None and not df.empty:
                 keys = _pick_office_keys([base, df])
                 if _has_keys(base, keys) and _has_keys(df, keys):
-                    base = _left_enrich(base, df, keys, suffix=f"__D{idx+1}")
+                    base = _left_enrich(base, df, keys)
 
     # تطبيق التحويلات القياسية بعد الدمج
     base = _apply_standard_transformations(base)
@@ -2458,12 +2977,49 @@ def _mapping_signature(mapping: dict) -> str:
     except Exception:
         return str(len(mapping or {}))
 
-def _build_inquiry_cache(category: str):
-    """إنشاء/تحديث كاش الاستعلام لفئة معينة: DataFrame بعد المابنج + فهارس للبحث."""
-    row = _load_state(category)
-    df = _json_to_df(row.data_json) if (row and row.data_json) else pd.DataFrame()
+def _shared_index_dir():
+    """مجلد الفهارس المشتركة بين الـ workers (INQUIRY_INDEX_DIR أو instance/inquiry_index)؛ None عند التعطيل."""
+    if os.environ.get("INQUIRY_SHARED_INDEX", "1") == "0":
+        return None
+    path = os.environ.get("INQUIRY_INDEX_DIR") or os.path.join(current_app.instance_path, "inquiry_index")
+    try:
+        os.makedirs(path, exist_ok=True)
+    except OSError:
+        return None
+    return path
+
+def _build_inquiry_cache(category: str, row=None):
+    """إنشاء/تحديث كاش الاستعلام لفئة معينة: DataFrame بعد المابنج + فهارس للبحث.
+    يُبنى كل شيء في متغيرات محلية ثم يُستبدل المدخل دفعة واحدة، فيستمر الكاش السابق في الخدمة أثناء البناء.
+    عند توفر مجلد مشترك يُنشر الإصدار مرة واحدة على القرص وتفتحه كل الـ workers بـ mmap.
+    """
+    if row is None:
+        row = _load_state(category)
     mapping = json.loads(row.mapping_json) if (row and row.mapping_json) else {}
-    mapped_df = _apply_mapping(df, mapping)
+    sig = _mapping_signature(mapping)
+
+    entry = None
+    base_dir = _shared_index_dir() if _row_has_data(row) else None
+    if base_dir:
+        version = shared_index.version_name(row.id, row.updated_at, sig)
+        try:
+            entry = shared_index.load_or_build(base_dir, category, version, lambda: _compute_inquiry_entry(row, mapping))
+        except Exception:
+            current_app.logger.exception(f"[InquiryIndex] shared index unavailable for {category}")
+    if entry is None:
+        entry = _compute_inquiry_entry(row, mapping)
+
+    entry.update({
+        'state_id': getattr(row, 'id', None),
+        'updated_at': getattr(row, 'updated_at', None),
+        'mapping_signature': sig,
+    })
+    INQUIRY_CACHE[category] = entry
+    return entry
+
+def _compute_inquiry_entry(row, mapping: dict) -> dict:
+    """بناء الجدول بعد المابنج + الفهارس في الذاكرة: {'df', 'indexes', 'cols'}."""
+    mapped_df = _row_to_mapped_df(row, mapping) if _row_has_data(row) else pd.DataFrame()
     mapped_df = _drop_empty_columns(mapped_df)
 
     indexes = {
@@ -2508,84 +3064,72 @@ def _build_inquiry_cache(category: str):
     if not name_cols:
         name_cols = [c for c in all_cols if 'اسم' in str(c)]
 
-    # بناء الفهارس: قيمة مُطبّعة → قائمة فهارس صفوف
-    for idx, r in mapped_df.iterrows():
-        try:
-            # code
-            for c in code_cols:
-                v = _textify(r.get(c))
-                if v:
-                    k = _norm_key_text(v)
-                    if k:
-                        indexes['code'].setdefault(k, []).append(idx)
-                        # بادئة 3 و5
-                        if len(k) >= 3:
-                            p3 = k[:3]; indexes['code_prefix3'].setdefault(p3, []).append(idx)
-                            s3 = k[-3:]; indexes['code_suffix3'].setdefault(s3, []).append(idx)
-                        if len(k) >= 5:
-                            p5 = k[:5]; indexes['code_prefix5'].setdefault(p5, []).append(idx)
-                            s5 = k[-5:]; indexes['code_suffix5'].setdefault(s5, []).append(idx)
-            # serial
-            for c in serial_cols:
-                v = _textify(r.get(c))
-                if v:
-                    k = _norm_key_text(v)
-                    if k:
-                        indexes['serial'].setdefault(k, []).append(idx)
-                        if len(k) >= 3:
-                            p3 = k[:3]; indexes['serial_prefix3'].setdefault(p3, []).append(idx)
-                        if len(k) >= 5:
-                            p5 = k[:5]; indexes['serial_prefix5'].setdefault(p5, []).append(idx)
-            # machine_code
-            for c in machine_code_cols:
-                v = _textify(r.get(c))
-                if v:
-                    k = _norm_key_text(v)
-                    if k:
-                        indexes['machine_code'].setdefault(k, []).append(idx)
-                        if len(k) >= 3:
-                            p3 = k[:3]; indexes['machine_code_prefix3'].setdefault(p3, []).append(idx)
-                        if len(k) >= 5:
-                            p5 = k[:5]; indexes['machine_code_prefix5'].setdefault(p5, []).append(idx)
-            # name
-            for c in name_cols:
-                v = _textify(r.get(c))
-                if v:
-                    k = _norm_key_text(v)
-                    if k:
-                        indexes['name'].setdefault(k, []).append(idx)
-                        # فهرسة كلمات الاسم
-                        tokens = [t for t in k.split(' ') if t]
-                        for t in tokens:
-                            indexes['name_token'].setdefault(t, []).append(idx)
-                            if len(t) >= 3:
-                                pt3 = t[:3]; indexes['name_token_prefix3'].setdefault(pt3, []).append(idx)
-                            if len(t) >= 5:
-                                pt5 = t[:5]; indexes['name_token_prefix5'].setdefault(pt5, []).append(idx)
-        except Exception:
-            # نتجاهل أي صف يسبب خطأ في التطبيع/الفهرسة
-            pass
+    # بناء الفهارس: قيمة مُطبّعة → مواضع صفوف (int32)؛ أعمدة الظل المحفوظة تُستخدم مباشرة، والباقي يُطبّع مرة واحدة
+    positions = np.arange(len(mapped_df), dtype=np.int32)
+    shadow = _row_shadow(row, mapping) if not mapped_df.empty else None
+
+    def _column_keys(cols):
+        keys, pos = [], []
+        for c in cols:
+            k = _key_array(mapped_df, c, shadow)
+            m = k != ""
+            keys.append(k[m]); pos.append(positions[m])
+        if not keys:
+            return np.empty(0, dtype=object), positions[:0]
+        return np.concatenate(keys), np.concatenate(pos)
+
+    def _with_affixes(name, keys, pos, prefixes=(3, 5), suffixes=()):
+        indexes[name] = PostingIndex.build(keys, pos)
+        lengths = key_lengths(keys)
+        for n in prefixes:
+            indexes[f'{name}_prefix{n}'] = PostingIndex.build(*affix_keys(keys, pos, n, lengths=lengths))
+        for n in suffixes:
+            indexes[f'{name}_suffix{n}'] = PostingIndex.build(*affix_keys(keys, pos, n, suffix=True, lengths=lengths))
+
+    # فهارس البحث الجزئي (trigram) للأكواد والمسلسلات وأكواد الماكينات
+    for name, cols in (('code', code_cols), ('serial', serial_cols), ('machine_code', machine_code_cols)):
+        keys, pos = _column_keys(cols)
+        _with_affixes(name, keys, pos, suffixes=((3, 5) if name == 'code' else ()))
+        indexes[f'{name}_substr'] = SubstringIndex.build(cols, keys, pos)
+
+    name_keys, name_pos = _column_keys(name_cols)
+    indexes['name'] = PostingIndex.build(name_keys, name_pos)
+    # فهرسة كلمات الاسم
+    _with_affixes('name_token', *split_tokens(name_keys, name_pos))
 
-    INQUIRY_CACHE[category] = {
+    return {
         'df': mapped_df,
         'indexes': indexes,
-        'state_id': getattr(row, 'id', None),
-        'updated_at': getattr(row, 'updated_at', None),
-        'mapping_signature': _mapping_signature(mapping),
         'cols': all_cols,
     }
 
 def _get_inquiry_cache(category: str) -> dict:
-    """إرجاع كاش صالح؛ يعيد البناء إذا كان غير موجود أو قديم."""
-    row = _load_state(category)
-    if not row or not row.data_json:
+    """إرجاع كاش صالح؛ يعيد البناء إذا كان غير موجود أو قديم.
+    فحص الصلاحية يقرأ الإصدار فقط (_load_state_meta)، والبيانات لا تُحمّل إلا عند إعادة البناء.
+    إذا كان هناك كاش سابق لنفس السجل (إصدار أو مابنج أقدم) يُعاد فوراً وتُجدول إعادة البناء في الخلفية؛
+    كاش مبني من سجل آخر (مستخدم آخر بنفس القسم) لا يُعاد أبداً، بل يُبنى سجل المستخدم قبل الرد.
+    """
+    meta = _load_state_meta(category)
+    if not meta or not meta['has_data']:
         return {'df': pd.DataFrame(), 'indexes': {'code':{},'serial':{},'name':{},'machine_code':{}}, 'cols': []}
-    mapping = json.loads(row.mapping_json) if (row and row.mapping_json) else {}
+    mapping = json.loads(meta['mapping_json']) if meta['mapping_json'] else {}
     sig = _mapping_signature(mapping)
+
+    def _is_current(c):
+        return bool(c) and c.get('state_id') == meta['id'] and c.get('updated_at') == meta['updated_at'] and c.get('mapping_signature') == sig
+
     cached = INQUIRY_CACHE.get(category)
-    if (not cached) or (cached.get('state_id') != getattr(row, 'id', None)) or (cached.get('updated_at') != getattr(row, 'updated_at', None)) or (cached.get('mapping_signature') != sig):
-        _build_inquiry_cache(category)
-        cached = INQUIRY_CACHE.get(category)
+    if not _is_current(cached):
+        if cached is not None and cached.get('state_id') == meta['id'] and not cached['df'].empty:
+            schedule_inquiry_rebuild(category, state_id=meta['id'])
+        else:
+            # لا يوجد كاش صالح للخدمة: انتظر بناءً جارياً في الخلفية إن وُجد، وإلا ابنِ الآن
+            pending = _INDEX_BUILDING.get(category)
+            if pending is not None:
+                pending.wait(timeout=_INDEX_WAIT_SECONDS)
+                cached = INQUIRY_CACHE.get(category)
+            if not _is_current(cached):
+                cached = _build_inquiry_cache(category)
     return cached or {
         'df': pd.DataFrame(),
         'indexes': {
@@ -2600,7 +3144,103 @@ def _get_inquiry_cache(category: str) -> dict:
     }
 
 def _invalidate_inquiry_cache(category: str):
+    """جدولة إعادة بناء فهارس القسم في الخلفية (الكاش الحالي يبقى في الخدمة حتى يجهز الجديد)."""
     try:
-        INQUIRY_CACHE.pop(category, None)
+        row = _load_state(category)
+        schedule_inquiry_rebuild(category, state_id=getattr(row, 'id', None))
     except Exception:
-        pass
\ No newline at end of file
+        INQUIRY_CACHE.pop(category, None)
+
+
+# ==================== (1.b) بناء الفهارس في الخلفية ====================
+# حالة البناء لكل قسم (تُعرض في /reports/api/inquiry_index/status)
+INQUIRY_INDEX_STATUS: dict[str, dict] = {}
+# أحداث البناء الجاري لكل قسم (ينتظرها الطلب الذي لا يجد كاشاً صالحاً)
+_INDEX_BUILDING: dict[str, threading.Event] = {}
+# الأقسام المنتظرة: category -> (app, state_id)
+_INDEX_PENDING: dict[str, tuple] = {}
+_INDEX_LOCK = threading.Lock()
+_INDEX_WAKE = threading.Event()
+_INDEX_WORKER: threading.Thread | None = None
+_INDEX_WAIT_SECONDS = 120
+
+def schedule_inquiry_rebuild(category: str, app=None, state_id=None):
+    """إضافة قسم لطابور إعادة البناء (طلب واحد معلّق لكل قسم)."""
+    global _INDEX_WORKER
+    app = app or current_app._get_current_object()
+    with _INDEX_LOCK:
+        _INDEX_PENDING[category] = (app, state_id)
+        if category not in _INDEX_BUILDING:
+            _INDEX_BUILDING[category] = threading.Event()
+        st = INQUIRY_INDEX_STATUS.setdefault(category, {})
+        if st.get('status') != 'building':
+            st['status'] = 'queued'
+        st['queued_at'] = datetime.utcnow().isoformat(timespec='seconds')
+        if _INDEX_WORKER is None or not _INDEX_WORKER.is_alive():
+            _INDEX_WORKER = threading.Thread(target=_inquiry_index_worker, name='inquiry-index-builder', daemon=True)
+            _INDEX_WORKER.start()
+    _INDEX_WAKE.set()
+
+def warm_inquiry_indexes(app, categories=None):
+    """بناء فهارس كل الأقسام في الخلفية عند بدء التطبيق."""
+    for category in (categories or CATEGORIES):
+        schedule_inquiry_rebuild(category, app=app)
+
+def _inquiry_index_worker():
+    while True:
+        _INDEX_WAKE.wait()
+        with _INDEX_LOCK:
+            if not _INDEX_PENDING:
+                _INDEX_WAKE.clear()
+                continue
+            category, (app, state_id) = next(iter(_INDEX_PENDING.items()))
+            del _INDEX_PENDING[category]
+            INQUIRY_INDEX_STATUS.setdefault(category, {})['status'] = 'building'
+        _run_index_build(app, category, state_id)
+
+def _run_index_build(app, category: str, state_id=None):
+    st = INQUIRY_INDEX_STATUS.setdefault(category, {})
+    st.update(started_at=datetime.utcnow().isoformat(timespec='seconds'), error=None)
+    t0 = perf_counter()
+    try:
+        with app.app_context():
+            row = db.session.get(ReportState, state_id) if state_id else (
+                ReportState.query.filter(ReportState.category == category).order_by(ReportState.id.desc()).first())
+            if _row_has_data(row):
+                _build_inquiry_cache(category, row=row)
+                cached = INQUIRY_CACHE.get(category) or {}
+                st.update(status='ready', rows=int(len(cached.get('df', ()))), state_id=getattr(row, 'id', None))
+            else:
+                st.update(status='empty', rows=0, state_id=getattr(row, 'id', None))
+    except Exception as ex:
+        st.update(status='failed', error=str(ex))
+        try:
+            app.logger.exception(f"[InquiryIndex] build failed for {category}")
+        except Exception:
+            pass
+    finally:
+        st.update(duration_ms=round((perf_counter() - t0) * 1000, 1),
+                  finished_at=datetime.utcnow().isoformat(timespec='seconds'))
+        with _INDEX_LOCK:
+            if category in _INDEX_PENDING:
+                st['status'] = 'queued'
+            else:
+                ev = _INDEX_BUILDING.pop(category, None)
+                if ev is not None:
+                    ev.set()
+
+
+@machine_reports_bp.route('/api/inquiry_index/status', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def api_inquiry_index_status():
+    """حالة بناء فهارس الاستعلام لكل قسم (للأدمن)."""
+    out = {}
+    for category in CATEGORIES:
+        st = dict(INQUIRY_INDEX_STATUS.get(category) or {'status': 'idle'})
+        cached = INQUIRY_CACHE.get(category)
+        st['cached_rows'] = int(len(cached['df'])) if cached else 0
+        st['cached_state_id'] = cached.get('state_id') if cached else None
+        st['cached_updated_at'] = cached['updated_at'].isoformat(timespec='seconds') if (cached and cached.get('updated_at')) else None
+        out[category] = st
+    return jsonify({'success': True, 'categories': out, 'frame_cache': FRAME_CACHE.stats()})
\ No newline at end of file
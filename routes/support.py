@@ -1,9 +1,12 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from models import db, SupportCase, User
+from utils import text_clean, column_profile, table_export
+from utils.filter_cache import FILTER_CACHE
+from sqlalchemy import event, func
+import numpy as np
 import pandas as pd
-import io, re, os
-from decimal import Decimal, InvalidOperation
+import re, os
 from datetime import datetime, timedelta
 
 support_bp = Blueprint("support_bp", __name__, url_prefix="/support")
@@ -83,54 +86,26 @@ def _to_local_display(utc_dt_or_str):
     return local_dt.strftime("%Y-%m-%d %H:%M")
 
 # رموز تُعتبر "قيمة فارغة" لنعومتها من العرض/التصدير
-_EMPTY_TOKENS = {"nan", "none", "null", "na", "n/a", "nat", "-", "—"}
+_EMPTY_TOKENS = text_clean.EMPTY_TOKENS
+# أعمدة التصدير الزمنية (تُصدّر كتاريخ/وقت في Excel)
+_DATETIME_EXPORT_COLS = ("وقت التذكير", "تاريخ التسجيل")
 
 def _textify(v) -> str:
-    # 💥 استثناء خاص لـ "وقت التذكير" لضمان ظهوره كنص كامل
-    if v is None:
-        return ""
-    if isinstance(v, datetime):
-        return v.strftime("%Y-%m-%d %H:%M") 
-    t = str(v).strip()
-    if t == "" or t.lower() in _EMPTY_TOKENS:
-        return ""
-    t = t.replace(",", "")
-    if re.fullmatch(r"\d+", t):
-        return t
-    if re.fullmatch(r"\d+\.\d+", t):
-        # تم الإبقاء على هذا المنطق لحذف الأجزاء العشرية (كما كان)
-        return t.split(".", 1)[0]
-    if re.fullmatch(r"[0-9]+(\.[0-9]+)?[eE][+\-]?[0-9]+", t):
-        try:
-            # تم الإبقاء على هذا المنطق لحذف الأجزاء العشرية (كما كان)
-            return str(Decimal(t).to_integral_value(rounding="ROUND_DOWN"))
-        except InvalidOperation:
-            return ""
-    return t
+    # 💥 "وقت التذكير" وأي تاريخ آخر يظهر كنص كامل (التاريخ والوقت) — انظر utils/text_clean.py
+    return text_clean.textify_support(v)
 
 def _df_text(df: pd.DataFrame) -> pd.DataFrame:
     if df is None or df.empty:
         return pd.DataFrame()
-    out = df.copy()
-    for c in out.columns:
-        out[c] = out[c].map(_textify)
-    out.columns = [str(c).strip().replace("\n"," ").replace("\r"," ") for c in out.columns]
+    out = text_clean.coerce_text_frame(df, "support")
+    out.columns = text_clean.clean_columns(out.columns)
     return out
 
 def _drop_empty_columns(df: pd.DataFrame) -> pd.DataFrame:
     """إزالة الأعمدة التي لا تحتوي إلا على قيم فارغة أو رموز تعتبر فارغة."""
     if df is None or df.empty:
         return df
-
-    def _is_empty_series(s: pd.Series) -> bool:
-        # نحول القيم إلى نصوص لضمان تطبيق التحقق على رموز "الفارغ" النصية
-        vals = s.fillna("").astype(str).str.strip().str.lower()
-        return ((vals == "") | (vals.isin(_EMPTY_TOKENS))).all()
-    
-    # تحديد الأعمدة التي يجب الإبقاء عليها (غير الفارغة بالكامل)
-    cols_to_keep = [c for c in df.columns if not _is_empty_series(df[c])]
-
-    return df[cols_to_keep]
+    return df[column_profile.nonempty_columns(df)]
 
 def _filter_dataframe(df: pd.DataFrame, q: str, search_in: str | None) -> pd.DataFrame:
     if not q:
@@ -149,98 +124,64 @@ def _paginate(df: pd.DataFrame, page: int, page_size: int):
     end = start + page_size
     return df.iloc[start:end], n
 
-def _excel_response(out_df: pd.DataFrame, filename: str):
-    output = io.BytesIO()
+def _export_response(out_df: pd.DataFrame, basename: str, back_url: str):
+    """استجابة التصدير بالصيغة المطلوبة (?format=xlsx|csv|parquet، والافتراضي Excel) عبر utils/table_export."""
     try:
-        import xlsxwriter
-        with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-            sheet = "data"
-            out_df.to_excel(writer, index=False, sheet_name=sheet)
-            ws = writer.sheets[sheet]
-            book = writer.book
-            
-            # تنسيق التاريخ والوقت في Excel
-            # **يجب التأكد من أن الأعمدة التي تحتوي على التاريخ هي من نوع datetime قبل تصديرها هنا
-            date_time_format = book.add_format({'num_format': 'yyyy-mm-dd hh:mm', 'align': 'center', "valign": "vcenter", "border": 1})
-            
-            header_fmt = book.add_format({"bold": True, "bg_color": "#E2E8F0", "align": "center", "valign": "vcenter", "border": 1, "num_format": "@"})
-            cell_fmt = book.add_format({"align": "center", "valign": "vcenter", "border": 1, "num_format": "@"})
-            
-            for col_idx, col_name in enumerate(out_df.columns):
-                ws.write(0, col_idx, col_name, header_fmt)
-                
-                # تطبيق تنسيق التاريخ والوقت على الأعمدة المطلوبة
-                if col_name in ["وقت التذكير", "تاريخ التسجيل"]:
-                    ws.set_column(col_idx, col_idx, 20, date_time_format)
-                else:
-                    # تحديد عرض افتراضي مع تطبيق تنسيق نص عام بشكل صحيح
-                    ws.set_column(col_idx, col_idx, 20, cell_fmt)
-            
-            # تم إزالة التنسيق الشرطي العام الذي كان يفرض صيغة النص على كل الخلايا
-            # حتى لا يطغى على تنسيق التاريخ/الوقت للأعمدة الزمنية
-            
-            # تعديل عرض الأعمدة لتناسب المحتوى
-            for i, c in enumerate(out_df.columns):
-                series = out_df[c].astype(str)
-                w = min(max([len(str(c))] + [len(s) for s in series.tolist()]) + 2, 60)
-                ws.set_column(i, i, w)
-                
-            ws.freeze_panes(1, 0)
-        output.seek(0)
+        # الأعمدة الزمنية تُكتب كتاريخ/وقت (yyyy-mm-dd hh:mm) لا كنص
+        return table_export.export_response(out_df, basename, request.args.get("format", "xlsx"),
+                                            datetime_cols=_DATETIME_EXPORT_COLS)
     except ModuleNotFoundError:
-        # (فرع openpyxl) تطبيق تنسيق دقيق للتواريخ وعدم تحويلها إلى نص
-        from openpyxl.styles import Alignment, PatternFill, Font, Border, Side
-        from openpyxl.utils import get_column_letter
-        with pd.ExcelWriter(output, engine="openpyxl") as writer:
-            sheet = "data"
-            out_df.to_excel(writer, index=False, sheet_name=sheet)
-            ws = writer.sheets[sheet]
-
-            header_fill = PatternFill("solid", fgColor="E2E8F0")
-            header_font = Font(bold=True)
-            thin = Side(border_style="thin", color="CCCCCC")
-            border = Border(left=thin, right=thin, top=thin, bottom=thin)
-            center = Alignment(horizontal="center", vertical="center", wrap_text=False)
-
-            # الأعمدة الزمنية المطلوب تطبيق تنسيق التاريخ عليها
-            date_cols = {"وقت التذكير", "تاريخ التسجيل"}
-            col_name_by_idx = {idx+1: name for idx, name in enumerate(out_df.columns)}
-
-            # تنسيق رأس الجدول
-            for cell in ws[1]:
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = center
-                cell.border = border
-                # الرأس دائمًا نص
-                cell.number_format = "@"
-
-            # تنسيق خلايا البيانات مع تمييز أعمدة التاريخ
-            for row_idx, row in enumerate(ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=1, max_col=ws.max_column), start=2):
-                for col_idx, cell in enumerate(row, start=1):
-                    if cell.value in (None, ""):
-                        continue
-                    cell.alignment = center
-                    cell.border = border
-                    col_name = col_name_by_idx.get(col_idx)
-                    if col_name in date_cols:
-                        # تنسيق تاريخ/وقت قياسي: yyyy-mm-dd hh:mm
-                        cell.number_format = "yyyy-mm-dd hh:mm"
-                    else:
-                        cell.number_format = "@"
-
-            # ضبط العرض لكل عمود وفق المحتوى
-            for col_idx, col_name in enumerate(out_df.columns, start=1):
-                series = out_df[col_name].astype(str).tolist() if not out_df.empty else []
-                width = min(max([len(str(col_name))] + [len(s) for s in series]) + 2, 60) if series else len(str(col_name))
-                ws.column_dimensions[get_column_letter(col_idx)].width = width
-
-            ws.freeze_panes = "A2"
-        output.seek(0)
-    return send_file(output, as_attachment=True, download_name=filename,
-                     mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        flash("تصدير Parquet غير متاح على الخادم (يحتاج تثبيت مكتبة pyarrow).", "warning")
+        return redirect(back_url)
 
 # ========== عرض/بحث/تصدير ==========
+# 💥 تأكيد الأعمدة الأساسية وترتيبها (لضمان ظهورها)
+_INDEX_COLS = [
+    "الاسم","الكود","العمل المحقق","أعمال دعم عامة",
+    "اسم البريد المرسل","ملاحظات","رسالة التذكير",
+    "وقت التذكير", # 💥 هذا هو العمود الذي نريده
+    "Request Number","Bakery_Code","BANK_ID","BANK_ACC_NUMBER","BANK_ACC_NAME","National ID",
+    "تاريخ التسجيل", # 💥 هذا هو العمود الآخر الذي نريده
+    "أنشأه","ID"
+]
+
+def _case_row(r) -> dict:
+    """صف العرض لحالة دعم واحدة."""
+    return {
+        "الاسم": r.name or "",
+        "الكود": r.code or "",
+        "العمل المحقق": r.work_type or "",
+        "أعمال دعم عامة": r.work_type != "حسابات بنكية" and (r.work_detail or "") or "",
+        "اسم البريد المرسل": r.sender_email_name or "",
+        "ملاحظات": r.notes or "",
+        "رسالة التذكير": r.reminder_message or "",
+        # 💥 يتم العرض بالتوقيت المحلي (التاريخ والوقت يظهران الآن)
+        "وقت التذكير": _to_local_display(r.reminder_at),
+        "Request Number": r.bank_request_number or "",
+        "Bakery_Code": r.bank_bakery_code or "",
+        "BANK_ID": r.bank_id or "",
+        "BANK_ACC_NUMBER": r.bank_acc_number or "",
+        "BANK_ACC_NAME": r.bank_acc_name or "",
+        "National ID": r.bank_national_id or "",
+        # 💥 يتم العرض بالتوقيت المحلي (التاريخ والوقت يظهران الآن)
+        "تاريخ التسجيل": _to_local_display(r.created_at),
+        "أنشأه": (r.creator.username if r.creator else ""),
+        "ID": r.id
+    }
+
+def _cases_frame(cases) -> pd.DataFrame:
+    return _df_text(pd.DataFrame([_case_row(r) for r in cases]))
+
+# عداد تعديلات الحالات في هذه العملية (جزء من مفتاح كاش نتائج البحث): أي إضافة/تعديل/حذف يبطل النتائج المخزنة
+_cases_version = 0
+
+@event.listens_for(SupportCase, "after_insert")
+@event.listens_for(SupportCase, "after_update")
+@event.listens_for(SupportCase, "after_delete")
+def _bump_cases_version(mapper, connection, target):
+    global _cases_version
+    _cases_version += 1
+
 @support_bp.route("/", methods=["GET"])
 @login_required
 def index():
@@ -250,69 +191,46 @@ def index():
     page_size = request.args.get("page_size", 25, type=int)
     page_size = 10 if page_size < 10 else 1000 if page_size > 1000 else page_size
 
-    qry = SupportCase.query.order_by(SupportCase.id.desc())
-    if getattr(current_user, "role", None) != "admin":
+    is_admin = getattr(current_user, "role", None) == "admin"
+    qry = SupportCase.query
+    if not is_admin:
         qry = qry.filter(SupportCase.created_by == current_user.id)
-    rows = qry.all()
-
-    data = []
-    for r in rows:
-        row = {
-            "الاسم": r.name or "",
-            "الكود": r.code or "",
-            "العمل المحقق": r.work_type or "",
-            "أعمال دعم عامة": r.work_type != "حسابات بنكية" and (r.work_detail or "") or "",
-            "اسم البريد المرسل": r.sender_email_name or "",
-            "ملاحظات": r.notes or "",
-            "رسالة التذكير": r.reminder_message or "",
-            # 💥 يتم العرض بالتوقيت المحلي (التاريخ والوقت يظهران الآن)
-            "وقت التذكير": _to_local_display(r.reminder_at),
-            "Request Number": r.bank_request_number or "",
-            "Bakery_Code": r.bank_bakery_code or "",
-            "BANK_ID": r.bank_id or "",
-            "BANK_ACC_NUMBER": r.bank_acc_number or "",
-            "BANK_ACC_NAME": r.bank_acc_name or "",
-            "National ID": r.bank_national_id or "",
-            # 💥 يتم العرض بالتوقيت المحلي (التاريخ والوقت يظهران الآن)
-            "تاريخ التسجيل": _to_local_display(r.created_at),
-            "أنشأه": (r.creator.username if r.creator else ""),
-            "ID": r.id
-        }
-        data.append(row)
-
-    df = _df_text(pd.DataFrame(data))
-    if df.empty:
+    # إصدار الحالات الظاهرة من قاعدة البيانات (مشترك بين الـ workers): العدد وأكبر رقم (إضافة/حذف)
+    # وآخر updated_at (تعديل الحالة أو الملاحظات أو التذكير)، + عداد التعديلات في هذه العملية
+    count, max_id, last_update = qry.with_entities(func.count(SupportCase.id), func.max(SupportCase.id),
+                                                   func.max(SupportCase.updated_at)).first()
+    if not count:
         return render_template("support/index.html",
             title="الدعم الفني",
-            is_admin=(getattr(current_user, "role", None) == "admin"),
+            is_admin=is_admin,
             cols=[], rows=[], search_cols=[],
             q=q, search_in=search_in, page=page, page_size=page_size,
             pagination={"page": 1, "total_pages": 1},
             due_times=[]
         )
 
-    # 💥 تأكيد الأعمدة الأساسية وترتيبها (لضمان ظهورها)
-    cols_order = [
-        "الاسم","الكود","العمل المحقق","أعمال دعم عامة",
-        "اسم البريد المرسل","ملاحظات","رسالة التذكير",
-        "وقت التذكير", # 💥 هذا هو العمود الذي نريده
-        "Request Number","Bakery_Code","BANK_ID","BANK_ACC_NUMBER","BANK_ACC_NAME","National ID",
-        "تاريخ التسجيل", # 💥 هذا هو العمود الآخر الذي نريده
-        "أنشأه","ID"
-    ]
-    # التصفية على الأعمدة الموجودة فقط بالترتيب المطلوب
-    final_cols = [c for c in cols_order if c in df.columns]
-    
-    # 💥 التعديل الأهم: إزالة الأعمدة الفارغة فقط للمسح البصري ولكن إبقاء الأعمدة الرئيسية 
-    filtered = _filter_dataframe(df, q, search_in)
-    
-    # قائمة الأعمدة المعروضة للمستخدم (مع إخفاء ID)
-    display_cols = [c for c in final_cols if c != "ID"]
-    
-    # تطبيق التصفية على الإطار النهائي
-    visible_df = filtered[display_cols + ["ID"]].copy() 
+    def _compute():
+        df = _cases_frame(qry.order_by(SupportCase.id.desc()).all())
+        # التصفية على الأعمدة الموجودة فقط بالترتيب المطلوب
+        final_cols = [c for c in _INDEX_COLS if c in df.columns]
+        # 💥 التعديل الأهم: إزالة الأعمدة الفارغة فقط للمسح البصري ولكن إبقاء الأعمدة الرئيسية
+        filtered = _filter_dataframe(df, q, search_in)
+        # قائمة الأعمدة المعروضة للمستخدم (مع إخفاء ID)
+        display_cols = [c for c in final_cols if c != "ID"]
+        # تُخزن أرقام الحالات المطابقة بالترتيب (لا مواضع الصفوف) وتُجلب حالات الصفحة فقط عند التنقل
+        ids = filtered["ID"].astype(int).to_numpy(dtype=np.int64)
+        return ids, display_cols, len(filtered)
+    key = FILTER_CACHE.make_key(f"support:{'all' if is_admin else current_user.id}",
+                                (count, max_id, last_update, _cases_version), q, search_in, current_user.id)
+    result = FILTER_CACHE.get_or_compute(key, _compute)
+    display_cols = result.columns
 
-    page_df, total = _paginate(visible_df, page, page_size)
+    start = max(0, (page - 1) * page_size)
+    page_ids = result.page(start, start + page_size).tolist()
+    by_id = {r.id: r for r in SupportCase.query.filter(SupportCase.id.in_(page_ids)).all()} if page_ids else {}
+    page_cases = [by_id[i] for i in page_ids if i in by_id]
+    page_df = _cases_frame(page_cases)[display_cols + ["ID"]] if page_cases else pd.DataFrame(columns=display_cols + ["ID"])
+    total = result.total
     total_pages = max(1, (total + page_size - 1)//page_size)
 
     cols = [c for c in page_df.columns if c != "ID"]
@@ -334,11 +252,11 @@ def index():
     due_times = [r.get("وقت التذكير", "") for r in rows if r.get("وقت التذكير", "")]
     return render_template("support/index.html",
         title="الدعم الفني",
-        is_admin=(getattr(current_user, "role", None) == "admin"),
+        is_admin=is_admin,
         # 💥 إرسال قائمة الأعمدة النهائية للمقارنة في index.html
         cols=cols, 
         rows=rows, 
-        search_cols=[c for c in visible_df.columns if c != "ID"],
+        search_cols=list(display_cols),
         q=q, search_in=search_in, page=page, page_size=page_size,
         pagination=pagination, due_times=due_times
     )
@@ -386,10 +304,9 @@ def export():
     
     # 💥 نقوم هنا بتحويل الأعمدة النصية فقط باستخدام _df_text
     # نحتفظ بأعمدة التاريخ كـ datetime object
-    cols_to_textify = [c for c in df.columns if c not in ["وقت التذكير", "تاريخ التسجيل"]]
+    cols_to_textify = [c for c in df.columns if c not in _DATETIME_EXPORT_COLS]
     # Apply _textify to the columns to be treated as text (this will remove decimal parts, etc.)
-    for c in cols_to_textify:
-        df[c] = df[c].map(_textify)
+    df = text_clean.coerce_text_frame(df, "support", columns=cols_to_textify)
 
     # 💥 تأكيد نوع الأعمدة الزمنية كـ datetime لضمان تطبيق تنسيق Excel بشكل صحيح
     if "وقت التذكير" in df.columns:
@@ -412,7 +329,7 @@ def export():
     if out.empty:
         flash("لا توجد بيانات لتصديرها.", "warning")
         return redirect(url_for("support_bp.index", q=q, search_in=search_in))
-    return _excel_response(out, "الدعم_الفني.xlsx")
+    return _export_response(out, "الدعم_الفني", url_for("support_bp.index", q=q, search_in=search_in))
 
 
 # صلاحيات
@@ -1,12 +1,16 @@
 # routes/trader_services.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, current_app, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
 from flask_login import login_required, current_user
 from utils.decorators import role_required, permission_required
 from models_reports import ReportState
 from models import db
+from utils import dataset_store, norm_keys, text_clean, import_jobs, column_profile, table_export
+from utils.frame_cache import FRAME_CACHE
+from utils.filter_cache import FILTER_CACHE, subset_positions
+from utils.export_cache import EXPORT_CACHE
+from utils import search_index
 import pandas as pd
-import json, io, re
-from decimal import Decimal, InvalidOperation
+import json, re, hashlib
 
 trader_services_bp = Blueprint("trader_services_bp", __name__)
 
@@ -51,7 +55,7 @@ DEFAULT_FREQUENT_ORDER = [
     '_الفترة'
 ]
 
-_EMPTY_TOKENS = {"nan", "none", "null", "na", "n/a", "nat", "-", "—"}
+_EMPTY_TOKENS = text_clean.EMPTY_TOKENS
 _DATE_RE_1 = re.compile(r"^(\d{4}[-/]\d{1,2}[-/]\d{1,2})[ T]\d{1,2}:\d{2}(?::\d{2})?$")
 _DATE_RE_2 = re.compile(r"^(\d{1,2}[-/]\d{1,2}[-/]\d{4})[ T]\d{1,2}:\d{2}(?::\d{2})?$")
 
@@ -63,17 +67,8 @@ def _strip_time_from_date(txt: str) -> str:
     return txt
 
 def _textify(v) -> str:
-    if v is None: return ""
-    t = str(v).strip()
-    if t == "" or t.lower() in _EMPTY_TOKENS: return ""
-    t = t.replace(",", "")
-    # عدم إزالة وقت التاريخ لضمان ظهور وقت الزيارة في الشاشات
-    if re.fullmatch(r"\d+", t): return t
-    if re.fullmatch(r"\d+\.\d+", t): return t.split(".", 1)[0]
-    if re.fullmatch(r"[0-9]+(\.[0-9]+)?[eE][+\-]?[0-9]+", t):
-        try: return str(Decimal(t).to_integral_value(rounding="ROUND_DOWN"))
-        except InvalidOperation: return ""
-    return t
+    """نص نظيف بدون أجزاء عشرية (انظر utils/text_clean.py)."""
+    return text_clean.textify_trader(v)
 
 def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     df = df.copy()
@@ -82,9 +77,9 @@ def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
 
 def _coerce_all_text_no_decimals(df: pd.DataFrame) -> pd.DataFrame:
     if df is None or df.empty: return pd.DataFrame()
-    out = df.copy()
-    for c in out.columns: out[c] = out[c].map(_textify)
-    return out
+    # جدول ناتج عن نفس التنظيف (أو نسخة منه): لا حاجة لتمريرة أخرى
+    if text_clean.is_clean(df, "trader"): return df
+    return text_clean.coerce_text_frame(df, "trader")
 
 def _read_excel(file_storage) -> pd.DataFrame:
     df = pd.read_excel(file_storage, engine="openpyxl", dtype=str)
@@ -98,28 +93,92 @@ def _df_to_json(df: pd.DataFrame) -> str:
 def _json_to_df(js: str) -> pd.DataFrame:
     return _coerce_all_text_no_decimals(pd.DataFrame(json.loads(js))) if js else pd.DataFrame()
 
+# اسم دالة التنظيف المسجّل مع البيانات في المخزن العمودي (انظر utils/dataset_store.py)
+_STORE_CLEANER = "trader"
+
+def _row_has_data(row) -> bool:
+    return dataset_store.has_data(row)
+
+def _decode_row(row) -> pd.DataFrame:
+    df, cleaner = dataset_store.load_frame(row)
+    if df is None:
+        return _json_to_df(row.data_json)
+    return text_clean.mark_clean(df, "trader") if cleaner == _STORE_CLEANER else _coerce_all_text_no_decimals(df)
+
+def _row_to_df(row) -> pd.DataFrame:
+    """تحميل بيانات السجل من المخزن العمودي (أو data_json القديم) بعد التنظيف، عبر FRAME_CACHE."""
+    if row is None:
+        return pd.DataFrame()
+    return FRAME_CACHE.get_or_load(row, lambda: _decode_row(row), variant=_STORE_CLEANER)
+
+def _mapping_signature(mapping: dict) -> str:
+    s = json.dumps(mapping or {}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(s.encode("utf-8")).hexdigest()
+
+def _row_to_mapped_df(row, mapping: dict, recent_program: bool = False, copy: bool = True) -> pd.DataFrame:
+    """بيانات السجل بعد (إسقاط أعمدة الحديثة عند الطلب ثم) تطبيق المابنج، مخزنة في FRAME_CACHE.
+    copy=False: الإطار المخزن نفسه للقراءة فقط (لا يُعدّل)."""
+    if row is None:
+        return pd.DataFrame()
+    def _load():
+        df = _row_to_df(row)
+        if recent_program:
+            df = _project_recent_program_columns(df)
+        return _apply_mapping(df, mapping)
+    variant = f"{_STORE_CLEANER}|{'recent' if recent_program else 'all'}|{_mapping_signature(mapping)}"
+    return FRAME_CACHE.get_or_load(row, _load, variant=variant, copy=copy)
+
+def _row_text_index(row, mapping: dict, df: pd.DataFrame, recent_program: bool = False):
+    """فهرس البحث في كل الأعمدة لـ df = _row_to_mapped_df(row, mapping, recent_program) (utils/search_index)."""
+    variant = f"{_STORE_CLEANER}|{'recent' if recent_program else 'all'}|{_mapping_signature(mapping)}"
+    return search_index.SEARCH_INDEX_CACHE.get_or_schedule(row, lambda: search_index.build(df), variant=variant)
+
+def _row_profile(row, mapping: dict, df: pd.DataFrame) -> dict | None:
+    """عدد الخلايا غير الفارغة لكل عمود من df = _row_to_mapped_df(row, mapping) كما حُسب عند الحفظ، أو None."""
+    counts, cleaner = dataset_store.load_profile(row)
+    if counts is None or cleaner != _STORE_CLEANER or not text_clean.is_clean(df, _STORE_CLEANER):
+        return None
+    return column_profile.mapped_counts(counts, (mapping or {}).get("rename"))
+
+def _store_df(row, df: pd.DataFrame) -> None:
+    # أعمدة الظل تُطبّع بنفس تنظيف شاشة الاستعلام (التي تقرأ بيانات التجار للمطابقة)
+    clean = _coerce_all_text_no_decimals(df)
+    dataset_store.save_frame(row, clean, cleaner=_STORE_CLEANER,
+                             shadow=norm_keys.build_shadow(clean, text_clean.textify_reports))
+    FRAME_CACHE.invalidate(row.category)
+    FILTER_CACHE.invalidate(row.category)
+    search_index.SEARCH_INDEX_CACHE.invalidate(row.category)
+    EXPORT_CACHE.invalidate(row.category)
+
 def _load_state(key: str):
     return ReportState.query.filter_by(category=key).first()
 
-def _save_state(key: str, df: pd.DataFrame=None, mapping: dict=None):
+def _save_state(key: str, df: pd.DataFrame=None, mapping: dict=None, user_id=None):
+    """user_id: منشئ السجل الجديد (الحالة مشتركة بالمفتاح؛ العمود مطلوب في الجدول). الافتراضي المستخدم الحالي."""
     row = _load_state(key)
     if not row:
-        row = ReportState(category=key); db.session.add(row)
-    if df is not None: row.data_json = _df_to_json(df)
+        if user_id is None:
+            user_id = current_user.id if getattr(current_user, "is_authenticated", False) else 0
+        row = ReportState(category=key, user_id=user_id); db.session.add(row)
+    if df is not None: _store_df(row, df)
     if mapping is not None: row.mapping_json = json.dumps(mapping, ensure_ascii=False)
     db.session.commit()
+    FRAME_CACHE.invalidate(key)
 
 def _apply_mapping(df: pd.DataFrame, mapping: dict) -> pd.DataFrame:
     if df is None or df.empty or not mapping:
         return df
     rename = mapping.get("rename") or {}
     order  = [c for c in (mapping.get("order") or []) if c]
-    out = df.copy()
-    if rename:
-        out = out.rename(columns=rename)
+    out = df.rename(columns=rename) if rename else df
     if order:
         front = [c for c in order if c in out.columns]
         out = out[front] if front else out
+    if out is df:
+        out = text_clean.copy_frame(df, "apply_mapping")
+    else:
+        text_clean.count_copy("apply_mapping")
+        text_clean.carry(df, out)
     return _coerce_all_text_no_decimals(out)
 
 def _enforce_frequent_default_order(df: pd.DataFrame) -> pd.DataFrame:
@@ -137,9 +196,27 @@ def _enforce_frequent_default_order(df: pd.DataFrame) -> pd.DataFrame:
     except Exception:
         return df
 
-def _filter_dataframe(df: pd.DataFrame, q: str, search_in: str | None) -> pd.DataFrame:
+def _with_recent_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """ضمان أعمدة شاشة المترددين (النوع، مكتب، الاذن) بنسخها من أول بديل موجود، على نسخة سطحية (لا يعدّل df)."""
+    out = df.copy(deep=False)
+    # النوع: نحاول من 'النوع' أو 'القسم' أو 'التوع'
+    if 'النوع' not in out.columns:
+        _src = next((c for c in ['النوع', 'القسم', 'التوع'] if c in out.columns), None)
+        out['النوع'] = out[_src] if _src else ''
+    # المكتب: من 'مكتب' أو 'المكتب'
+    if 'مكتب' not in out.columns:
+        _src = next((c for c in ['مكتب', 'المكتب'] if c in out.columns), None)
+        out['مكتب'] = out[_src] if _src else ''
+    # رقم الإذن: نثبت عمود 'الاذن' بقراءة أي بديل موجود
+    if 'الاذن' not in out.columns:
+        _src = next((c for c in ['الاذن', 'رقم الإذن', 'رقم الاذن', 'اذن'] if c in out.columns), None)
+        out['الاذن'] = out[_src] if _src else ''
+    return out
+
+def _filter_dataframe(df: pd.DataFrame, q: str, search_in: str | None, text_index=None) -> pd.DataFrame:
     """تصفية سريعة: في حالة البحث في كل الأعمدة، نبني نصًا مجمّعًا لكل صف مرة واحدة.
-    هذا يقلّل الحسابات مقارنةً بتطبيق البحث على كل عمود على حدة."""
+    هذا يقلّل الحسابات مقارنةً بتطبيق البحث على كل عمود على حدة.
+    text_index: دالة تعيد فهرس كل الأعمدة لهذا الجدول (_row_text_index) فيمر البحث الشامل به."""
     if not q:
         return df
     ql = (q or '').strip().lower()
@@ -151,6 +228,16 @@ def _filter_dataframe(df: pd.DataFrame, q: str, search_in: str | None) -> pd.Dat
         mask = df[search_in].astype(str).str.lower().str.contains(ql, na=False)
         return df[mask]
 
+    # بحث شامل عبر الفهرس: الفاصل "|" رمز نمطي فلا يصل استعلام يمتد عبر عمودين إلى الفهرس
+    if text_index is not None:
+        try:
+            pos = search_index.search(text_index(), ql)
+        except Exception:
+            current_app.logger.exception("[Search] text index failed; falling back to a full scan")
+            pos = None
+        if pos is not None:
+            return df.iloc[pos]
+
     # بحث شامل: تجميع صف واحد لنص واحد ثم contains
     try:
         cols = list(df.columns)
@@ -163,61 +250,35 @@ def _filter_dataframe(df: pd.DataFrame, q: str, search_in: str | None) -> pd.Dat
         mask = df.apply(lambda col: col.astype(str).str.lower().str.contains(ql, na=False))
         return df[mask.any(axis=1)]
 
-def _drop_empty_columns(df: pd.DataFrame) -> pd.DataFrame:
+def _drop_empty_columns(df: pd.DataFrame, counts: dict | None = None) -> pd.DataFrame:
+    """counts: عدد الخلايا غير الفارغة لكل عمود إن كان معروفاً لكل df (_row_profile) فلا تُمسح هذه الأعمدة."""
     if df is None or df.empty: return df
-    def _is_empty_series(s: pd.Series) -> bool:
-        vals = s.fillna("").astype(str).str.strip().str.lower()
-        return ((vals == "") | (vals.isin(_EMPTY_TOKENS))).all()
-    keep = [c for c in df.columns if not _is_empty_series(df[c])]
-    return df[keep]
+    return df[column_profile.nonempty_columns(df, counts)]
 
 def _paginate(df: pd.DataFrame, page: int, page_size: int):
     n = len(df); start = max(0, (page-1)*page_size); end = start + page_size
     return df.iloc[start:end], n
 
-def _excel_response(out_df: pd.DataFrame, filename: str):
-    output = io.BytesIO()
+def _cached_filter(row, mapping: dict, df: pd.DataFrame, q: str, search_in: str, compute):
+    """نتيجة البحث (مواضع الصفوف + الأعمدة الظاهرة) من FILTER_CACHE لكل (إصدار البيانات، q، search_in).
+    compute(): (positions, columns, total) كما في utils/filter_cache."""
+    key = FILTER_CACHE.make_key(f"{row.category}:{row.id}", (row.updated_at, _mapping_signature(mapping)),
+                                q, search_in, getattr(current_user, "id", None))
+    return FILTER_CACHE.get_or_compute(key, compute)
+
+def _export_key(row, mapping: dict, q: str, search_in: str, recent_program: bool = False):
+    """مفتاح كاش ملفات التصدير (utils/export_cache) لنفس (إصدار البيانات، المابنج، البحث، ?format=)."""
+    variant = f"{_STORE_CLEANER}|{'recent' if recent_program else 'all'}"
+    return EXPORT_CACHE.make_key(row, variant, _mapping_signature(mapping), q, search_in,
+                                 table_export.export_format(request.args.get("format")))
+
+def _export_response(out_df: pd.DataFrame, basename: str, back_url: str, key):
+    """استجابة التصدير بالصيغة المطلوبة (?format=xlsx|csv|parquet، والافتراضي Excel) وحفظها في كاش الملفات."""
     try:
-        import xlsxwriter
-        with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-            sheet = "data"; out_df.to_excel(writer, index=False, sheet_name=sheet)
-            ws = writer.sheets[sheet]; book = writer.book
-            header_fmt = book.add_format({"bold": True, "bg_color": "#E2E8F0", "align":"center", "valign":"vcenter", "border":1, "num_format":"@"})
-            cell_fmt   = book.add_format({"align":"center", "valign":"vcenter", "border":1, "num_format":"@"})
-            for col_idx, col_name in enumerate(out_df.columns): ws.write(0, col_idx, col_name, header_fmt)
-            n_rows, n_cols = len(out_df.index), len(out_df.columns)
-            if n_rows>0 and n_cols>0:
-                from xlsxwriter.utility import xl_rowcol_to_cell
-                start = xl_rowcol_to_cell(1,0); end = xl_rowcol_to_cell(n_rows, n_cols-1)
-                ws.conditional_format(f"{start}:{end}", {"type":"no_blanks", "format":cell_fmt})
-            for i, c in enumerate(out_df.columns):
-                series = out_df[c].astype(str)
-                w = min(max([len(str(c))] + [len(s) for s in series.tolist()]) + 2, 60)
-                ws.set_column(i, i, w)
-            ws.freeze_panes(1,0)
-        output.seek(0)
+        return EXPORT_CACHE.store(key, f"{basename}.{key[-1]}", out_df)
     except ModuleNotFoundError:
-        from openpyxl.styles import Alignment, PatternFill, Font, Border, Side
-        from openpyxl.utils import get_column_letter
-        with pd.ExcelWriter(output, engine="openpyxl") as writer:
-            sheet="data"; out_df.to_excel(writer, index=False, sheet_name=sheet); ws=writer.sheets[sheet]
-            header_fill = PatternFill("solid", fgColor="E2E8F0"); header_font=Font(bold=True)
-            thin = Side(border_style="thin", color="CCCCCC"); border = Border(left=thin,right=thin,top=thin,bottom=thin)
-            center = Alignment(horizontal="center", vertical="center", wrap_text=False)
-            for cell in ws[1]:
-                cell.fill=header_fill; cell.font=header_font; cell.alignment=center; cell.border=border; cell.number_format="@"
-            for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=1, max_col=ws.max_column):
-                for cell in row:
-                    if cell.value not in (None,""):
-                        cell.alignment=center; cell.border=border; cell.number_format="@"
-            for col_idx, col_name in enumerate(out_df.columns, start=1):
-                series = out_df[col_name].astype(str).tolist() if not out_df.empty else []
-                width  = min(max([len(str(col_name))]+[len(s) for s in series]) + 2, 60) if series else len(str(col_name))
-                ws.column_dimensions[get_column_letter(col_idx)].width = width
-            ws.freeze_panes = "A2"
-        output.seek(0)
-    return send_file(output, as_attachment=True, download_name=filename,
-                     mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        flash("تصدير Parquet غير متاح على الخادم (يحتاج تثبيت مكتبة pyarrow).", "warning")
+        return redirect(back_url)
 
 def _transform_fault_columns(df: pd.DataFrame) -> pd.DataFrame:
     """تحويل عمود 'نوع العطل' أو 'نوع الاعطال' إلى أعمدة منفصلة لكل نوع عطل مع القيم الافتراضية فارغة.''"""
@@ -364,10 +425,41 @@ def primary_import_post():
     f = request.files.get("file")
     if not f or not f.filename:
         flash("اختر ملف Excel.", "warning"); return redirect(url_for("trader_services_bp.primary_import_view"))
-    df = _read_excel(f)
-    _save_state("trader_primary", df=df)
-    flash(f"تم استيراد الملف. سجلات: {len(df)}", "success")
-    return redirect(url_for("trader_services_bp.primary_machines"))
+    job, files = import_jobs.create_job("trader_primary", "trader_primary", current_user.id, [("file", f)],
+                                        result_url=url_for("trader_services_bp.primary_machines"))
+    import_jobs.submit(job.id, _run_primary_import, current_user.id, files)
+    return _import_job_response(job.id)
+
+def _run_primary_import(ctx, user_id: int, files: list):
+    """مهمة استيراد الماكينات الأساسية في الخلفية (قراءة ← حفظ ← تجهيز بيانات الشاشة)."""
+    ctx.stage("read")
+    df = _read_job_file(files[0])
+    ctx.set_rows(len(df))
+    ctx.stage("store")
+    _save_state("trader_primary", df=df, user_id=user_id)
+    ctx.stage("index")
+    _warm_mapped_frame("trader_primary", "trader_primary:__mapping__")
+    return f"تم استيراد الملف. سجلات: {len(df)}", "success"
+
+def _import_job_response(job_id: int):
+    return import_jobs.job_response(job_id)
+
+def _read_job_file(item) -> pd.DataFrame:
+    _, filename, path = item
+    fs = import_jobs.open_upload(path, filename)
+    try:
+        return _read_excel(fs)
+    finally:
+        fs.close()
+
+def _warm_mapped_frame(key: str, mapping_key: str, recent_program: bool = False) -> None:
+    """تحميل بيانات الشاشة بعد المابنج في FRAME_CACHE حتى لا يدفع أول طلب بعد الاستيراد تكلفة فك الترميز."""
+    row = _load_state(key)
+    if not _row_has_data(row):
+        return
+    map_row = _load_state(mapping_key)
+    mapping = json.loads(map_row.mapping_json) if (map_row and map_row.mapping_json) else {}
+    _row_to_mapped_df(row, mapping, recent_program=recent_program)
 
 @trader_services_bp.route("/primary", methods=["GET"])
 @login_required
@@ -375,10 +467,10 @@ def primary_import_post():
 def primary_machines():
     is_admin = getattr(current_user, "role", None) == "admin"
     row = _load_state("trader_primary")
-    df = _json_to_df(row.data_json) if (row and row.data_json) else pd.DataFrame()
-
     map_row = _load_state("trader_primary:__mapping__")
     mapping = json.loads(map_row.mapping_json) if (map_row and map_row.mapping_json) else {}
+    # قراءة فقط: الصفحة تُقتطع بمواضع الصفوف بدون نسخ الجدول كاملاً
+    df = _row_to_mapped_df(row, mapping, copy=False) if _row_has_data(row) else pd.DataFrame()
 
     q = request.args.get("q","")
     search_in = request.args.get("search_in","all")
@@ -388,13 +480,16 @@ def primary_machines():
 
     total=0; total_pages=1
     if not df.empty:
-        mapped = _apply_mapping(df, mapping)
-        filtered = _filter_dataframe(mapped, q, search_in)
-        # إظهار كل الأعمدة طالما لم يبدأ البحث (q فارغ)، وعند البحث أسقط الأعمدة الفارغة
-        visible_filtered = filtered if not (q and q.strip()) else _drop_empty_columns(filtered)
-        page_df, total = _paginate(visible_filtered, page, page_size)
+        def _compute():
+            filtered = _filter_dataframe(df, q, search_in, text_index=lambda: _row_text_index(row, mapping, df))
+            # إظهار كل الأعمدة طالما لم يبدأ البحث (q فارغ)، وعند البحث أسقط الأعمدة الفارغة
+            visible_filtered = filtered if not (q and q.strip()) else _drop_empty_columns(filtered)
+            return subset_positions(df, filtered), list(visible_filtered.columns), len(filtered)
+        result = _cached_filter(row, mapping, df, q, search_in, _compute)
+        start = max(0, (page-1)*page_size)
+        page_df, total = df.iloc[result.page(start, start + page_size)][result.columns], result.total
         total_pages = max(1, (total + page_size - 1)//page_size)
-        search_cols = list(visible_filtered.columns)
+        search_cols = list(result.columns)
     else:
         search_cols = []
         page_df = pd.DataFrame()
@@ -447,21 +542,27 @@ def primary_save_mapping():
 @permission_required('can_trader_primary')
 def primary_export():
     row = _load_state("trader_primary")
-    if not row or not row.data_json:
+    if not _row_has_data(row):
         flash("لا توجد بيانات لتصديرها.", "warning")
         return redirect(url_for("trader_services_bp.primary_machines"))
     map_row = _load_state("trader_primary:__mapping__")
     mapping = json.loads(map_row.mapping_json) if (map_row and map_row.mapping_json) else {}
     q = request.args.get("q","")
     search_in = request.args.get("search_in","all")
-    out = _apply_mapping(_json_to_df(row.data_json), mapping)
-    out = _filter_dataframe(out, q, search_in)
-    out = _drop_empty_columns(out)
+    key = _export_key(row, mapping, q, search_in)
+    cached = EXPORT_CACHE.respond(key, f"الماكينات_الأساسية_وماكينات_الفرع.{key[-1]}")
+    if cached is not None:
+        return cached
+    # قراءة فقط: التصفية تُنتج إطاراً جديداً ولا تعدّل الإطار المخزن
+    mapped = _row_to_mapped_df(row, mapping, copy=False)
+    out = _filter_dataframe(mapped, q, search_in, text_index=lambda: _row_text_index(row, mapping, mapped))
+    out = _drop_empty_columns(out, _row_profile(row, mapping, mapped) if out is mapped else None)
     out = _coerce_all_text_no_decimals(out)
     if out.empty:
         flash("لا توجد بيانات لتصديرها.", "warning")
         return redirect(url_for("trader_services_bp.primary_machines"))
-    return _excel_response(out, "الماكينات_الأساسية_وماكينات_الفرع.xlsx")
+    return _export_response(out, "الماكينات_الأساسية_وماكينات_الفرع",
+                            url_for("trader_services_bp.primary_machines", q=q, search_in=search_in), key)
 
 
 # ======================== Frequent visitors (new screen) ========================
@@ -490,40 +591,31 @@ def frequent_visitors():
     row = _load_state("trader_frequent:recent_program")
     map_row = _load_state("trader_frequent:__mapping__")
     mapping = json.loads(map_row.mapping_json) if (map_row and map_row.mapping_json) else {}
-    df = _json_to_df(row.data_json) if (row and row.data_json) else pd.DataFrame()
-    df = _project_recent_program_columns(df)
-    df = _apply_mapping(df, mapping)
+    # قراءة فقط: الصفحة تُقتطع بمواضع الصفوف بدون نسخ الجدول كاملاً
+    df = _row_to_mapped_df(row, mapping, recent_program=True, copy=False) if _row_has_data(row) else pd.DataFrame()
     has_data = not df.empty
 
     if has_data:
-        filtered = _filter_dataframe(df, q, search_in)
-        # ضمان الأعمدة المطلوبة في تبويب البيانات الحديثة قبل إسقاط الأعمدة الفارغة
-        if tab == "recent":
-            # النوع: نحاول من 'النوع' أو 'القسم' أو 'التوع'
-            if 'النوع' not in filtered.columns:
-                _src = next((c for c in ['النوع', 'القسم', 'التوع'] if c in filtered.columns), None)
-                filtered['النوع'] = filtered[_src] if _src else ''
-            # المكتب: من 'مكتب' أو 'المكتب'
-            if 'مكتب' not in filtered.columns:
-                _src = next((c for c in ['مكتب', 'المكتب'] if c in filtered.columns), None)
-                filtered['مكتب'] = filtered[_src] if _src else ''
-            # رقم الإذن: نثبت عمود 'الاذن' بقراءة أي بديل موجود
-            if 'الاذن' not in filtered.columns:
-                _src = next((c for c in ['الاذن', 'رقم الإذن', 'رقم الاذن', 'اذن'] if c in filtered.columns), None)
-                filtered['الاذن'] = filtered[_src] if _src else ''
-
-        # إظهار كل الأعمدة طالما لم يبدأ البحث (q فارغ)، وعند البحث أسقط الأعمدة الفارغة
-        visible_filtered = filtered if not (q and q.strip()) else _drop_empty_columns(filtered)
-        # إعادة ترتيب الأعمدة لإبراز الأعمدة الأساسية في الحديثة
-        if not visible_filtered.empty:
-            _order = DEFAULT_FREQUENT_ORDER
-            _ordered_cols = [c for c in _order if c in visible_filtered.columns]
-            _ordered_cols += [c for c in visible_filtered.columns if c not in _ordered_cols]
-            visible_filtered = visible_filtered[_ordered_cols]
-        page_df, total = _paginate(visible_filtered, page, page_size)
+        def _compute():
+            filtered = _filter_dataframe(df, q, search_in,
+                                         text_index=lambda: _row_text_index(row, mapping, df, recent_program=True))
+            # ضمان الأعمدة المطلوبة في تبويب البيانات الحديثة قبل إسقاط الأعمدة الفارغة
+            filtered = _with_recent_columns(filtered)
+            # إظهار كل الأعمدة طالما لم يبدأ البحث (q فارغ)، وعند البحث أسقط الأعمدة الفارغة
+            visible_filtered = filtered if not (q and q.strip()) else _drop_empty_columns(filtered)
+            # إعادة ترتيب الأعمدة لإبراز الأعمدة الأساسية في الحديثة
+            _ordered_cols = list(visible_filtered.columns)
+            if not visible_filtered.empty:
+                _ordered_cols = [c for c in DEFAULT_FREQUENT_ORDER if c in visible_filtered.columns]
+                _ordered_cols += [c for c in visible_filtered.columns if c not in _ordered_cols]
+            return subset_positions(df, filtered), _ordered_cols, len(filtered)
+        result = _cached_filter(row, mapping, df, q, search_in, _compute)
+        start = max(0, (page-1)*page_size)
+        page_df = _with_recent_columns(df.iloc[result.page(start, start + page_size)])[result.columns]
+        total = result.total
         total_pages = max(1, (total + page_size - 1)//page_size)
         # تقييد أعمدة البحث للقائمة المطلوبة مع دعم بعض المسميات البديلة
-        present = set(visible_filtered.columns)
+        present = set(result.columns)
         desired_base = ['النوع','الادارة','اسم العميل','رقم العميل','مسلسل','التاريخ','خدمات']
         search_cols = [c for c in desired_base if c in present]
         # مجموعات بدائل تعرض أول اسم موجود منها
@@ -598,15 +690,6 @@ def frequent_import_post():
     if (not f1 or not f1.filename) and (not f2 or not f2.filename):
         flash("اختر ملفًا واحدًا على الأقل للاستيراد.", "warning"); return redirect(url_for("trader_services_bp.frequent_import_view"))
 
-    # قراءة الملفات ودمجها
-    dfs = []
-    try:
-        if f1 and f1.filename: dfs.append(_read_excel(f1))
-        if f2 and f2.filename: dfs.append(_read_excel(f2))
-    except Exception as ex:
-        flash(f"تعذر قراءة ملفات Excel: {ex}", "danger"); return redirect(url_for("trader_services_bp.frequent_import_view"))
-    df = pd.concat(dfs, ignore_index=True) if len(dfs) > 1 else (dfs[0] if dfs else pd.DataFrame())
-
     # حفظ المابينج (اختياري)
     order_csv = (request.form.get("order_csv") or "").strip()
     rename_lines = (request.form.get("rename_lines") or "").strip()
@@ -620,13 +703,38 @@ def frequent_import_post():
                 src, dst = [s.strip() for s in line.split("=>", 1)]
                 if src and dst: rename[src] = dst
         if rename: mapping["rename"] = rename
+
+    # قراءة الملفات ودمجها وحفظها كمهمة في الخلفية
+    uploads = [(name, f) for name, f in (("file1", f1), ("file2", f2)) if f and f.filename]
+    job, files = import_jobs.create_job("trader_frequent", f"trader_frequent:{label}", current_user.id, uploads,
+                                        result_url=url_for("trader_services_bp.frequent_visitors", tab="recent", label=label))
+    import_jobs.submit(job.id, _run_frequent_import, current_user.id, label, files, mapping)
+    return _import_job_response(job.id)
+
+def _run_frequent_import(ctx, user_id: int, label: str, files: list, mapping: dict):
+    """مهمة استيراد المترددين في الخلفية (قراءة ← دمج ← حفظ ← تجهيز بيانات الفترة)."""
+    ctx.stage("read")
+    dfs = []
+    try:
+        for item in files:
+            dfs.append(_read_job_file(item))
+    except Exception as ex:
+        return f"تعذر قراءة ملفات Excel: {ex}", "danger"
+    ctx.stage("merge")
+    df = pd.concat(dfs, ignore_index=True) if len(dfs) > 1 else (dfs[0] if dfs else pd.DataFrame())
+    ctx.set_rows(len(df))
+
+    ctx.stage("store")
     if mapping:
-        _save_state("trader_frequent:__mapping__", mapping=mapping)
+        _save_state("trader_frequent:__mapping__", mapping=mapping, user_id=user_id)
 
     # حفظ البيانات تحت الفترة المعطاة
-    _save_state(f"trader_frequent:{label}", df=df)
-    flash(f"تم الاستيراد بنجاح للفترة: {label}. سجلات: {len(df)}", "success")
-    return redirect(url_for("trader_services_bp.frequent_visitors", tab="recent", label=label))
+    _save_state(f"trader_frequent:{label}", df=df, user_id=user_id)
+    ctx.stage("index")
+    row = _load_state(f"trader_frequent:{label}")
+    if _row_has_data(row):
+        _row_to_df(row)
+    return f"تم الاستيراد بنجاح للفترة: {label}. سجلات: {len(df)}", "success"
 
 
 @trader_services_bp.route("/frequent/save_mapping", methods=["POST"])
@@ -657,20 +765,25 @@ def frequent_export():
     label = request.args.get("label", "")
 
     row = _load_state("trader_frequent:recent_program")
-    if not row or not row.data_json:
+    if not _row_has_data(row):
         flash("لا توجد بيانات لتصديرها.", "warning"); return redirect(url_for("trader_services_bp.frequent_visitors", tab="recent"))
     map_row = _load_state("trader_frequent:__mapping__")
     mapping = json.loads(map_row.mapping_json) if (map_row and map_row.mapping_json) else {}
-    out = _project_recent_program_columns(_json_to_df(row.data_json))
-    out = _apply_mapping(out, mapping)
-
-    out = _filter_dataframe(out, q, search_in)
+    key = _export_key(row, mapping, q, search_in, recent_program=True)
+    cached = EXPORT_CACHE.respond(key, f"المترددين.{key[-1]}")
+    if cached is not None:
+        return cached
+    # قراءة فقط: التصفية تُنتج إطاراً جديداً ولا تعدّل الإطار المخزن
+    mapped = _row_to_mapped_df(row, mapping, recent_program=True, copy=False)
+    out = _filter_dataframe(mapped, q, search_in,
+                            text_index=lambda: _row_text_index(row, mapping, mapped, recent_program=True))
     out = _drop_empty_columns(out)
     out = _coerce_all_text_no_decimals(out)
     if out.empty:
         flash("لا توجد بيانات لتصديرها.", "warning")
         return redirect(url_for("trader_services_bp.frequent_visitors", tab=tab, label=label))
-    return _excel_response(out, "المترددين.xlsx")
+    return _export_response(out, "المترددين",
+                            url_for("trader_services_bp.frequent_visitors", tab=tab, label=label, q=q, search_in=search_in), key)
 
 
 # تحديث سجل حديث (صاحب السجل أو الأدمن فقط) — يمنع تعديل التاريخ
@@ -690,7 +803,7 @@ def frequent_update_recent():
             return jsonify({"success": False, "message": "مطلوب فهرس الصف أو حقول التعريف (مسلسل + الإذن + التاريخ)."}), 400
 
         row = _load_state("trader_frequent:recent_program")
-        df = _json_to_df(row.data_json) if (row and row.data_json) else pd.DataFrame()
+        df = _row_to_df(row) if _row_has_data(row) else pd.DataFrame()
         if df.empty:
             return jsonify({"success": False, "message": "لا توجد بيانات للتحديث."}), 404
 
@@ -747,7 +860,7 @@ def frequent_update_recent():
                 df[k] = ''
             df.at[idx, k] = _textify(v)
 
-        row.data_json = _df_to_json(df); db.session.commit()
+        _store_df(row, df); db.session.commit()
         return jsonify({"success": True, "message": "تم تحديث السجل."})
     except Exception as ex:
         current_app.logger.exception("frequent_update_recent error:")
@@ -763,7 +876,7 @@ def frequent_delete_recent_row():
     try:
         payload = request.get_json(silent=True) or {}
         row = _load_state("trader_frequent:recent_program")
-        df = _json_to_df(row.data_json) if (row and row.data_json) else pd.DataFrame()
+        df = _row_to_df(row) if _row_has_data(row) else pd.DataFrame()
         if df.empty:
             return jsonify({"success": False, "message": "لا توجد بيانات للحذف."}), 404
 
@@ -783,7 +896,7 @@ def frequent_delete_recent_row():
                 if owner != getattr(current_user, 'username', ''):
                     return jsonify({"success": False, "message": "غير مسموح بحذف سجلات لا تملكها."}), 403
             df = df.drop(index=[idx]).reset_index(drop=True)
-            row.data_json = _df_to_json(df); db.session.commit()
+            _store_df(row, df); db.session.commit()
             return jsonify({"success": True, "message": "تم حذف السجل."})
 
         # خلاف ذلك استمرار دعم الحذف بالمعرّفات المتوفرة للحفاظ على التوافق
@@ -828,7 +941,7 @@ def frequent_delete_recent_row():
                 return jsonify({"success": False, "message": "غير مسموح بحذف سجلات لا تملكها."}), 403
 
         df = df.drop(index=idx_list).reset_index(drop=True)
-        row.data_json = _df_to_json(df); db.session.commit()
+        _store_df(row, df); db.session.commit()
         return jsonify({"success": True, "message": "تم حذف السجل."})
     except Exception as ex:
         current_app.logger.exception("frequent_delete_recent_row error:")
@@ -881,9 +994,9 @@ def frequent_add_recent():
             # إنشاء سجل فارغ في حال عدم وجوده
             row = ReportState(category='trader_frequent:recent_program', user_id=(admin_user.id if admin_user else getattr(current_user, 'id', None)))
             db.session.add(row)
-            row.data_json = _df_to_json(pd.DataFrame())
+            _store_df(row, pd.DataFrame())
 
-        df = _json_to_df(row.data_json)
+        df = _row_to_df(row)
         # بناء صف البيانات الجديد
         new_rec = {
             'الادارة': management,
@@ -919,7 +1032,7 @@ def frequent_add_recent():
             # fallback آمن إذا فشل concat بسبب أنواع الأعمدة
             df = pd.DataFrame([new_rec]) if df.empty else df.append(new_rec, ignore_index=True)
 
-        row.data_json = _df_to_json(df)
+        _store_df(row, df)
         db.session.commit()
         return jsonify({"success": True, "message": "تمت إضافة السجل بنجاح."})
     except Exception as ex:
@@ -937,7 +1050,7 @@ def frequent_recent_count():
     try:
         # قراءة أحدث بيانات recent_program (مع تطبيق الـ mapping إن وُجد)
         row = _load_state("trader_frequent:recent_program")
-        df = _json_to_df(row.data_json) if (row and row.data_json) else pd.DataFrame()
+        df = _row_to_df(row) if _row_has_data(row) else pd.DataFrame()
         map_row = _load_state("trader_frequent:__mapping__")
         mapping = json.loads(map_row.mapping_json) if (map_row and map_row.mapping_json) else {}
         if not df.empty:
@@ -0,0 +1,85 @@
+# utils/column_profile.py
+"""ملف الأعمدة غير الفارغة: بديل مسح _drop_empty_columns لكل الجدول مع كل طلب.
+
+- الخلية "فارغة" بنفس تعريف الشاشات: بعد fillna("") وstr وstrip وlower تكون "" أو من text_clean.EMPTY_TOKENS.
+- blank_mask يقرر ذلك مرة لكل قيمة مميزة (factorize) بدل عمليات النصوص على كل الصفوف.
+- عند الحفظ يُحسب عدد القيم غير الفارغة لكل عمود (nonempty_counts) ويُخزن مع البيانات (ReportDataset.profile_json)،
+  فعرض/تصدير كل الصفوف يعرف الأعمدة الفارغة بدون مسح.
+- للجزء المصفّى: has_data يفحص أول القيم فقط ثم باقي العمود عند الحاجة (عمود فيه بيانات يتوقف مبكراً).
+"""
+import numpy as np
+import pandas as pd
+
+from utils.text_clean import EMPTY_TOKENS, clean_columns
+
+# عدد القيم الأولى التي تُفحص قبل فحص العمود كله
+_PROBE = 64
+
+
+def blank_mask(values) -> np.ndarray:
+    """قناع الخلايا الفارغة (مصفوفة bool بنفس الطول)."""
+    codes, uniques = pd.factorize(values if isinstance(values, pd.Series) else np.asarray(values, dtype=object))
+    if not len(uniques):
+        return np.ones(len(codes), dtype=bool)
+    u = pd.Series(np.asarray(uniques, dtype=object), dtype=object).astype(str).str.strip().str.lower()
+    blank_u = ((u == "") | u.isin(EMPTY_TOKENS)).to_numpy()
+    # codes = -1 للقيم المفقودة (NaN/None) وهي فارغة
+    return np.append(blank_u, True)[codes]
+
+
+def has_data(values) -> bool:
+    """هل في العمود خلية غير فارغة واحدة على الأقل."""
+    if len(values) > _PROBE and not blank_mask(values[:_PROBE]).all():
+        return True
+    return not blank_mask(values).all()
+
+
+def nonempty_counts(df: pd.DataFrame) -> dict:
+    """{اسم العمود: عدد الخلايا غير الفارغة}؛ الأسماء المكررة لا تُسجل."""
+    cols = list(df.columns)
+    dup = {c for c in cols if cols.count(c) > 1}
+    return {str(c): int((~blank_mask(df.iloc[:, i])).sum()) for i, c in enumerate(cols) if c not in dup}
+
+
+def add_counts(total: dict | None, part: dict) -> dict:
+    """جمع عدادات دفعة (حفظ على دفعات) إلى الإجمالي."""
+    total = dict(total or {})
+    for c, n in part.items():
+        total[c] = total.get(c, 0) + n
+    return total
+
+
+def mapped_counts(counts: dict | None, rename: dict | None = None) -> dict | None:
+    """العدادات بأسماء الأعمدة بعد المابنج. None إذا غيّر تنظيف الأسماء اسماً (فالقيم أعيد تنظيفها)؛
+    الأسماء التي يصل إليها أكثر من عمود تُحذف فتُفحص مباشرة."""
+    if not counts:
+        return None
+    rename = rename or {}
+    names = [str(rename.get(c, c)) for c in counts]
+    if clean_columns(names) != names:
+        return None
+    out, seen = {}, set()
+    for name, n in zip(names, counts.values()):
+        if name in seen:
+            out.pop(name, None)
+            continue
+        seen.add(name)
+        out[name] = n
+    return out
+
+
+def nonempty_columns(df: pd.DataFrame, counts: dict | None = None) -> list:
+    """أعمدة df التي فيها بيانات بترتيبها. counts: عدادات معروفة لكل df (ملف الأعمدة المحفوظ)،
+    والأعمدة غير الموجودة فيها تُفحص. الأسماء المكررة تبقى كما في المسح السابق."""
+    cols = list(df.columns)
+    dup = {c for c in cols if cols.count(c) > 1}
+    keep = []
+    for i, c in enumerate(cols):
+        if c in dup:
+            keep.append(c)
+        elif counts is not None and c in counts:
+            if counts[c] > 0:
+                keep.append(c)
+        elif has_data(df.iloc[:, i].to_numpy(dtype=object)):
+            keep.append(c)
+    return keep
@@ -0,0 +1,236 @@
+# utils/dataset_store.py
+"""مخزن عمودي مضغوط لجداول التقارير (بديل ReportState.data_json).
+
+- كل عمود يُقسّم إلى أجزاء بعدد ثابت من الصفوف، ويُخزن كل جزء JSON list مضغوطًا بـ zlib.
+- التحميل يبني DataFrame مباشرةً من قوائم الأعمدة بدون json.loads لسجلات كاملة.
+- يُسجَّل نوع التنظيف الذي طُبق عند الحفظ حتى يتخطى القارئ إعادة التنظيف إذا تطابق.
+- أعمدة الظل المُطبّعة (__norm_*) تُخزن كأعمدة إضافية مخفية: load_frame لا يعيدها إلا عند طلبها صراحةً.
+- عدد الخلايا غير الفارغة لكل عمود يُحسب أثناء الحفظ (load_profile) فلا تُمسح الأعمدة الفارغة مع كل عرض.
+"""
+import json
+import zlib
+from datetime import datetime
+
+import pandas as pd
+
+from models import db
+from models_reports import ReportState, ReportDataset, ReportDatasetChunk
+from utils.norm_keys import is_shadow
+from utils import column_profile
+
+# عدد الصفوف في كل جزء عمودي
+CHUNK_ROWS = 50000
+# مستوى الضغط: 1 يعطي أسرع حفظ مع نسبة ضغط جيدة للنصوص المتكررة
+_ZLIB_LEVEL = 1
+
+CLEANER_RAW = "raw"
+
+
+# ========== الترميز (Codecs) ==========
+def _encode_zjson(values: list) -> bytes:
+    raw = json.dumps(values, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(raw, _ZLIB_LEVEL)
+
+
+def _decode_zjson(payload: bytes) -> list:
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+_CODECS = {
+    "zjson": (_encode_zjson, _decode_zjson),
+}
+DEFAULT_CODEC = "zjson"
+
+
+# ========== القراءة ==========
+def get_dataset(row):
+    """إرجاع رأس المجموعة العمودية المرتبطة بسجل الحالة (أو None)."""
+    if row is None or getattr(row, "id", None) is None:
+        return None
+    try:
+        return ReportDataset.query.filter_by(state_id=row.id).first()
+    except Exception:
+        return None
+
+
+def has_data(row) -> bool:
+    """هل توجد بيانات محفوظة للسجل (عمودية أو JSON قديم)."""
+    if row is None:
+        return False
+    if getattr(row, "data_json", None):
+        return True
+    return get_dataset(row) is not None
+
+
+def load_frame(row, columns: list[str] | None = None):
+    """تحميل DataFrame من المخزن العمودي.
+    يعيد (df, cleaner) أو (None, None) إذا لم يكن للسجل مجموعة عمودية.
+    """
+    ds = get_dataset(row)
+    if ds is None:
+        return None, None
+    all_cols = json.loads(ds.columns_json or "[]")
+    if not all_cols:
+        return pd.DataFrame(), ds.cleaner
+
+    wanted = set([c for c in all_cols if not is_shadow(c)] if columns is None else columns)
+    positions = [i for i, c in enumerate(all_cols) if c in wanted]
+    _, decode = _CODECS[ds.codec]
+
+    parts: dict[int, list] = {p: [] for p in positions}
+    q = (db.session.query(ReportDatasetChunk.column_pos, ReportDatasetChunk.payload)
+         .filter(ReportDatasetChunk.dataset_id == ds.id)
+         .order_by(ReportDatasetChunk.chunk_no.asc(), ReportDatasetChunk.column_pos.asc()))
+    if len(positions) < len(all_cols):
+        q = q.filter(ReportDatasetChunk.column_pos.in_(positions))
+    for pos, payload in q:
+        if pos in parts:
+            parts[pos].extend(decode(payload))
+
+    data = {all_cols[p]: parts[p] for p in positions}
+    df = pd.DataFrame(data, columns=[all_cols[p] for p in positions])
+    return df, ds.cleaner
+
+
+def load_shadow(row):
+    """أعمدة الظل المحفوظة مع السجل: (DataFrame, {اسم عمود الظل: عمود المصدر}) أو (None, {})."""
+    ds = get_dataset(row)
+    sources = json.loads(ds.shadow_json) if (ds is not None and ds.shadow_json) else {}
+    if not sources:
+        return None, {}
+    df, _ = load_frame(row, columns=list(sources))
+    return df, sources
+
+
+def load_profile(row):
+    """عدد الخلايا غير الفارغة لكل عمود كما حُسب عند الحفظ: (dict, cleaner) أو (None, None) للبيانات الأقدم."""
+    ds = get_dataset(row)
+    if ds is None or not ds.profile_json:
+        return None, None
+    return json.loads(ds.profile_json), ds.cleaner
+
+
+# ========== الكتابة ==========
+def _iter_chunks(df: pd.DataFrame, chunk_rows: int):
+    n = len(df)
+    for start in range(0, n, chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def save_frame(row, df: pd.DataFrame, cleaner: str = CLEANER_RAW, codec: str = DEFAULT_CODEC,
+               shadow: dict | None = None) -> None:
+    """حفظ DataFrame (بعد تنظيفه من المستدعي) في المخزن العمودي بدل data_json.
+    shadow: {اسم عمود الظل: (عمود المصدر، القيم)} كما يعيده norm_keys.build_shadow.
+    لا يقوم بعمل commit؛ يترك ذلك للمستدعي كما في بقية دوال الحفظ.
+    """
+    df = df if df is not None else pd.DataFrame()
+    save_frames(row, [df], cleaner=cleaner, codec=codec, shadow=lambda part: shadow)
+
+
+def save_frames(row, frames, cleaner: str = CLEANER_RAW, codec: str = DEFAULT_CODEC, shadow=None) -> int:
+    """حفظ جدول يصل على دفعات (مكرر DataFrames بنفس الأعمدة) بدون تجميعه في الذاكرة.
+    الأعمدة تُحدد من أول دفعة، وكل دفعة تُرمّز وتُرسل لقاعدة البيانات ثم تُترك.
+    shadow: دالة (دفعة → ناتج norm_keys.build_shadow لها) أو None.
+    يعيد عدد الصفوف المحفوظة. لا يقوم بعمل commit.
+    """
+    if row.id is None:
+        db.session.add(row)
+        db.session.flush()
+
+    encode, _ = _CODECS[codec]
+
+    ds = ReportDataset.query.filter_by(state_id=row.id).first()
+    if ds is None:
+        ds = ReportDataset(state_id=row.id)
+        db.session.add(ds)
+        db.session.flush()
+    else:
+        ReportDatasetChunk.query.filter_by(dataset_id=ds.id).delete(synchronize_session=False)
+
+    base_cols = None
+    shadow_sources = None
+    profile = {}
+    chunk_no = 0
+    total = 0
+    for df in frames:
+        if base_cols is None:
+            base_cols = list(df.columns)
+        elif list(df.columns) != base_cols:
+            df = df.reindex(columns=base_cols)
+        profile = column_profile.add_counts(profile, column_profile.nonempty_counts(df))
+        part_shadow = (shadow(df) if shadow is not None else None) or {}
+        part_shadow = {name: src_vals for name, src_vals in part_shadow.items() if len(src_vals[1]) == len(df)}
+        if shadow_sources is None:
+            # أعمدة الظل تتحدد بأسماء الأعمدة فقط، فهي نفسها لكل الدفعات
+            shadow_sources = {name: str(src) for name, (src, _) in part_shadow.items()}
+        if part_shadow:
+            df = df.assign(**{name: vals for name, (_, vals) in part_shadow.items() if name in shadow_sources})
+        objs = []
+        for part in _iter_chunks(df, CHUNK_ROWS):
+            for pos in range(part.shape[1]):
+                values = part.iloc[:, pos].tolist()
+                objs.append(ReportDatasetChunk(dataset_id=ds.id, chunk_no=chunk_no, column_pos=pos, payload=encode(values)))
+            chunk_no += 1
+        if objs:
+            db.session.bulk_save_objects(objs)
+        total += int(len(df))
+
+    cols = [str(c) for c in (base_cols or [])] + list(shadow_sources or {})
+    ds.columns_json = json.dumps(cols, ensure_ascii=False)
+    ds.shadow_json = json.dumps(shadow_sources, ensure_ascii=False) if shadow_sources else None
+    ds.profile_json = json.dumps(profile, ensure_ascii=False)
+    ds.row_count = total
+    # أقصى عدد صفوف في الجزء (الدفعة الأخيرة من كل مصدر قد تكون أقصر)
+    ds.chunk_rows = CHUNK_ROWS
+    ds.codec = codec
+    ds.cleaner = cleaner
+
+    # إفراغ النص القديم وتحديث وقت التعديل صراحةً (لأن التغيير قد يكون في الأجزاء فقط)
+    row.data_json = None
+    row.updated_at = datetime.utcnow()
+    return total
+
+
+# ========== الترحيل من data_json ==========
+def _legacy_cleaner_for(category: str) -> str:
+    """تحديد دالة التنظيف التي كتبت البيانات القديمة حسب القسم.
+    recent_program تكتبه شاشتان مختلفتان، لذا نعامله كبيانات خام.
+    """
+    if category == "trader_frequent:recent_program":
+        return CLEANER_RAW
+    if category.startswith("trader_"):
+        return "trader"
+    return "reports"
+
+
+def migrate_legacy_states(cleaners: dict | None = None, logger=None) -> dict:
+    """تحويل كل سجلات data_json القديمة إلى المخزن العمودي (سجل بسجل مع commit لكل سجل).
+    cleaners: {"reports": fn, "trader": fn} لتطبيق نفس تنظيف القارئ الأصلي مرة واحدة عند الترحيل.
+    """
+    cleaners = cleaners or {}
+    stats = {"migrated": 0, "rows": 0, "failed": 0}
+    try:
+        ids = [i for (i,) in db.session.query(ReportState.id).filter(ReportState.data_json.isnot(None)).all()]
+    except Exception:
+        return stats
+    for state_id in ids:
+        row = db.session.get(ReportState, state_id)
+        try:
+            js = row.data_json
+            df = pd.DataFrame(json.loads(js)) if js else pd.DataFrame()
+            cleaner = _legacy_cleaner_for(row.category)
+            clean_fn = cleaners.get(cleaner)
+            if clean_fn is None:
+                cleaner = CLEANER_RAW
+            else:
+                df = clean_fn(df)
+            save_frame(row, df, cleaner=cleaner)
+            db.session.commit()
+            stats["migrated"] += 1
+            stats["rows"] += int(len(df))
+        except Exception as ex:
+            db.session.rollback()
+            stats["failed"] += 1
+            if logger:
+                logger.warning(f"[DatasetStore] migration failed for state {state_id}: {ex}")
+    return stats
@@ -0,0 +1,190 @@
+# utils/export_cache.py
+"""كاش ملفات التصدير على القرص (instance/export_cache أو EXPORT_CACHE_DIR) مشترك بين الـ workers.
+
+- المفتاح: (category, id, updated_at, variant, توقيع المابنج, q, search_in, format)؛ updated_at هو إصدار البيانات
+  المحفوظ في قاعدة البيانات، فالملف لا يُستخدم بعد أي استيراد أو تعديل حتى لو أُعيد تشغيل الخادم.
+- كل قسم في مجلد (اسمه hash القسم)، وكل ملف اسمه <id>-<hash الإصدار>-<hash المفتاح>.<format>.
+  invalidate(category) يحذف مجلد القسم، وحفظ إصدار جديد يحذف ملفات الإصدارات الأقدم لنفس السجل.
+- ETag = hash المفتاح: If-None-Match المطابق يعيد 304 بدون تحميل البيانات أو تصفيتها.
+- الكتابة في ملف .tmp ثم os.replace فلا يُقرأ ملف ناقص؛ CSV يُرسل للمستخدم أثناء كتابته للكاش.
+- الإخلاء حسب الحجم الكلي (EXPORT_CACHE_MB، الافتراضي 512): الأقدم استخداماً أولاً (mtime يُحدّث مع كل قراءة).
+  EXPORT_CACHE_MB=0 يعطل الكاش.
+"""
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+
+from flask import Response, current_app, request, send_file
+
+from utils import table_export
+
+_DEFAULT_MAX_MB = 512
+_TMP_SUFFIX = ".tmp"
+
+
+def _hash(value) -> str:
+    return hashlib.sha1(repr(value).encode("utf-8")).hexdigest()
+
+
+class ExportCache:
+    def __init__(self, max_bytes: int, root: str | None = None):
+        self.max_bytes = int(max_bytes)
+        self._root = root
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(row, variant: str, mapping_signature: str, q: str, search_in: str, fmt: str):
+        return (row.category, row.id, row.updated_at, variant or "", mapping_signature or "",
+                q or "", search_in or "all", fmt)
+
+    def root(self) -> str | None:
+        if self.max_bytes <= 0:
+            return None
+        path = self._root or os.environ.get("EXPORT_CACHE_DIR") or os.path.join(current_app.instance_path, "export_cache")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _path(self, root: str, key) -> str:
+        category, state_id, updated_at, variant, signature = key[:5]
+        name = f"{state_id}-{_hash((updated_at, variant, signature))[:16]}-{_hash(key)[:24]}.{key[7]}"
+        return os.path.join(root, _hash(category)[:16], name)
+
+    @staticmethod
+    def etag(key) -> str:
+        return _hash(key)
+
+    def _send(self, path: str, key, download_name: str):
+        resp = send_file(path, as_attachment=True, download_name=download_name,
+                         mimetype=table_export.MIMETYPES[key[7]], etag=self.etag(key), conditional=True)
+        resp.cache_control.private = True
+        return resp
+
+    def respond(self, key, download_name: str):
+        """استجابة من الكاش (الملف أو 304 عند تطابق If-None-Match)، أو None إذا لم يكن الملف مخزناً."""
+        root = self.root()
+        if root is None:
+            return None
+        etag = self.etag(key)
+        if etag in request.if_none_match:
+            # نفس إصدار البيانات ونفس الطلب: نسخة المستخدم صالحة حتى لو حُذف الملف من الكاش
+            self.hits += 1
+            resp = Response(status=304)
+            resp.set_etag(etag)
+            resp.cache_control.private = True
+            return resp
+        path = self._path(root, key)
+        try:
+            os.utime(path)
+            resp = self._send(path, key, download_name)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return resp
+
+    def store(self, key, download_name: str, df, datetime_cols=()):
+        """كتابة التصدير في الكاش وإرساله. CSV يُرسل أثناء الكتابة؛ الصيغ الأخرى بعد اكتمال الملف."""
+        root = self.root()
+        fmt = key[7]
+        if root is None:
+            return table_export.export_response(df, download_name.rsplit(".", 1)[0], fmt, datetime_cols)
+        path = self._path(root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}{_TMP_SUFFIX}"
+        if fmt == "csv":
+            resp = Response(self._tee(table_export.iter_csv(df, datetime_cols), tmp, path, key),
+                            mimetype=table_export.MIMETYPES[fmt],
+                            headers={"Content-Disposition": table_export.content_disposition(download_name)})
+            resp.set_etag(self.etag(key))
+            resp.cache_control.private = True
+            return resp
+        try:
+            with open(tmp, "wb") as fh:
+                table_export.write_file(df, fh, fmt, datetime_cols)
+        except BaseException:
+            _remove(tmp)
+            raise
+        self._publish(tmp, path, key)
+        return self._send(path, key, download_name)
+
+    def _tee(self, chunks, tmp: str, path: str, key):
+        done = False
+        try:
+            with open(tmp, "wb") as fh:
+                for chunk in chunks:
+                    fh.write(chunk)
+                    yield chunk
+            self._publish(tmp, path, key)
+            done = True
+        finally:
+            # انقطاع التحميل قبل اكتماله: لا يُحفظ ملف ناقص
+            if not done:
+                _remove(tmp)
+
+    def _publish(self, tmp: str, path: str, key) -> None:
+        """نقل الملف المكتمل لمكانه، وحذف ملفات الإصدارات الأقدم لنفس السجل، ثم الإخلاء حسب الحجم."""
+        try:
+            os.replace(tmp, path)
+        except OSError:
+            # ملف بنفس المفتاح كتبه طلب آخر وهو مفتوح للقراءة (Windows): نفس المحتوى، نكتفي به
+            _remove(tmp)
+        folder = os.path.dirname(path)
+        prefix = f"{key[1]}-"
+        current = os.path.basename(path).split("-")[1]
+        for name in os.listdir(folder):
+            if name.startswith(prefix) and not name.endswith(_TMP_SUFFIX) and name.split("-")[1] != current:
+                _remove(os.path.join(folder, name))
+        self._evict(os.path.dirname(folder), keep=path)
+
+    def _evict(self, root: str, keep: str | None = None) -> None:
+        with self._lock:
+            files = []
+            for folder, _, names in os.walk(root):
+                for name in names:
+                    p = os.path.join(folder, name)
+                    if name.endswith(_TMP_SUFFIX) or p == keep:
+                        continue
+                    try:
+                        st = os.stat(p)
+                    except OSError:
+                        continue
+                    files.append((st.st_mtime, st.st_size, p))
+            total = sum(f[1] for f in files)
+            for _, size, p in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                _remove(p)
+                total -= size
+
+    def invalidate(self, category: str | None = None) -> None:
+        """حذف ملفات قسم معيّن (أو الكاش كله عند category=None)."""
+        root = self.root()
+        if root is None:
+            return
+        target = root if category is None else os.path.join(root, _hash(category)[:16])
+        shutil.rmtree(target, ignore_errors=True)
+
+    def stats(self) -> dict:
+        root = self.root()
+        files = [os.path.join(f, n) for f, _, names in os.walk(root) for n in names] if root else []
+        return {"files": len(files), "bytes": sum(os.path.getsize(p) for p in files if os.path.exists(p)),
+                "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+try:
+    _max_mb = float(os.environ.get("EXPORT_CACHE_MB", _DEFAULT_MAX_MB))
+except ValueError:
+    _max_mb = _DEFAULT_MAX_MB
+
+EXPORT_CACHE = ExportCache(max_bytes=int(_max_mb * 1024 * 1024))
@@ -0,0 +1,153 @@
+# utils/filter_cache.py
+"""كاش قصير العمر لنتائج البحث في شاشات الجداول (مواضع الصفوف المطابقة + الأعمدة الظاهرة).
+
+التنقل بين صفحات نتيجة بحث يعيد نفس التصفية على كامل البيانات ثم يأخذ 25 صفاً فقط؛ مع هذا الكاش تُحسب
+التصفية مرة واحدة ثم تُقتطع كل صفحة من مصفوفة المواضع (O(page_size)).
+
+- المفتاح: (scope, version, q, search_in, user_id). scope يحدد مجموعة البيانات ("<category>:<row id>")
+  وversion يتغير مع تغير البيانات أو المابنج (مثلاً (updated_at, توقيع المابنج)) فلا تُستخدم نتيجة قديمة بعد الاستيراد.
+- الإخلاء: مدة صلاحية (FILTER_CACHE_TTL بالثواني، الافتراضي 120)، وLRU بعدد المدخلات (FILTER_CACHE_ENTRIES، 256)
+  وبالحجم الكلي (FILTER_CACHE_MB، 64)، وحد لكل مستخدم (FILTER_CACHE_USER_MB، 8) تُحذف عنده أقدم مدخلاته هو فقط.
+- positions=None تعني "كل الصفوف" (بدون بحث) فلا تستهلك ذاكرة.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+
+class FilterResult(NamedTuple):
+    positions: np.ndarray | None  # مواضع (iloc) الصفوف المطابقة بالترتيب، أو None لكل الصفوف
+    columns: list                 # الأعمدة الظاهرة بعد إسقاط الفارغة
+    total: int                    # عدد الصفوف المطابقة
+
+    def page(self, start: int, end: int) -> np.ndarray:
+        """مواضع صفوف صفحة واحدة."""
+        if self.positions is None:
+            return np.arange(max(0, start), max(0, min(end, self.total)))
+        return self.positions[max(0, start):max(0, end)]
+
+
+def subset_positions(df: pd.DataFrame, sub: pd.DataFrame) -> np.ndarray | None:
+    """مواضع صفوف sub (ناتج تصفية df بقناع) داخل df، أو None إذا كانت كل الصفوف. ValueError عند فهرس مكرر."""
+    if sub is df or len(sub) == len(df) and sub.index.equals(df.index):
+        return None
+    idx = df.index
+    if isinstance(idx, pd.RangeIndex) and idx.start == 0 and idx.step == 1:
+        return sub.index.to_numpy(dtype=np.int64)
+    if not idx.is_unique:
+        raise ValueError("duplicate index")
+    return idx.get_indexer(sub.index).astype(np.int64)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class FilterCache:
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int, user_max_bytes: int):
+        self.ttl = float(ttl)
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self.user_max_bytes = int(user_max_bytes)
+        self._entries: OrderedDict = OrderedDict()  # key -> (result, nbytes, user_id, expires_at)
+        self._bytes = 0
+        self._user_bytes: dict = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(scope: str, version, q: str, search_in: str, user_id=None):
+        return (scope, version, q or "", search_in or "all", user_id)
+
+    def _drop(self, key) -> None:
+        _, nbytes, user_id, _ = self._entries.pop(key)
+        self._bytes -= nbytes
+        left = self._user_bytes.get(user_id, 0) - nbytes
+        if left > 0:
+            self._user_bytes[user_id] = left
+        else:
+            self._user_bytes.pop(user_id, None)
+
+    def get(self, key) -> FilterResult | None:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or item[3] < time.monotonic():
+                if item is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, positions, columns: list, total: int) -> FilterResult:
+        result = FilterResult(positions, list(columns), int(total))
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return result
+        nbytes = (positions.nbytes if positions is not None else 0) + 64 * len(result.columns)
+        if nbytes > self.user_max_bytes or nbytes > self.max_bytes:
+            return result
+        user_id = key[4]
+        now = time.monotonic()
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            # المنتهية، ومدخلات نفس النطاق بإصدار أقدم (بيانات تغيرت) لن تُستخدم مرة أخرى
+            for k in [k for k, v in self._entries.items() if v[3] < now or (k[0] == key[0] and k[1] != key[1])]:
+                self._drop(k)
+            # حد المستخدم: أقدم مدخلاته هو أولاً
+            if self._user_bytes.get(user_id, 0) + nbytes > self.user_max_bytes:
+                for k in [k for k, v in self._entries.items() if v[2] == user_id]:
+                    self._drop(k)
+                    self.evictions += 1
+                    if self._user_bytes.get(user_id, 0) + nbytes <= self.user_max_bytes:
+                        break
+            self._entries[key] = (result, nbytes, user_id, now + self.ttl)
+            self._bytes += nbytes
+            self._user_bytes[user_id] = self._user_bytes.get(user_id, 0) + nbytes
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return result
+
+    def get_or_compute(self, key, compute) -> FilterResult:
+        """compute() تعيد (positions, columns, total)؛ positions=None لكل الصفوف."""
+        result = self.get(key)
+        if result is not None:
+            return result
+        return self.put(key, *compute())
+
+    def invalidate(self, scope: str | None = None) -> None:
+        """حذف نتائج نطاق معيّن وما تحته (category تحذف "category:*")، أو الكاش كله عند scope=None."""
+        with self._lock:
+            for k in [k for k in self._entries if scope is None or k[0] == scope or k[0].startswith(scope + ":")]:
+                self._drop(k)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "users": len(self._user_bytes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+FILTER_CACHE = FilterCache(
+    ttl=_env_float("FILTER_CACHE_TTL", 120),
+    max_entries=int(_env_float("FILTER_CACHE_ENTRIES", 256)),
+    max_bytes=int(_env_float("FILTER_CACHE_MB", 64) * 1024 * 1024),
+    user_max_bytes=int(_env_float("FILTER_CACHE_USER_MB", 8) * 1024 * 1024),
+)
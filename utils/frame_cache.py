@@ -0,0 +1,124 @@
+# utils/frame_cache.py
+"""كاش مشترك على مستوى العملية لجداول التقارير بعد فك ترميزها (وبعد تطبيق المابنج).
+
+- المفتاح: (category, id, updated_at, variant) حيث variant يميز دالة التنظيف/توقيع المابنج.
+- الإخلاء LRU حسب الحجم التقديري بالبايت (REPORTS_FRAME_CACHE_MB، الافتراضي 256).
+- يُرجع نسخة من الإطار حتى لا يعدّل المستدعي النسخة المخزنة (مع علامة النظافة، انظر text_clean)؛
+  copy=False يعيد الإطار المخزن نفسه لمستدعٍ يقرأ فقط (مثل اقتطاع صفحة بمواضع من utils/filter_cache).
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from utils.text_clean import copy_frame
+
+_DEFAULT_MAX_MB = 256
+# عدد القيم المأخوذة كعينة لتقدير حجم الأعمدة النصية
+_SAMPLE_SIZE = 500
+
+
+def estimate_bytes(df: pd.DataFrame) -> int:
+    """تقدير حجم الإطار بدون memory_usage(deep=True) المكلف على الإطارات الكبيرة."""
+    if df is None:
+        return 0
+    total = int(df.memory_usage(index=True, deep=False).sum())
+    n = len(df)
+    if n == 0:
+        return total
+    step = max(1, n // _SAMPLE_SIZE)
+    for col in range(df.shape[1]):
+        s = df.iloc[:, col]
+        if s.dtype != object:
+            continue
+        sample = s.iloc[::step]
+        avg = sum(sys.getsizeof(v) for v in sample) / max(1, len(sample))
+        total += int(avg * n)
+    return total
+
+
+class FrameCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self._entries: OrderedDict = OrderedDict()  # key -> (df, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(row, variant: str = ""):
+        return (row.category, row.id, row.updated_at, variant)
+
+    def get(self, key, copy: bool = True):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            df = item[0]
+        return copy_frame(df, "frame_cache") if copy else df
+
+    def put(self, key, df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+        """تخزين الإطار وإرجاع نسخة للمستدعي (أو الإطار نفسه عند copy=False)."""
+        nbytes = estimate_bytes(df)
+        if nbytes > self.max_bytes:
+            return df
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            # مفاتيح أقدم لنفس السجل لن تُستخدم بعد تغير updated_at
+            stale = [k for k in self._entries if k[0] == key[0] and k[1] == key[1] and k[2] != key[2]]
+            for k in stale:
+                self._bytes -= self._entries.pop(k)[1]
+            self._entries[key] = (df, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, b) = self._entries.popitem(last=False)
+                self._bytes -= b
+                self.evictions += 1
+        return copy_frame(df, "frame_cache") if copy else df
+
+    def get_or_load(self, row, loader, variant: str = "", copy: bool = True) -> pd.DataFrame:
+        if row is None or getattr(row, "id", None) is None:
+            return loader()
+        key = self.make_key(row, variant)
+        df = self.get(key, copy=copy)
+        if df is not None:
+            return df
+        return self.put(key, loader(), copy=copy)
+
+    def invalidate(self, category: str | None = None) -> None:
+        """حذف كل إطارات قسم معيّن (أو الكاش كله عند category=None)."""
+        with self._lock:
+            if category is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            for k in [k for k in self._entries if k[0] == category]:
+                self._bytes -= self._entries.pop(k)[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+try:
+    _max_mb = float(os.environ.get("REPORTS_FRAME_CACHE_MB", _DEFAULT_MAX_MB))
+except ValueError:
+    _max_mb = _DEFAULT_MAX_MB
+
+FRAME_CACHE = FrameCache(max_bytes=int(_max_mb * 1024 * 1024))
@@ -0,0 +1,318 @@
+# utils/import_jobs.py
+"""مهام الاستيراد في الخلفية: القراءة والدمج والحفظ وإعادة بناء الفهارس خارج طلب HTTP.
+
+- الطلب يحفظ الملفات المرفوعة في instance/import_jobs/<id>/ وينشئ سجلاً في جدول jobs ثم يعود فوراً.
+- التنفيذ في مجمع خيوط محلي (IMPORT_JOB_WORKERS، الافتراضي 1 لأن SQLite يقبل كاتباً واحداً في نفس الوقت).
+- المراحل: read → merge → store → index. التقدم الحي (المرحلة وعدد الصفوف) في الذاكرة، ويُحفظ في الجدول
+  عند حدود المراحل التي لا توجد فيها كتابة غير مؤكدة فقط، حتى لا يؤكد حفظ التقدم بيانات نصف مكتوبة.
+- IMPORT_JOBS_ASYNC=0 ينفذ المهمة داخل الطلب نفسه (للتطوير والاختبارات).
+- نبض: خيط في كل عملية يحدّث كل دقيقة (أو ربع مدة التوقف إن كانت أقصر) updated_at للمهام المنتظرة والجارية فيها
+  باتصال وcommit خاصين به، ويحدّث وقت تعديل مجلد ملفاتها. أثناء مرحلة store يحجز SQLite الكتابة حتى commit
+  الحفظ فقد يتعذر تحديث الجدول، ويكفي حينها نبض المجلد (نفس القرص لكل الـ workers).
+- المهام لا تنجو من إعادة تشغيل الـ worker أو قتله: مهمة queued/running لم يصل نبضها (لا في الجدول ولا في المجلد)
+  منذ IMPORT_JOB_STALE_MINUTES (الافتراضي 30) ولا تعمل في هذه العملية تُسجّل فاشلة ويُحذف مجلد ملفاتها، عند بدء
+  التطبيق (fail_stale_jobs) وعند الاستعلام عن حالتها (job_status). مهمة لم يثبت توقفها لا يُحذف مجلدها.
+"""
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import perf_counter, sleep
+
+from flask import current_app, flash, redirect, url_for
+from werkzeug.datastructures import FileStorage
+
+from models import db
+from models_reports import ImportJob
+
+STAGES = ("read", "merge", "store", "index")
+
+# التقدم الحي للمهام الجارية في هذه العملية: job_id → {stage, rows, t0}
+_LIVE: dict[int, dict] = {}
+_LIVE_LOCK = threading.Lock()
+# مهام أُرسلت للمنفذ في هذه العملية ولم تبدأ بعد (قد تنتظر طويلاً خلف مهمة أخرى)
+_QUEUED: set[int] = set()
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+_HEARTBEAT: threading.Thread | None = None
+
+
+def is_async() -> bool:
+    return os.environ.get("IMPORT_JOBS_ASYNC", "1") != "0"
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            try:
+                workers = max(1, int(os.environ.get("IMPORT_JOB_WORKERS", "1")))
+            except ValueError:
+                workers = 1
+            _EXECUTOR = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="import-job")
+        return _EXECUTOR
+
+
+def job_dir(job_id: int) -> str:
+    return os.path.join(current_app.instance_path, "import_jobs", str(job_id))
+
+
+def stale_after() -> timedelta:
+    try:
+        minutes = float(os.environ.get("IMPORT_JOB_STALE_MINUTES", "30"))
+    except ValueError:
+        minutes = 30.0
+    return timedelta(minutes=max(1.0, minutes))
+
+
+def _heartbeat_seconds() -> float:
+    return min(60.0, stale_after().total_seconds() / 4)
+
+
+def _ensure_heartbeat(app) -> None:
+    global _HEARTBEAT
+    with _EXECUTOR_LOCK:
+        if _HEARTBEAT is None or not _HEARTBEAT.is_alive():
+            _HEARTBEAT = threading.Thread(target=_heartbeat_loop, args=(app,), name="import-job-heartbeat", daemon=True)
+            _HEARTBEAT.start()
+
+
+def _heartbeat_loop(app) -> None:
+    while True:
+        sleep(_heartbeat_seconds())
+        with _LIVE_LOCK:
+            ids = sorted(set(_LIVE) | _QUEUED)
+        if ids:
+            beat(app, ids)
+
+
+def beat(app, job_ids) -> None:
+    """نبض المهام job_ids (تعمل أو تنتظر في هذه العملية): وقت تعديل مجلداتها، ثم updated_at في الجدول."""
+    for job_id in job_ids:
+        try:
+            os.utime(os.path.join(app.instance_path, "import_jobs", str(job_id)))
+        except OSError:
+            pass
+    table = ImportJob.__table__
+    try:
+        with app.app_context(), db.engine.begin() as conn:
+            conn.execute(table.update().where(table.c.id.in_(list(job_ids))).values(updated_at=datetime.utcnow()))
+    except Exception:
+        # SQLite أثناء كتابة الحفظ غير المؤكدة في مهمة أخرى: نبض المجلد يكفي حتى المحاولة التالية
+        pass
+
+
+def _last_beat(job: ImportJob) -> datetime | None:
+    """آخر دليل على أن المهمة حية: الأحدث بين updated_at ووقت تعديل مجلد ملفاتها."""
+    try:
+        folder = datetime.utcfromtimestamp(os.path.getmtime(job_dir(job.id)))
+    except OSError:
+        folder = None
+    times = [t for t in (job.updated_at, folder) if t is not None]
+    return max(times) if times else None
+
+
+def _is_dead(job: ImportJob, cutoff: datetime) -> bool:
+    if job.status not in ("queued", "running") or _is_local(job.id):
+        return False
+    last = _last_beat(job)
+    return last is not None and last < cutoff
+
+
+class JobContext:
+    """واجهة المهمة لتسجيل التقدم: stage() عند بداية كل مرحلة وadd_rows() أثناء الحفظ."""
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        with _LIVE_LOCK:
+            _LIVE[job_id] = {"stage": None, "rows": 0, "t0": perf_counter()}
+
+    def stage(self, name: str, persist: bool = True) -> None:
+        """بداية مرحلة. persist=False أثناء وجود كتابة غير مؤكدة في الجلسة (التحديث في الذاكرة فقط)."""
+        rows = 0
+        with _LIVE_LOCK:
+            live = _LIVE.get(self.job_id)
+            if live is not None:
+                live["stage"] = name
+                rows = live["rows"]
+        if persist:
+            _persist(self.job_id, stage=name, rows_processed=rows)
+
+    def add_rows(self, n: int) -> None:
+        with _LIVE_LOCK:
+            live = _LIVE.get(self.job_id)
+            if live is not None:
+                live["rows"] += int(n)
+
+    def set_rows(self, n: int) -> None:
+        with _LIVE_LOCK:
+            live = _LIVE.get(self.job_id)
+            if live is not None:
+                live["rows"] = int(n)
+
+    def track(self, frames):
+        """تمرير دفعات الحفظ مع عدّ صفوفها (المرحلة store تبدأ مع أول دفعة)."""
+        for i, df in enumerate(frames):
+            if i == 0:
+                self.stage("store", persist=False)
+            self.add_rows(len(df))
+            yield df
+
+
+def _persist(job_id: int, **fields) -> None:
+    fields["updated_at"] = datetime.utcnow()
+    ImportJob.query.filter_by(id=job_id).update(fields, synchronize_session=False)
+    db.session.commit()
+
+
+def create_job(kind: str, target: str, user_id, uploads: list, result_url: str = None) -> tuple:
+    """إنشاء مهمة وحفظ ملفاتها على القرص.
+    uploads: [(اسم الحقل، FileStorage)] → يعيد (job، [(اسم الحقل، اسم الملف الأصلي، المسار)]).
+    result_url: صفحة النتائج بعد الانتهاء (تُحسب في الطلب لأن url_for يحتاج سياق الطلب).
+    """
+    job = ImportJob(kind=kind, target=target, user_id=user_id, status="queued", result_url=result_url)
+    db.session.add(job)
+    db.session.commit()
+    folder = job_dir(job.id)
+    os.makedirs(folder, exist_ok=True)
+    files = []
+    for field, fs in uploads:
+        # الاسم على القرص من اسم الحقل فقط (أسماء الملفات العربية لا تمر على secure_filename)
+        ext = os.path.splitext(fs.filename or "")[1].lower()
+        path = os.path.join(folder, f"{field}{ext}")
+        fs.save(path)
+        files.append((field, fs.filename, path))
+    return job, files
+
+
+def open_upload(path: str, filename: str) -> FileStorage:
+    """ملف محفوظ للمهمة بنفس واجهة الملف المرفوع (لتمريره لنفس دوال القراءة)."""
+    return FileStorage(stream=open(path, "rb"), filename=filename)
+
+
+def submit(job_id: int, fn, *args) -> None:
+    """تشغيل fn(ctx, *args) للمهمة. fn تعيد (الرسالة، المستوى) وأي استثناء يسجل المهمة كفاشلة."""
+    app = current_app._get_current_object()
+    if is_async():
+        with _LIVE_LOCK:
+            _QUEUED.add(job_id)
+        _ensure_heartbeat(app)
+        _executor().submit(_run, app, job_id, fn, args)
+    else:
+        _run(app, job_id, fn, args)
+
+
+def _run(app, job_id: int, fn, args) -> None:
+    ctx = JobContext(job_id)
+    with _LIVE_LOCK:
+        _QUEUED.discard(job_id)
+    with app.app_context():
+        fields = {}
+        try:
+            _persist(job_id, status="running", stage=STAGES[0], started_at=datetime.utcnow())
+            message, level = fn(ctx, *args)
+            fields.update(status="done", message=message, level=level)
+        except Exception as ex:
+            db.session.rollback()
+            app.logger.exception(f"[ImportJob] job {job_id} failed")
+            fields.update(status="failed", message=f"خطأ في الاستيراد: {ex}", level="danger", error=str(ex))
+        finally:
+            with _LIVE_LOCK:
+                live = _LIVE.pop(job_id, None) or {}
+            fields.update(rows_processed=live.get("rows", 0), finished_at=datetime.utcnow())
+            try:
+                _persist(job_id, **fields)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception(f"[ImportJob] could not record result of job {job_id}")
+            shutil.rmtree(os.path.join(app.instance_path, "import_jobs", str(job_id)), ignore_errors=True)
+
+
+def _fail_stale(jobs, cutoff: datetime) -> int:
+    """تسجيل المهام المتوقفة فاشلة وحذف مجلدات ملفاتها؛ فقط ما لم يصل نبضه منذ cutoff (_is_dead)."""
+    now = datetime.utcnow()
+    failed = 0
+    for job_id in [j.id for j in jobs if _is_dead(j, cutoff)]:
+        # الشرط يُعاد في UPDATE: نبض وصل بعد القراءة يبقي المهمة حية
+        n = (ImportJob.query
+             .filter(ImportJob.id == job_id, ImportJob.status.in_(("queued", "running")), ImportJob.updated_at < cutoff)
+             .update({"status": "failed", "level": "danger", "error": "stale",
+                      "message": "توقفت مهمة الاستيراد قبل اكتمالها (أُعيد تشغيل الخادم أو انقطعت العملية). يرجى إعادة الاستيراد.",
+                      "finished_at": now, "updated_at": now}, synchronize_session=False))
+        if n:
+            failed += 1
+            shutil.rmtree(job_dir(job_id), ignore_errors=True)
+    db.session.commit()
+    return failed
+
+
+def _is_local(job_id: int) -> bool:
+    with _LIVE_LOCK:
+        return job_id in _LIVE or job_id in _QUEUED
+
+
+def fail_stale_jobs(logger=None) -> int:
+    """عند بدء التطبيق: المهام queued/running المتوقفة تُسجّل فاشلة، ومجلدات الملفات بلا مهمة جارية تُحذف."""
+    cutoff = datetime.utcnow() - stale_after()
+    failed = _fail_stale(ImportJob.query.filter(ImportJob.status.in_(("queued", "running")),
+                                                ImportJob.updated_at < cutoff).all(), cutoff)
+    root = os.path.join(current_app.instance_path, "import_jobs")
+    if os.path.isdir(root):
+        active = {str(j.id) for j in ImportJob.query.filter(ImportJob.status.in_(("queued", "running")))}
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            # المجلدات الحديثة قد تخص مهمة تُنشأ الآن في worker آخر
+            try:
+                old = datetime.utcfromtimestamp(os.path.getmtime(path)) < cutoff
+            except OSError:
+                continue
+            if name not in active and old:
+                shutil.rmtree(path, ignore_errors=True)
+    if failed and logger is not None:
+        logger.warning(f"[ImportJob] marked {failed} stale job(s) as failed")
+    return failed
+
+
+def job_response(job_id: int):
+    """الرد على طلب الاستيراد: صفحة متابعة المهمة، أو النتيجة مباشرة إذا انتهت داخل الطلب (IMPORT_JOBS_ASYNC=0)."""
+    job = db.session.get(ImportJob, job_id)
+    if job is not None:
+        db.session.refresh(job)
+    if job is not None and job.status in ("done", "failed"):
+        flash(job.message or "", job.level or "info")
+        return redirect(job.result_url or url_for("main_bp.dashboard"))
+    return redirect(url_for("machine_reports_bp.import_job_view", job_id=job_id))
+
+
+def job_status(job: ImportJob) -> dict:
+    """حالة المهمة للعرض: من الذاكرة أثناء التنفيذ في هذه العملية، وإلا من الجدول.
+    مهمة queued/running لا تعمل هنا ولم يصل نبضها منذ stale_after() تُسجّل فاشلة (حتى تتوقف صفحة المتابعة).
+    """
+    if _fail_stale([job], datetime.utcnow() - stale_after()):
+        db.session.refresh(job)
+    with _LIVE_LOCK:
+        live = dict(_LIVE.get(job.id) or {})
+    if live:
+        stage, rows = live["stage"] or job.stage, live["rows"]
+        elapsed = perf_counter() - live["t0"]
+    else:
+        stage, rows = job.stage, job.rows_processed
+        start = job.started_at or job.created_at
+        end = job.finished_at or datetime.utcnow()
+        elapsed = (end - start).total_seconds() if start else 0.0
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "target": job.target,
+        "status": job.status,
+        "stage": stage,
+        "stages": list(STAGES),
+        "rows_processed": int(rows or 0),
+        "elapsed_ms": round(max(0.0, elapsed) * 1000, 1),
+        "message": job.message,
+        "level": job.level,
+        "result_url": job.result_url,
+        "created_at": job.created_at.isoformat(timespec="seconds") if job.created_at else None,
+        "finished_at": job.finished_at.isoformat(timespec="seconds") if job.finished_at else None,
+    }
@@ -0,0 +1,103 @@
+# utils/import_pool.py
+"""مجمع عمليات مشترك لقراءة ملفات الاستيراد بالتوازي (تحليل Excel عمل CPU لا يستفيد من الخيوط).
+
+- ينشأ المجمع عند أول استخدام ويبقى طوال عمر العملية، فتكلفة تشغيل العمليات تُدفع مرة واحدة.
+- IMPORT_WORKERS: عدد العمليات (الافتراضي min(6، عدد الأنوية)). القيمة 0 أو 1 (أو جهاز بنواة واحدة)
+  تعني القراءة داخل نفس العملية بدون مجمع.
+- الدالة المرسلة يجب أن تكون على مستوى الوحدة (قابلة للـ pickle)، والنتيجة تعود كـ DataFrame مُسلسل بـ pickle.
+- إذا تعطل المجمع (مثلاً قتل عملية لنفاد الذاكرة) يُعاد إنشاؤه في الطلب التالي، ويُنفذ العمل الحالي محلياً.
+- العمليات تُنشأ بـ forkserver (أو spawn حيث لا يتوفر) وليس fork: المجمع يُنشأ من خيط مهمة الاستيراد بينما
+  تعمل خيوط أخرى (بناء الفهارس، اتصالات قاعدة البيانات)، ونسخ عملية متعددة الخيوط بـ fork قد يعلّق العملية
+  الابن على قفل كان محجوزاً لحظة النسخ. خادم forkserver يحمّل pandas مسبقاً فقط (لا يعيد تنفيذ __main__).
+- كل worker في gunicorn يحتفظ بمجمعه الخاص: حتى IMPORT_WORKERS (الافتراضي حتى 6) عمليات دائمة لكل worker.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+_MAX_FILES = 6
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def worker_count() -> int:
+    try:
+        workers = int(os.environ.get("IMPORT_WORKERS", "") or min(_MAX_FILES, os.cpu_count() or 1))
+    except ValueError:
+        workers = min(_MAX_FILES, os.cpu_count() or 1)
+    return max(0, workers)
+
+
+def _mp_context():
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["pandas"])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def _get_pool():
+    global _pool
+    workers = worker_count()
+    if workers <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context())
+        return _pool
+
+
+def _reset_pool(broken) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    try:
+        broken.shutdown(wait=False, cancel_futures=True)
+    except Exception:
+        pass
+
+
+def _run_inline(fn, *args) -> Future:
+    fut = Future()
+    try:
+        fut.set_result(fn(*args))
+    except BaseException as ex:
+        fut.set_exception(ex)
+    return fut
+
+
+def submit(fn, *args) -> Future:
+    """تنفيذ fn(*args) في المجمع (أو محلياً عند تعطيله). يعيد Future دائماً."""
+    pool = _get_pool()
+    if pool is None:
+        return _run_inline(fn, *args)
+    try:
+        fut = pool.submit(fn, *args)
+    except (BrokenProcessPool, RuntimeError):
+        _reset_pool(pool)
+        return _run_inline(fn, *args)
+    fut.import_pool = pool
+    return fut
+
+
+def result(fut: Future, fn, *args):
+    """نتيجة Future من submit؛ إذا تعطل المجمع أثناء التنفيذ يُعاد العمل محلياً (الأخطاء العادية تُرفع كما هي)."""
+    try:
+        return fut.result()
+    except BrokenProcessPool:
+        broken = getattr(fut, "import_pool", None)
+        if broken is not None:
+            _reset_pool(broken)
+        return fn(*args)
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
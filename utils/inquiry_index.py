@@ -0,0 +1,170 @@
+# utils/inquiry_index.py
+"""فهارس الاستعلام المضغوطة (مفتاح → مواضع صفوف).
+
+بدلاً من dict من قوائم بايثون، تُخزن كل المواضع في مصفوفة int32 واحدة مرتبة حسب المفتاح،
+مع مصفوفة إزاحات (offsets) وقاموس مفتاح → رقم المجموعة.
+"""
+import numpy as np
+import pandas as pd
+
+_EMPTY = np.empty(0, dtype=np.int32)
+
+
+def _group_positions(codes: np.ndarray, positions: np.ndarray, n_groups: int):
+    """ترتيب المواضع حسب رقم المجموعة ثم الموضع، وإزالة التكرار، وإرجاع (offsets, positions)."""
+    order = np.lexsort((positions, codes))
+    codes, positions = codes[order], positions[order]
+    # إزالة التكرار (نفس الصف تحت نفس المفتاح من أكثر من عمود)
+    dup = np.zeros(codes.size, dtype=bool)
+    dup[1:] = (codes[1:] == codes[:-1]) & (positions[1:] == positions[:-1])
+    codes, positions = codes[~dup], positions[~dup]
+    offsets = np.zeros(n_groups + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=n_groups), out=offsets[1:])
+    return offsets, np.ascontiguousarray(positions, dtype=np.int32)
+
+
+class PostingIndex:
+    """فهرس مواضع صفوف مضغوط؛ يدعم get(key, default) مثل dict."""
+
+    __slots__ = ("keys", "offsets", "positions", "_lookup")
+
+    def __init__(self, keys, offsets: np.ndarray, positions: np.ndarray):
+        self.keys = keys
+        self.offsets = offsets
+        self.positions = positions
+        self._lookup = {k: i for i, k in enumerate(keys)}
+
+    @classmethod
+    def build(cls, keys, positions) -> "PostingIndex":
+        """بناء الفهرس من مصفوفتين متوازيتين (مفتاح، موضع صف). المفاتيح الفارغة تُتجاهل."""
+        keys = np.asarray(keys, dtype=object)
+        positions = np.asarray(positions, dtype=np.int32)
+        if keys.size:
+            keep = keys != ""
+            keys, positions = keys[keep], positions[keep]
+        if not keys.size:
+            return cls([], np.zeros(1, dtype=np.int64), _EMPTY)
+        codes, uniques = pd.factorize(keys, sort=True)
+        offsets, positions = _group_positions(codes, positions, len(uniques))
+        return cls(list(uniques), offsets, positions)
+
+    def get(self, key, default=None):
+        i = self._lookup.get(key)
+        if i is None:
+            return default
+        return self.positions[self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(self, key):
+        out = self.get(key)
+        if out is None:
+            raise KeyError(key)
+        return out
+
+    def __contains__(self, key) -> bool:
+        return key in self._lookup
+
+    def __len__(self) -> int:
+        return len(self._lookup)
+
+    def nbytes(self) -> int:
+        return int(self.offsets.nbytes + self.positions.nbytes)
+
+
+def lookup(indexes: dict, name: str, key) -> np.ndarray:
+    """مواضع الصفوف لمفتاح في فهرس معيّن (مصفوفة فارغة إذا لم يوجد)."""
+    idx = indexes.get(name)
+    if idx is None:
+        return _EMPTY
+    out = idx.get(key)
+    return _EMPTY if out is None else np.asarray(out, dtype=np.int32)
+
+
+def key_lengths(keys: np.ndarray) -> np.ndarray:
+    return np.fromiter(map(len, keys), dtype=np.int64, count=len(keys))
+
+
+def affix_keys(keys: np.ndarray, positions: np.ndarray, n: int, suffix: bool = False, lengths: np.ndarray | None = None):
+    """بادئات (أو لواحق) بطول n للمفاتيح التي طولها >= n مع مواضعها."""
+    lengths = key_lengths(keys) if lengths is None else lengths
+    mask = lengths >= n
+    sub = keys[mask]
+    part = [k[-n:] for k in sub] if suffix else [k[:n] for k in sub]
+    return np.array(part, dtype=object), positions[mask]
+
+
+def split_tokens(keys: np.ndarray, positions: np.ndarray, sep: str = " "):
+    """تفكيك المفاتيح إلى كلمات مع تكرار موضع الصف لكل كلمة."""
+    parts = [k.split(sep) for k in keys]
+    counts = np.fromiter(map(len, parts), dtype=np.int64, count=len(parts))
+    tokens = np.array([t for p in parts for t in p], dtype=object)
+    return tokens, np.repeat(positions, counts)
+
+
+class SubstringIndex:
+    """فهرس بحث جزئي (trigram) على القيم المميزة لمجموعة أعمدة.
+
+    - values: القيم المميزة (مُطبّعة وبحروف صغيرة).
+    - grams: trigram → أرقام القيم التي تحتويه.
+    - offsets/positions: رقم القيمة → مواضع الصفوف.
+    الاستعلام يقاطع قوائم الـ trigrams ثم يتحقق من الاحتواء الفعلي على القيم المرشحة فقط.
+    """
+
+    GRAM = 3
+
+    __slots__ = ("cols", "values", "grams", "offsets", "positions")
+
+    def __init__(self, cols, values, grams, offsets, positions):
+        self.cols = list(cols)
+        self.values = values
+        self.grams = grams
+        self.offsets = offsets
+        self.positions = positions
+
+    @classmethod
+    def build(cls, cols, keys, positions) -> "SubstringIndex":
+        keys = np.array([k.lower() for k in keys], dtype=object)
+        positions = np.asarray(positions, dtype=np.int32)
+        codes, uniques = pd.factorize(keys)
+        uniques = np.asarray(uniques, dtype=object)
+        offsets, positions = _group_positions(np.asarray(codes, dtype=np.int64), positions, len(uniques))
+
+        n = cls.GRAM
+        gram_keys, gram_ids = [], []
+        for i, v in enumerate(uniques):
+            grams = {v[j:j + n] for j in range(len(v) - n + 1)}
+            gram_keys.extend(grams)
+            gram_ids.extend([i] * len(grams))
+        grams = PostingIndex.build(np.array(gram_keys, dtype=object), np.array(gram_ids, dtype=np.int32))
+        return cls(cols, uniques, grams, offsets, positions)
+
+    def _candidates(self, q: str) -> np.ndarray:
+        n = self.GRAM
+        if len(q) < n:
+            return np.arange(len(self.values), dtype=np.int32)
+        lists = []
+        for g in {q[j:j + n] for j in range(len(q) - n + 1)}:
+            ids = self.grams.get(g)
+            if ids is None:
+                return _EMPTY
+            lists.append(ids)
+        lists.sort(key=len)
+        out = lists[0]
+        for ids in lists[1:]:
+            out = np.intersect1d(out, ids, assume_unique=True)
+            if not out.size:
+                break
+        return out
+
+    def search(self, q: str) -> np.ndarray:
+        """مواضع الصفوف (مرتبة وبدون تكرار) التي يحتوي أحد أعمدتها على q."""
+        q = (q or "").lower()
+        if not q:
+            return _EMPTY
+        ids = [i for i in self._candidates(q).tolist() if q in self.values[i]]
+        if not ids:
+            return _EMPTY
+        parts = [self.positions[self.offsets[i]:self.offsets[i + 1]] for i in ids]
+        return np.unique(np.concatenate(parts))
+
+    def nbytes(self) -> int:
+        return int(self.offsets.nbytes + self.positions.nbytes + self.grams.nbytes())
@@ -0,0 +1,108 @@
+# utils/norm_keys.py
+"""أعمدة الظل المُطبّعة للمفاتيح (__norm_code / __norm_name / __norm_serial / __norm_type).
+
+- تُحسب مرة واحدة عند حفظ البيانات وتُخزن معها في المخزن العمودي (مخفية عن العرض والتصدير).
+- كل عمود ظل مرتبط بعمود مصدر واحد (قبل المابنج)، ويُعاد ربطه بالاسم بعد المابنج عند القراءة.
+- مسارات المطابقة تستخدمها مباشرة بدل إعادة تطبيع نفس الأعمدة في كل طلب.
+"""
+import numpy as np
+import pandas as pd
+
+SHADOW_PREFIX = "__norm_"
+
+# عمود المصدر لكل دور بترتيب الأولوية (نفس المرادفات المستخدمة في مسارات المطابقة)
+SHADOW_ROLES = {
+    "code": ["رقم العميل", "رقم المخبز", "رقم التاجر", "Customer Code", "Customer_ID", "Customer ID", "trader_id", "Bakery ID"],
+    "name": ["اسم العميل", "اسم المخبز", "اسم التاجر", "Customer Name", "Trader Name", "trader_name", "Bakery Name"],
+    "serial": ["مسلسل الماكينة", "مسلسل", "Serial", "POS Serial", "serial", "POS_SN"],
+    "type": ["النوع", "نوع", "Type", "type", "Category", "category"],
+}
+
+# أرقام عربية → لاتينية، توحيد الألف، الياء/التاء المربوطة/الهمزات، وحذف التطويل
+NORM_KEY_TABLE = str.maketrans({
+    **{a: d for a, d in zip("٠١٢٣٤٥٦٧٨٩", "0123456789")},
+    "\u0640": None, "أ": "ا", "إ": "ا", "آ": "ا",
+    "ى": "ي", "ة": "ه", "ئ": "ي", "ؤ": "و",
+})
+# نفس الجدول كأزواج استبدال: str.replace لكل حرف أسرع بكثير من translate على النصوص العربية
+_KEY_REPLACEMENTS = [(chr(k), v or "") for k, v in NORM_KEY_TABLE.items()]
+# كل مسافات يونيكود (str.isspace / \s) عدا المسافة العادية
+_SPACE_CHARS = "\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f\x85\xa0\u1680" + "".join(map(chr, range(0x2000, 0x200b))) + "\u2028\u2029\u202f\u205f\u3000"
+# فاصل القيم عند التطبيع المجمّع (ليس مسافة ولا يتأثر بالجدول)
+_SEP = "\x00"
+
+
+def is_shadow(col) -> bool:
+    return str(col).startswith(SHADOW_PREFIX)
+
+
+def norm_key_text(value) -> str:
+    """تطبيع قيمة واحدة: الجدول + دمج المسافات المتتالية وقصّ الأطراف. None تصبح ""."""
+    if value is None:
+        return ""
+    t = str(value)
+    for old, new in _KEY_REPLACEMENTS:
+        if old in t:
+            t = t.replace(old, new)
+    return " ".join(t.split())
+
+
+def _norm_joined(texts: list) -> list:
+    """تطبيع قائمة نصوص دفعة واحدة: تُضم بفاصل في نص واحد وتُطبق الاستبدالات ودمج المسافات عليه ثم يُقسم."""
+    big = _SEP.join(texts)
+    for old, new in _KEY_REPLACEMENTS:
+        if old in big:
+            big = big.replace(old, new)
+    for ch in _SPACE_CHARS:
+        if ch in big:
+            big = big.replace(ch, " ")
+    while "  " in big:
+        big = big.replace("  ", " ")
+    big = big.replace(_SEP + " ", _SEP).replace(" " + _SEP, _SEP).strip(" ")
+    return big.split(_SEP)
+
+
+def norm_key_array(values) -> np.ndarray:
+    """تطبيع مصفوفة قيم مرة واحدة لكل قيمة مميزة (نفس نتيجة norm_key_text). NaN/None تصبح ""."""
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    if not len(uniques):
+        return np.full(len(codes), "", dtype=object)
+    texts = [v if isinstance(v, str) else str(v) for v in uniques]
+    if any(_SEP in t for t in texts):
+        norm = [norm_key_text(t) for t in texts]
+    else:
+        norm = _norm_joined(texts)
+    # factorize يعطي -1 للقيم المفقودة، وهي تشير إلى "" في آخر المصفوفة
+    return np.array(norm + [""], dtype=object)[codes]
+
+
+def build_shadow(df: pd.DataFrame, prepare=None) -> dict:
+    """{اسم عمود الظل: (عمود المصدر، القيم المُطبّعة)} للأدوار المتوفرة في الجدول.
+    prepare: تحويل القيمة قبل التطبيع (مثل _textify في التقارير) ويُطبق مرة لكل قيمة مميزة.
+    """
+    out = {}
+    if df is None or df.empty:
+        return out
+    cols = set(df.columns)
+    for role, cands in SHADOW_ROLES.items():
+        src = next((c for c in cands if c in cols), None)
+        if src is None:
+            continue
+        values = df[src].to_numpy(dtype=object)
+        if prepare is not None:
+            codes, uniques = pd.factorize(values)
+            values = np.array([prepare(v) for v in uniques] + [prepare(None)], dtype=object)[codes]
+        out[SHADOW_PREFIX + role] = (src, norm_key_array(values))
+    return out
+
+
+def mapped_shadow(shadow: pd.DataFrame | None, sources: dict, rename: dict | None = None) -> dict:
+    """ربط أعمدة الظل بأسماء الأعمدة بعد المابنج: {اسم العمود المعروض: القيم المُطبّعة}."""
+    if shadow is None or shadow.empty or not sources:
+        return {}
+    rename = rename or {}
+    out = {}
+    for name, src in sources.items():
+        if name in shadow.columns:
+            out[rename.get(src, src)] = shadow[name].to_numpy(dtype=object)
+    return out
@@ -0,0 +1,169 @@
+# utils/search_index.py
+"""فهرس البحث في "كل الأعمدة" لشاشات الجداول (التقارير، الماكينات الأساسية، المترددين).
+
+البحث الشامل كان يجمع نص كل صف ثم يطبق contains على الجدول كله مع كل بحث. هنا يُبنى مرة لكل إصدار بيانات
+فهرس trigram (SubstringIndex من utils/inquiry_index) على القيم المميزة لكل الأعمدة بعد التطبيع، ثم:
+- استعلام بلا فاصل (مسافة في التقارير) يطابق الصف إذا احتوته إحدى قيمه، فالنتيجة من الفهرس مباشرة.
+- استعلام فيه فاصل قد يمتد عبر عمودين: الصفوف المرشحة هي التي تحتوي كل أجزائه، ثم يُتحقق من نص الصف
+  المجمّع لهذه الصفوف فقط.
+- contains في pandas يعامل الاستعلام كتعبير نمطي (regex)؛ الاستعلامات التي فيها رموز نمطية ترجع None
+  ويستخدم المستدعي المسار القديم كما هو.
+
+الفهارس مخزنة في SEARCH_INDEX_CACHE بمفتاح (category, id, updated_at, variant) مع إخلاء LRU حسب الحجم
+(SEARCH_INDEX_CACHE_MB، الافتراضي 256). بناء الفهرس أبطأ من مسح واحد، لذلك أول بحث على إصدار جديد يستخدم
+المسح ويبدأ البناء في thread بالخلفية (get_or_schedule)، والبحث التالي يستخدم الفهرس عند جاهزيته.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from utils.inquiry_index import SubstringIndex
+
+_DEFAULT_MAX_MB = 256
+_REGEX_META = frozenset(".^$*+?{}[]\\|()")
+
+
+def is_plain(q: str) -> bool:
+    """هل الاستعلام نص عادي (نتيجة contains النمطية له = احتواء نصي)."""
+    return not any(ch in _REGEX_META for ch in q)
+
+
+def build(df: pd.DataFrame, normalize=None) -> SubstringIndex:
+    """فهرس كل أعمدة df. normalize: تطبيع مصفوفة قيم (مثل norm_keys.norm_key_array)؛ الحروف تُصغّر دائماً."""
+    keys, positions = [], []
+    for j in range(df.shape[1]):
+        vals = df.iloc[:, j].fillna("").astype(str).to_numpy(dtype=object)
+        if normalize is not None:
+            vals = normalize(vals)
+        keep = vals != ""
+        keys.append(vals[keep])
+        positions.append(np.flatnonzero(keep).astype(np.int32))
+    keys = np.concatenate(keys) if keys else np.empty(0, dtype=object)
+    positions = np.concatenate(positions) if positions else np.empty(0, dtype=np.int32)
+    return SubstringIndex.build(list(df.columns), keys, positions)
+
+
+def search(index: SubstringIndex | None, q: str, sep: str | None = None, verify=None) -> np.ndarray | None:
+    """مواضع الصفوف (مرتبة) المطابقة للاستعلام q (مُطبّع ومُصغّر مثل قيم الفهرس)، أو None للمسار القديم.
+
+    sep: فاصل الأعمدة في نص الصف المجمّع. verify(candidates, q): قناع الصفوف المرشحة التي يحتوي نصها
+    المجمّع على q (يُستدعى فقط عندما يحتوي q على الفاصل).
+    """
+    if index is None or not q or not is_plain(q):
+        return None
+    if sep is None or sep not in q:
+        return index.search(q)
+    if verify is None:
+        return None
+    out = None
+    for part in {p for p in q.split(sep) if p}:
+        pos = index.search(part)
+        out = pos if out is None else np.intersect1d(out, pos, assume_unique=True)
+        if not out.size:
+            return out
+    if out is None:
+        return None
+    return out[verify(out, q)]
+
+
+def _index_bytes(index: SubstringIndex) -> int:
+    return index.nbytes() + int(sum(len(v) for v in index.values)) + 56 * len(index.values)
+
+
+class IndexCache:
+    """كاش LRU للفهارس حسب الحجم التقديري، بنفس مفاتيح FRAME_CACHE."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self._entries: OrderedDict = OrderedDict()  # key -> (index, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._building: dict = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(row, variant: str = ""):
+        return (row.category, row.id, row.updated_at, variant)
+
+    def get(self, key) -> SubstringIndex | None:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def _build(self, key, builder) -> SubstringIndex | None:
+        # طلبات متزامنة لنفس الإصدار تنتظر بناءً واحداً
+        with self._lock:
+            lock = self._building.setdefault(key, threading.Lock())
+        with lock:
+            with self._lock:
+                item = self._entries.get(key)
+            if item is not None:
+                return item[0]
+            try:
+                index = builder()
+                nbytes = _index_bytes(index)
+                with self._lock:
+                    if nbytes <= self.max_bytes:
+                        stale = [k for k in self._entries if k[0] == key[0] and k[1] == key[1] and k[2] != key[2]]
+                        for k in stale:
+                            self._bytes -= self._entries.pop(k)[1]
+                        self._entries[key] = (index, nbytes)
+                        self._bytes += nbytes
+                        while self._bytes > self.max_bytes and self._entries:
+                            _, (_, b) = self._entries.popitem(last=False)
+                            self._bytes -= b
+            finally:
+                with self._lock:
+                    self._building.pop(key, None)
+        return index
+
+    def get_or_build(self, row, builder, variant: str = "") -> SubstringIndex:
+        """الفهرس المخزن أو بناؤه الآن (ينتظر المستدعي)."""
+        key = self.make_key(row, variant)
+        return self.get(key) or self._build(key, builder)
+
+    def get_or_schedule(self, row, builder, variant: str = "") -> SubstringIndex | None:
+        """الفهرس إن كان جاهزاً، وإلا يبدأ بناءه في الخلفية (مرة واحدة) ويعيد None فيستخدم المستدعي المسح."""
+        key = self.make_key(row, variant)
+        index = self.get(key)
+        if index is not None:
+            return index
+        with self._lock:
+            if key in self._building:
+                return None
+            self._building[key] = threading.Lock()
+
+        def _run():
+            try:
+                self._build(key, builder)
+            except Exception:
+                pass
+        threading.Thread(target=_run, name="search-index-build", daemon=True).start()
+        return None
+
+    def invalidate(self, category: str | None = None) -> None:
+        with self._lock:
+            for k in [k for k in self._entries if category is None or k[0] == category]:
+                self._bytes -= self._entries.pop(k)[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+try:
+    _max_mb = float(os.environ.get("SEARCH_INDEX_CACHE_MB", _DEFAULT_MAX_MB))
+except ValueError:
+    _max_mb = _DEFAULT_MAX_MB
+
+SEARCH_INDEX_CACHE = IndexCache(max_bytes=int(_max_mb * 1024 * 1024))
@@ -0,0 +1,306 @@
+# utils/shared_index.py
+"""فهارس استعلام مشتركة بين العمليات (عدة gunicorn workers) عبر ملفات numpy تُفتح mmap للقراءة فقط.
+
+- كل إصدار في مجلد باسم الإصدار (state_id + updated_at + توقيع المابنج) تحت instance/inquiry_index/<category>/.
+- الكتابة في مجلد مؤقت ثم os.rename، فلا يرى أي worker إصداراً ناقصاً.
+- النصوص تُخزن UTF-8 متتالية + مصفوفة إزاحات؛ الصفوف لا تُفك إلا عند الحاجة (iloc على نتائج البحث).
+- قفل fcntl (إن توفر) يضمن أن عملية واحدة فقط تبني الإصدار.
+"""
+import json
+import os
+import shutil
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from utils.inquiry_index import PostingIndex, SubstringIndex, _EMPTY
+
+try:
+    import fcntl
+except ModuleNotFoundError:  # Windows
+    fcntl = None
+
+_META = "meta.json"
+# عدد الإصدارات القديمة التي تبقى على القرص (قد تكون ما زالت مفتوحة في workers أخرى)
+_KEEP_VERSIONS = 2
+
+
+def version_name(state_id, updated_at, mapping_signature: str) -> str:
+    stamp = updated_at.strftime("%Y%m%d%H%M%S%f") if updated_at is not None else "0"
+    return f"{state_id}-{stamp}-{(mapping_signature or '')[:12]}"
+
+
+def _load_array(path: str) -> np.ndarray:
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        # مصفوفات فارغة قد لا تقبل mmap على بعض الأنظمة
+        return np.load(path)
+
+
+# ========== النصوص ==========
+class StringColumn:
+    """مصفوفة نصوص للقراءة فقط فوق بايتات UTF-8 + إزاحات."""
+
+    __slots__ = ("data", "offsets")
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @staticmethod
+    def write(prefix: str, values) -> None:
+        encoded = [("" if v is None else str(v)).encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        np.save(prefix + ".data.npy", np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        np.save(prefix + ".off.npy", offsets)
+
+    @classmethod
+    def load(cls, prefix: str) -> "StringColumn":
+        return cls(_load_array(prefix + ".data.npy"), _load_array(prefix + ".off.npy"))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _bytes(self, i: int) -> bytes:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def __getitem__(self, i: int) -> str:
+        return self._bytes(int(i)).decode("utf-8")
+
+    def take(self, positions) -> list:
+        return [self[i] for i in positions]
+
+    def to_list(self) -> list:
+        return self.take(range(len(self)))
+
+    def find(self, key: str) -> int:
+        """بحث ثنائي في نصوص مرتبة (ترتيب بايتات UTF-8 = ترتيب نقاط الترميز)."""
+        target = key.encode("utf-8")
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._bytes(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self._bytes(lo) == target else -1
+
+    def ids_containing(self, q: str) -> np.ndarray:
+        """أرقام القيم التي تحتوي q (مسح واحد على البايتات بدون فك النصوص؛ للاستعلامات القصيرة).
+        كل موضع بداية يُفحص (مقارنة numpy لكل بايت من q)، فتطابق يعبر الحد بين قيمتين لا يُخفي تطابقاً
+        حقيقياً يبدأ داخله في القيمة التالية.
+        """
+        qb = np.frombuffer(q.encode("utf-8"), dtype=np.uint8)
+        n = len(self.data) - len(qb) + 1
+        if not len(qb) or n <= 0:
+            return _EMPTY
+        hit = self.data[:n] == qb[0]
+        for k in range(1, len(qb)):
+            hit &= self.data[k:k + n] == qb[k]
+        starts = np.flatnonzero(hit)
+        if not starts.size:
+            return _EMPTY
+        ids = np.searchsorted(self.offsets, starts, side="right") - 1
+        inside = starts + len(qb) <= self.offsets[ids + 1]
+        return np.unique(ids[inside]).astype(np.int32)
+
+
+# ========== الفهارس ==========
+class SharedPostingIndex(PostingIndex):
+    """PostingIndex فوق ملفات mmap (المفاتيح مرتبة، البحث ثنائي)."""
+
+    def __init__(self, keys: StringColumn, offsets: np.ndarray, positions: np.ndarray):
+        self.keys = keys
+        self.offsets = offsets
+        self.positions = positions
+        self._lookup = None
+
+    @staticmethod
+    def write(prefix: str, index: PostingIndex) -> None:
+        StringColumn.write(prefix + ".keys", index.keys)
+        np.save(prefix + ".offsets.npy", np.asarray(index.offsets, dtype=np.int64))
+        np.save(prefix + ".positions.npy", np.asarray(index.positions, dtype=np.int32))
+
+    @classmethod
+    def load(cls, prefix: str) -> "SharedPostingIndex":
+        return cls(StringColumn.load(prefix + ".keys"),
+                   _load_array(prefix + ".offsets.npy"), _load_array(prefix + ".positions.npy"))
+
+    def get(self, key, default=None):
+        i = self.keys.find(key) if isinstance(key, str) else -1
+        if i < 0:
+            return default
+        return self.positions[self.offsets[i]:self.offsets[i + 1]]
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and self.keys.find(key) >= 0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class SharedSubstringIndex(SubstringIndex):
+    """SubstringIndex فوق ملفات mmap."""
+
+    @staticmethod
+    def write(prefix: str, index: SubstringIndex) -> None:
+        StringColumn.write(prefix + ".values", index.values)
+        SharedPostingIndex.write(prefix + ".grams", index.grams)
+        np.save(prefix + ".offsets.npy", np.asarray(index.offsets, dtype=np.int64))
+        np.save(prefix + ".positions.npy", np.asarray(index.positions, dtype=np.int32))
+
+    @classmethod
+    def load(cls, prefix: str, cols) -> "SharedSubstringIndex":
+        return cls(cols, StringColumn.load(prefix + ".values"), SharedPostingIndex.load(prefix + ".grams"),
+                   _load_array(prefix + ".offsets.npy"), _load_array(prefix + ".positions.npy"))
+
+    def _candidates(self, q: str) -> np.ndarray:
+        if len(q) < self.GRAM:
+            return self.values.ids_containing(q)
+        return super()._candidates(q)
+
+
+# ========== الجدول ==========
+class SharedFrame:
+    """جدول نصي للقراءة فقط؛ يدعم empty/columns/len و iloc[positions] (يفك الصفوف المطلوبة فقط)."""
+
+    def __init__(self, columns: list, n_rows: int, data: dict):
+        self.columns = pd.Index(columns)
+        self._n = int(n_rows)
+        self._data = data
+        self._full = None
+
+    @property
+    def empty(self) -> bool:
+        return self._n == 0 or len(self.columns) == 0
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def iloc(self):
+        return _SharedILoc(self)
+
+    def take(self, positions) -> pd.DataFrame:
+        positions = np.asarray(positions, dtype=np.int64)
+        return pd.DataFrame({c: self._data[c].take(positions) for c in self.columns},
+                            columns=self.columns, index=pd.Index(positions))
+
+    def to_frame(self) -> pd.DataFrame:
+        """الجدول كاملاً (يُحفظ في العملية عند أول استخدام لمسارات التصفية الشاملة)."""
+        if self._full is None:
+            self._full = pd.DataFrame({c: self._data[c].to_list() for c in self.columns}, columns=self.columns)
+        return self._full
+
+
+class _SharedILoc:
+    def __init__(self, frame: SharedFrame):
+        self._frame = frame
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._frame.take(np.arange(self._frame._n)[key])
+        return self._frame.take(key)
+
+
+# ========== النشر والتحميل ==========
+@contextmanager
+def _build_lock(category_dir: str):
+    os.makedirs(category_dir, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(category_dir, ".build.lock"), "w") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def has_version(base_dir: str, category: str, version: str) -> bool:
+    return os.path.exists(os.path.join(base_dir, category, version, _META))
+
+
+def publish(base_dir: str, category: str, version: str, entry: dict) -> None:
+    """كتابة إصدار جديد (جدول + فهارس) ثم إعادة تسمية المجلد المؤقت دفعة واحدة."""
+    category_dir = os.path.join(base_dir, category)
+    final_dir = os.path.join(category_dir, version)
+    if os.path.exists(final_dir):
+        return
+    tmp_dir = os.path.join(category_dir, f".{version}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    df = entry["df"]
+    cols = [str(c) for c in df.columns]
+    for i in range(len(cols)):
+        StringColumn.write(os.path.join(tmp_dir, f"col{i}"), df.iloc[:, i].tolist())
+
+    indexes = {}
+    for name, index in (entry.get("indexes") or {}).items():
+        prefix = os.path.join(tmp_dir, f"ix_{name}")
+        if isinstance(index, SubstringIndex):
+            SharedSubstringIndex.write(prefix, index)
+            indexes[name] = {"kind": "substring", "cols": list(index.cols)}
+        elif isinstance(index, PostingIndex):
+            SharedPostingIndex.write(prefix, index)
+            indexes[name] = {"kind": "postings"}
+
+    meta = {"cols": cols, "rows": int(len(df)), "indexes": indexes}
+    with open(os.path.join(tmp_dir, _META), "w", encoding="utf-8") as fh:
+        json.dump(meta, fh, ensure_ascii=False)
+    try:
+        os.rename(tmp_dir, final_dir)
+    except OSError:
+        # عملية أخرى نشرت نفس الإصدار
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    _prune(category_dir, keep=version)
+
+
+def load(base_dir: str, category: str, version: str) -> dict:
+    """فتح إصدار منشور (mmap) وإرجاع {'df', 'indexes', 'cols'}."""
+    vdir = os.path.join(base_dir, category, version)
+    with open(os.path.join(vdir, _META), encoding="utf-8") as fh:
+        meta = json.load(fh)
+    cols = meta["cols"]
+    data = {c: StringColumn.load(os.path.join(vdir, f"col{i}")) for i, c in enumerate(cols)}
+    indexes = {}
+    for name, info in meta["indexes"].items():
+        prefix = os.path.join(vdir, f"ix_{name}")
+        if info["kind"] == "substring":
+            indexes[name] = SharedSubstringIndex.load(prefix, info["cols"])
+        else:
+            indexes[name] = SharedPostingIndex.load(prefix)
+    return {"df": SharedFrame(cols, meta["rows"], data), "indexes": indexes, "cols": list(cols)}
+
+
+def load_or_build(base_dir: str, category: str, version: str, build) -> dict:
+    """تحميل الإصدار إن وُجد، وإلا بناؤه مرة واحدة عبر كل العمليات (build() يعيد مدخل الكاش في الذاكرة)."""
+    if has_version(base_dir, category, version):
+        return load(base_dir, category, version)
+    with _build_lock(os.path.join(base_dir, category)):
+        if not has_version(base_dir, category, version):
+            entry = build()
+            if entry is None or entry["df"].empty:
+                return entry
+            publish(base_dir, category, version, entry)
+    return load(base_dir, category, version)
+
+
+def _prune(category_dir: str, keep: str) -> None:
+    """حذف الإصدارات الأقدم (مع إبقاء أحدث _KEEP_VERSIONS)."""
+    try:
+        versions = [d for d in os.listdir(category_dir)
+                    if not d.startswith(".") and os.path.isdir(os.path.join(category_dir, d))]
+        versions.sort(key=lambda d: os.path.getmtime(os.path.join(category_dir, d)), reverse=True)
+        for d in versions[_KEEP_VERSIONS:]:
+            if d != keep:
+                # على لينكس تبقى الصفحات المفتوحة صالحة لدى workers الأخرى حتى إغلاقها
+                shutil.rmtree(os.path.join(category_dir, d), ignore_errors=True)
+    except OSError:
+        pass
@@ -0,0 +1,137 @@
+# utils/stream_ingest.py
+"""قراءة ملفات الاستيراد (xlsx / csv) على دفعات بذاكرة محدودة.
+
+- xlsx: openpyxl بوضع read_only (قراءة الصفوف تتابعياً من الملف المضغوط بدون تحميل المصنف كاملاً).
+  كل دفعة تمر على نفس محلل pandas (TextParser) الذي يستخدمه read_excel(dtype=str)،
+  فتخرج نفس الأعمدة (Unnamed / الأسماء المكررة .1) ونفس القيم النصية.
+- csv: read_csv(chunksize) مباشرة على ملف الرفع.
+- الملف المرفوع يُقرأ من تياره (ملف مؤقت لدى werkzeug للملفات الكبيرة) بدون نسخه إلى BytesIO.
+
+الحالات التي لا يمكن فيها مطابقة read_excel دفعةً بدفعة (صيغة xls القديمة، صف بيانات أعرض من صف العناوين)
+ترفع StreamUnsupported، وعلى المستدعي الرجوع للقراءة الكاملة.
+"""
+import os
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+try:
+    import openpyxl
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+except ModuleNotFoundError:  # القراءة الكاملة عبر pandas ما زالت متاحة إن وُجد محرك آخر
+    openpyxl = None
+
+# عدد الصفوف في كل دفعة (يحدد أقصى ذاكرة للقراءة والتنظيف والدمج)
+try:
+    CHUNK_ROWS = max(1000, int(os.environ.get("IMPORT_CHUNK_ROWS", "50000")))
+except ValueError:
+    CHUNK_ROWS = 50000
+
+EXCEL_EXTENSIONS = (".xlsx", ".xlsm")
+
+
+class StreamUnsupported(ValueError):
+    """الملف لا يُقرأ على دفعات بنفس نتيجة القراءة الكاملة."""
+
+
+class WideRowError(StreamUnsupported):
+    """صف بيانات أعرض من صف العناوين: read_excel كان سيضيف أعمدة Unnamed لكل الملف."""
+
+
+def _excel_cell(cell):
+    """نفس تحويل pandas لخلايا openpyxl (أعداد صحيحة بدون .0، أخطاء → NaN، الفارغ → "")."""
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        val = int(cell.value)
+        return val if val == cell.value else float(cell.value)
+    return cell.value
+
+
+def _parse_rows(header: list, rows: list, start: int) -> pd.DataFrame:
+    df = TextParser([header] + rows, header=0, dtype=str).read()
+    df.index = pd.RangeIndex(start, start + len(df))
+    return df
+
+
+def iter_excel_frames(fileobj, chunk_rows: int = CHUNK_ROWS):
+    """دفعات DataFrame من أول ورقة في ملف xlsx (نفس نتيجة read_excel(dtype=str) عند ضمها)."""
+    if openpyxl is None:
+        raise ModuleNotFoundError("openpyxl")
+    wb = openpyxl.load_workbook(fileobj, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb.worksheets[0]
+        # أبعاد الورقة المسجلة في الملف قد تكون خاطئة (كما في pandas)
+        ws.reset_dimensions()
+        header = None
+        width = 0
+        rows: list = []
+        blank_run = 0
+        start = 0
+        for row in ws.rows:
+            values = [_excel_cell(c) for c in row]
+            while values and values[-1] == "":
+                values.pop()
+            if header is None:
+                header, width = values, len(values)
+                continue
+            if len(values) > width:
+                raise WideRowError(f"row wider than header ({len(values)} > {width})")
+            if not values:
+                # الصفوف الفارغة تبقى إلا في آخر الملف
+                blank_run += 1
+                continue
+            if blank_run:
+                rows.extend([[""] * width for _ in range(blank_run)])
+                blank_run = 0
+            rows.append(values + [""] * (width - len(values)))
+            if len(rows) >= chunk_rows:
+                yield _parse_rows(header, rows, start)
+                start += len(rows)
+                rows = []
+        if header is None:
+            return
+        if rows or start == 0:
+            yield _parse_rows(header, rows, start)
+    finally:
+        wb.close()
+
+
+def iter_csv_frames(fileobj, chunk_rows: int = CHUNK_ROWS):
+    yield from pd.read_csv(fileobj, dtype=str, encoding="utf-8", encoding_errors="ignore", chunksize=chunk_rows)
+
+
+def open_upload_frames(file_storage, chunk_rows: int = CHUNK_ROWS):
+    """مكرر دفعات لملف مرفوع (FileStorage) حسب امتداده. يعيد None لملف بدون صفوف.
+    الدفعة الأولى تُقرأ فوراً حتى تظهر أخطاء الفتح هنا وليس أثناء الحفظ.
+    ملف Excel يتعذر فتحه بوضع القراءة المتتابعة يرفع StreamUnsupported (ليُقرأ كاملاً كما في _read_any)،
+    والملفات الأخرى تُجرب كـ csv ثم كـ xlsx.
+    """
+    stream = file_storage.stream
+    name = (file_storage.filename or "").lower()
+    if name.endswith(".xls") or not stream.seekable():
+        # xls يُقرأ بمحرك xlrd في pandas فقط
+        raise StreamUnsupported(name)
+    is_excel = name.endswith(EXCEL_EXTENSIONS)
+    readers = [iter_excel_frames] if is_excel else [iter_csv_frames, iter_excel_frames]
+    error = None
+    for reader in readers:
+        stream.seek(0)
+        frames = reader(stream, chunk_rows)
+        try:
+            first = next(frames)
+        except StopIteration:
+            return None
+        except StreamUnsupported:
+            raise
+        except Exception as ex:
+            error = ex
+            continue
+        return chain([first], frames)
+    if is_excel:
+        raise StreamUnsupported(f"{name}: {error}")
+    raise error
@@ -0,0 +1,239 @@
+# utils/table_export.py
+"""محرك تصدير الجداول المشترك (التقارير، خدمات التجار، الدعم الفني).
+
+- xlsxwriter في وضع constant_memory: الصفوف تُكتب بالترتيب وتُفرّغ للقرص أولاً بأول، فلا يُبنى الملف كله في الذاكرة.
+- عرض الأعمدة يُقدّر من عينة صفوف (أول الجدول + صفوف موزعة على باقيه) بدل قياس كل القيم.
+- الملف يُكتب في ملف مؤقت ويُرسل عبر send_file على أجزاء، ويُحذف عند إغلاقه بعد الإرسال.
+- الخلايا غير الفارغة فقط تأخذ تنسيق الخلية (نص، توسيط، حدود)؛ الأعمدة الزمنية تُكتب كتاريخ بتنسيق yyyy-mm-dd hh:mm.
+- عند عدم توفر xlsxwriter يُستخدم openpyxl في وضع write_only بنفس التنسيق.
+- format=csv: استجابة متدفقة (generator) تبدأ فوراً، UTF-8 مع BOM حتى يفتحها Excel بالعربية صحيحة.
+  القيم التي يفسرها Excel كمعادلة (تبدأ بـ = أو @ أو tab/CR، أو + و- يليهما غير رقم) تُسبق بـ ' فتبقى نصاً
+  كما في ملف xlsx (write_string).
+- format=parquet: عبر pyarrow (اختياري)؛ export_response ترفع ModuleNotFoundError إن لم يكن مثبتاً.
+"""
+import os
+import re
+import tempfile
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+from flask import Response, send_file
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+MIMETYPES = {"xlsx": XLSX_MIMETYPE, "csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+DATETIME_FORMAT = "yyyy-mm-dd hh:mm"
+CSV_DATETIME_FORMAT = "%Y-%m-%d %H:%M"
+SHEET_NAME = "data"
+
+_MAX_WIDTH = 60
+# عدد الصفوف المأخوذة كعينة لتقدير عرض الأعمدة (نصفها من أول الجدول والباقي موزع عليه)
+_WIDTH_SAMPLE = 2000
+# عدد الصفوف في كل جزء من استجابة CSV المتدفقة
+_CSV_CHUNK_ROWS = 5000
+# بداية قيمة ينفذها Excel كمعادلة عند فتح CSV (الأرقام السالبة/الدولية مثل -5 و+20... تبقى كما هي)
+_CSV_FORMULA = re.compile(r"^(?:[=@\t\r]|[+-][^\d.])")
+_CSV_FORMULA_FIRST = ["=", "@", "\t", "\r", "+", "-"]
+
+
+def column_widths(df: pd.DataFrame, datetime_cols=()) -> list:
+    """عرض كل عمود: أطول قيمة في العينة (أو اسم العمود) + 2، بحد أقصى 60."""
+    n = len(df)
+    if n > _WIDTH_SAMPLE:
+        half = _WIDTH_SAMPLE // 2
+        pos = np.unique(np.concatenate([np.arange(half), np.linspace(half, n - 1, half).astype(np.int64)]))
+        sample = df.iloc[pos]
+    else:
+        sample = df
+    widths = []
+    for j, c in enumerate(df.columns):
+        if c in datetime_cols:
+            longest = len(DATETIME_FORMAT)
+        else:
+            lengths = sample.iloc[:, j].fillna("").astype(str).str.len()
+            longest = int(lengths.max()) if len(lengths) else 0
+        widths.append(min(max(len(str(c)), longest) + 2, _MAX_WIDTH))
+    return widths
+
+
+def _columns(df: pd.DataFrame, datetime_cols) -> list:
+    """قيم كل عمود جاهزة للكتابة: نص أو None للفارغ، وdatetime أو None للأعمدة الزمنية."""
+    out = []
+    for j, c in enumerate(df.columns):
+        s = df.iloc[:, j]
+        if c in datetime_cols:
+            s = pd.to_datetime(s, errors="coerce")
+            out.append([None if pd.isna(v) else v.to_pydatetime() for v in s])
+        else:
+            vals = s.to_numpy(dtype=object)
+            out.append([v if isinstance(v, str) and v else (None if v is None or v == "" or pd.isna(v) else str(v))
+                        for v in vals])
+    return out
+
+
+def _write_xlsxwriter(df: pd.DataFrame, fh, datetime_cols) -> None:
+    import xlsxwriter
+    book = xlsxwriter.Workbook(fh, {"constant_memory": True})
+    try:
+        ws = book.add_worksheet(SHEET_NAME)
+        header_fmt = book.add_format({"bold": True, "bg_color": "#E2E8F0", "align": "center", "valign": "vcenter", "border": 1, "num_format": "@"})
+        cell_fmt = book.add_format({"align": "center", "valign": "vcenter", "border": 1, "num_format": "@"})
+        date_fmt = book.add_format({"align": "center", "valign": "vcenter", "border": 1, "num_format": DATETIME_FORMAT})
+        for j, w in enumerate(column_widths(df, datetime_cols)):
+            ws.set_column(j, j, w)
+        ws.freeze_panes(1, 0)
+        for j, c in enumerate(df.columns):
+            ws.write_string(0, j, str(c), header_fmt)
+        is_date = [c in datetime_cols for c in df.columns]
+        for r, values in enumerate(zip(*_columns(df, datetime_cols)), start=1):
+            for j, v in enumerate(values):
+                if v is None:
+                    continue
+                if is_date[j]:
+                    ws.write_datetime(r, j, v, date_fmt)
+                else:
+                    ws.write_string(r, j, v, cell_fmt)
+    finally:
+        book.close()
+
+
+def _write_openpyxl(df: pd.DataFrame, fh, datetime_cols) -> None:
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, PatternFill, Font, Border, Side
+    from openpyxl.utils import get_column_letter
+    book = Workbook(write_only=True)
+    ws = book.create_sheet(SHEET_NAME)
+    header_fill = PatternFill("solid", fgColor="E2E8F0")
+    header_font = Font(bold=True)
+    thin = Side(border_style="thin", color="CCCCCC")
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    center = Alignment(horizontal="center", vertical="center", wrap_text=False)
+    for j, w in enumerate(column_widths(df, datetime_cols), start=1):
+        ws.column_dimensions[get_column_letter(j)].width = w
+    ws.freeze_panes = "A2"
+
+    def _cell(value, number_format, header=False):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.alignment = center; cell.border = border; cell.number_format = number_format
+        if header:
+            cell.fill = header_fill; cell.font = header_font
+        return cell
+
+    ws.append([_cell(str(c), "@", header=True) for c in df.columns])
+    formats = [DATETIME_FORMAT if c in datetime_cols else "@" for c in df.columns]
+    for values in zip(*_columns(df, datetime_cols)):
+        ws.append([None if v is None else _cell(v, fmt) for v, fmt in zip(values, formats)])
+    book.save(fh)
+
+
+def write_xlsx(df: pd.DataFrame, fh, datetime_cols=()) -> None:
+    """كتابة df كملف Excel (ورقة "data") في fh (مسار أو ملف مفتوح للكتابة الثنائية)."""
+    datetime_cols = set(datetime_cols or ())
+    try:
+        _write_xlsxwriter(df, fh, datetime_cols)
+    except ModuleNotFoundError:
+        _write_openpyxl(df, fh, datetime_cols)
+
+
+def xlsx_response(df: pd.DataFrame, filename: str, datetime_cols=()):
+    """استجابة تحميل ملف Excel لـ df: يُكتب في ملف مؤقت ثم يُرسل على أجزاء (ويُحذف بعد الإرسال)."""
+    return _file_response(lambda fh: write_xlsx(df, fh, datetime_cols), filename, XLSX_MIMETYPE)
+
+
+def _file_response(write, filename: str, mimetype: str):
+    fh = tempfile.TemporaryFile(suffix=os.path.splitext(filename)[1])
+    try:
+        write(fh)
+        fh.seek(0)
+    except Exception:
+        fh.close()
+        raise
+    return send_file(fh, as_attachment=True, download_name=filename, mimetype=mimetype)
+
+
+def content_disposition(filename: str) -> str:
+    """ترويسة Content-Disposition لاسم ملف عربي (RFC 5987) مع اسم لاتيني احتياطي."""
+    ext = filename.rsplit(".", 1)[-1] if "." in filename else ""
+    fallback = f"export.{ext}" if ext else "export"
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def _escape_formulas(part: pd.DataFrame, skip) -> pd.DataFrame:
+    """نسخة من part تُسبق فيها القيم النصية التي تبدأ كمعادلة بـ ' (أو part نفسه إن لم توجد)."""
+    out = part
+    for j in range(part.shape[1]):
+        if j in skip or part.dtypes.iloc[j] != object:
+            continue
+        vals = part.iloc[:, j].to_numpy(dtype=object)
+        # أول حرف من كل قيمة بتحويل واحد (U1 يقتطع)، والتعبير الكامل على المرشحين فقط
+        starts = np.flatnonzero(np.isin(vals.astype("U1"), _CSV_FORMULA_FIRST))
+        hits = [i for i in starts if isinstance(vals[i], str) and _CSV_FORMULA.match(vals[i])]
+        if not hits:
+            continue
+        if out is part:
+            out = part.copy()
+        vals = vals.copy()
+        for i in hits:
+            vals[i] = "'" + vals[i]
+        out.isetitem(j, vals)
+    return out
+
+
+def iter_csv(df: pd.DataFrame, datetime_cols=()):
+    """أجزاء ملف CSV (bytes): BOM + رأس الأعمدة ثم الصفوف على دفعات."""
+    datetime_cols = set(datetime_cols or ())
+    header = [("'" + c) if _CSV_FORMULA.match(c) else c for c in map(str, df.columns)]
+    yield "\ufeff".encode("utf-8") + pd.DataFrame(columns=header).to_csv(index=False).encode("utf-8")
+    dates = [j for j, c in enumerate(df.columns) if c in datetime_cols]
+    for start in range(0, len(df), _CSV_CHUNK_ROWS):
+        part = _escape_formulas(df.iloc[start:start + _CSV_CHUNK_ROWS], set(dates))
+        if dates:
+            part = part.copy()
+            for j in dates:
+                part.isetitem(j, pd.to_datetime(part.iloc[:, j], errors="coerce").dt.strftime(CSV_DATETIME_FORMAT))
+        yield part.to_csv(index=False, header=False).encode("utf-8")
+
+
+def csv_response(df: pd.DataFrame, filename: str, datetime_cols=()):
+    """استجابة CSV متدفقة: يبدأ التحميل مع أول جزء بدل انتظار بناء الملف كله."""
+    return Response(iter_csv(df, datetime_cols), mimetype="text/csv",
+                    headers={"Content-Disposition": content_disposition(filename)})
+
+
+def write_parquet(df: pd.DataFrame, fh, datetime_cols=()) -> None:
+    """كتابة df كملف Parquet (pyarrow)؛ الأعمدة الزمنية تبقى تاريخاً/وقتاً. ModuleNotFoundError بدون pyarrow."""
+    import pyarrow  # noqa: F401  (اختياري: لا يُحمّل إلا عند طلب parquet)
+    out = df
+    dates = [j for j, c in enumerate(df.columns) if c in set(datetime_cols or ())]
+    if dates:
+        out = df.copy()
+        for j in dates:
+            out.isetitem(j, pd.to_datetime(out.iloc[:, j], errors="coerce"))
+    out.to_parquet(fh, engine="pyarrow", index=False)
+
+
+def write_file(df: pd.DataFrame, fh, fmt: str, datetime_cols=()) -> None:
+    """كتابة df بالصيغة fmt (بعد export_format) في ملف مفتوح للكتابة الثنائية."""
+    if fmt == "csv":
+        for chunk in iter_csv(df, datetime_cols):
+            fh.write(chunk)
+    elif fmt == "parquet":
+        write_parquet(df, fh, datetime_cols)
+    else:
+        write_xlsx(df, fh, datetime_cols)
+
+
+def export_format(value: str | None) -> str:
+    """صيغة التصدير من ?format= (xlsx لأي قيمة غير معروفة)."""
+    value = (value or "").lower()
+    return value if value in MIMETYPES else "xlsx"
+
+
+def export_response(df: pd.DataFrame, basename: str, fmt: str = "xlsx", datetime_cols=()):
+    """استجابة التصدير بالصيغة المطلوبة (xlsx افتراضياً لأي قيمة أخرى)؛ basename بدون امتداد."""
+    fmt = export_format(fmt)
+    filename = f"{basename}.{fmt}"
+    if fmt == "csv":
+        return csv_response(df, filename, datetime_cols)
+    return _file_response(lambda fh: write_file(df, fh, fmt, datetime_cols), filename, MIMETYPES[fmt])
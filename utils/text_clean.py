@@ -0,0 +1,244 @@
+# utils/text_clean.py
+"""تحويل القيم إلى نص نظيف: دالة لكل قيمة (textify) ومحرك عمودي (textify_array / coerce_text_frame).
+
+الأنماط (نفس سلوك الشاشات):
+- "reports": تقارير الماكينات؛ الأعداد تُبسط ('007' → '7'، '1e3' → '1000'، '12.5' تبقى)،
+  والأرقام الطويلة (> 12 خانة) تبقى نصاً كما هي.
+- "trader": خدمات التجار؛ حذف الجزء العشري ('12.5' → '12') مع الإبقاء على الأصفار البادئة ('007').
+- "support": مثل trader + التواريخ بصيغة YYYY-MM-DD HH:MM.
+
+المحرك العمودي يعطي نفس نتيجة الدالة لكل خلية، لكنه يحسب كل قيمة نصية مميزة مرة واحدة،
+ويكتشف الأعداد بتعبيرات نمطية بدل محاولة float() على كل خلية.
+
+علامة "نظيف": الجدول الناتج يحمل في attrs رمزاً مسجلاً لنفس الكائن فقط (مرجع ضعيف)، فإعادة تنظيفه
+تصبح بلا عمل. النسخ المشتقة (copy/إعادة تسمية/تصفية صفوف أو أعمدة) تأخذ العلامة صراحة عبر carry،
+أما أي عملية أخرى (merge/concat/reindex...) فتنتج جدولاً غير معلّم حتى لو نسخ pandas الـ attrs.
+"""
+import itertools
+import re
+import threading
+import weakref
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+import pandas as pd
+
+# رموز تُعتبر "قيمة فارغة"
+EMPTY_TOKENS = {"nan", "none", "null", "na", "n/a", "nat", "-", "—"}
+
+MODES = ("reports", "trader", "support")
+
+_DATETIME_FMT = "%Y-%m-%d %H:%M"
+_INT_RE = r"\d+"
+_DEC_RE = r"\d+\.\d+"
+_EXP_RE = r"[0-9]+(\.[0-9]+)?[eE][+\-]?[0-9]+"
+# كل ما قد يقبله float() (مجموعة أوسع): ما لا يطابقه يبقى نصاً بدون محاولة تحويل
+_FLOAT_LIKE_RE = re.compile(r"\s*[+\-]?(?:inf(?:inity)?|nan|[\d_]*\.?[\d_]*(?:[eE]\s*[+\-]?[\d_]*)?)\s*", re.IGNORECASE)
+
+
+# ========== قيمة واحدة ==========
+def textify_reports(v) -> str:
+    """تحويل القيمة إلى نص نظيف مع تبسيط الأرقام العشرية والأسية."""
+    if v is None:
+        return ""
+    if isinstance(v, (float, np.float64)) and (np.isinf(v) or np.isnan(v)):
+        return ""
+    t = str(v).strip()
+    if t == "" or t.lower() in EMPTY_TOKENS:
+        return ""
+    t = t.replace(",", "")
+    # أرقام التعريف الطويلة (مسلسلات/شرائح) تبقى نصاً لتجنب فقدان الدقة عبر float
+    if t.isdigit() and len(t) > 12:
+        return t
+    try:
+        float_val = float(t)
+    except ValueError:
+        return t
+    if np.isinf(float_val) or np.isnan(float_val):
+        return ""
+    if float_val == int(float_val):
+        return str(int(float_val))
+    return str(float_val)
+
+
+def textify_trader(v) -> str:
+    """تحويل القيمة إلى نص مع حذف الجزء العشري والإبقاء على الأصفار البادئة."""
+    if v is None:
+        return ""
+    t = str(v).strip()
+    if t == "" or t.lower() in EMPTY_TOKENS:
+        return ""
+    t = t.replace(",", "")
+    if re.fullmatch(_INT_RE, t):
+        return t
+    if re.fullmatch(_DEC_RE, t):
+        return t.split(".", 1)[0]
+    if re.fullmatch(_EXP_RE, t):
+        try:
+            return str(Decimal(t).to_integral_value(rounding="ROUND_DOWN"))
+        except InvalidOperation:
+            return ""
+    return t
+
+
+def textify_support(v) -> str:
+    """مثل textify_trader مع عرض التواريخ كاملة (التاريخ والوقت)."""
+    if isinstance(v, datetime):
+        return "" if pd.isna(v) else v.strftime(_DATETIME_FMT)
+    return textify_trader(v)
+
+
+TEXTIFY = {"reports": textify_reports, "trader": textify_trader, "support": textify_support}
+
+
+# ========== علامة "نظيف" + عداد النسخ ==========
+CLEAN_ATTR = "text_clean"
+_CLEAN_FRAMES = weakref.WeakValueDictionary()  # رمز → الجدول المعلّم نفسه
+_CLEAN_IDS = itertools.count(1)
+_COPIES = threading.local()
+
+
+def mark_clean(df: pd.DataFrame, mode: str) -> pd.DataFrame:
+    """تعليم الجدول كنظيف بنمط mode (يعدّل attrs فقط ويعيد نفس الجدول)."""
+    token = (mode, next(_CLEAN_IDS))
+    df.attrs[CLEAN_ATTR] = token
+    _CLEAN_FRAMES[token] = df
+    return df
+
+
+def is_clean(df, mode: str) -> bool:
+    token = getattr(df, "attrs", {}).get(CLEAN_ATTR)
+    return token is not None and token[0] == mode and _CLEAN_FRAMES.get(token) is df
+
+
+def carry(src: pd.DataFrame, out: pd.DataFrame) -> pd.DataFrame:
+    """نقل علامة النظافة من src إلى out (لعمليات لا تغير القيم: نسخ، إعادة تسمية، اختيار صفوف/أعمدة)."""
+    token = getattr(src, "attrs", {}).get(CLEAN_ATTR)
+    if out is not src and token is not None and is_clean(src, token[0]):
+        mark_clean(out, token[0])
+    return out
+
+
+def copy_frame(df: pd.DataFrame, label: str = "copy") -> pd.DataFrame:
+    """df.copy() مع الإبقاء على علامة النظافة وحسابها في عداد النسخ."""
+    count_copy(label)
+    return carry(df, df.copy())
+
+
+def reset_copy_counts() -> None:
+    """بدء عدّ النسخ الكاملة للطلب الحالي (الخيط الحالي فقط)."""
+    _COPIES.counts = {}
+
+
+def count_copy(label: str) -> None:
+    counts = getattr(_COPIES, "counts", None)
+    if counts is not None:
+        counts[label] = counts.get(label, 0) + 1
+
+
+def pop_copy_counts() -> dict:
+    """عدد النسخ الكاملة لكل نوع منذ reset_copy_counts، ثم إيقاف العد."""
+    counts = getattr(_COPIES, "counts", None) or {}
+    _COPIES.counts = None
+    return counts
+
+
+# ========== عمود كامل ==========
+def _clean_strings(u: pd.Series, mode: str) -> np.ndarray:
+    """نفس نتيجة TEXTIFY[mode] لقيم نصية مميزة، بعمليات عمودية."""
+    t = u.str.strip()
+    empty = (t == "") | t.str.lower().isin(EMPTY_TOKENS)
+    t = t.str.replace(",", "", regex=False)
+    out = t.to_numpy(dtype=object, copy=True)
+    if mode == "reports":
+        digits = t.str.isdigit()
+        # أرقام التعريف الطويلة تبقى كما هي
+        short = digits & (t.str.len() <= 12)
+        ascii_int = short & t.str.fullmatch(r"[0-9]*")
+        if ascii_int.any():
+            # str(int(t)) لأرقام لاتينية: حذف الأصفار البادئة
+            out[ascii_int.to_numpy()] = t[ascii_int].str.lstrip("0").replace("", "0").to_numpy(dtype=object)
+        # الحالات الأخرى التي قد تكون أعداداً (عشرية، أسية، إشارة، أرقام عربية، inf...) تمر على الدالة نفسها
+        slow = (~empty & ~ascii_int & (short | (~digits & t.str.fullmatch(_FLOAT_LIKE_RE)))).to_numpy()
+        if slow.any():
+            out[slow] = [textify_reports(v) for v in u.to_numpy(dtype=object)[slow]]
+    else:
+        dec = t.str.fullmatch(_DEC_RE)
+        if dec.any():
+            out[dec.to_numpy()] = t[dec].str.split(".", n=1).str[0].to_numpy(dtype=object)
+        exp = (~dec & t.str.fullmatch(_EXP_RE)).to_numpy()
+        if exp.any():
+            out[exp] = [textify_trader(v) for v in t.to_numpy(dtype=object)[exp]]
+    out[empty.to_numpy()] = ""
+    return out
+
+
+def textify_array(values, mode: str = "reports") -> np.ndarray:
+    """TEXTIFY[mode] لكل قيمة في العمود (مصفوفة نصوص object بنفس الطول)."""
+    fn = TEXTIFY[mode]
+    if isinstance(values, pd.Series):
+        dtype = values.dtype
+        values = values.to_numpy()
+    else:
+        values = np.asarray(values)
+        dtype = values.dtype
+    n = len(values)
+    if n == 0:
+        return np.empty(0, dtype=object)
+
+    if dtype.kind in "iu" and not (mode == "reports" and np.abs(values.astype(np.float64)).max() >= 2 ** 53):
+        # الأعداد الصحيحة نصها كما هو (في reports تمر الكبيرة جداً على float فتُترك للدالة)
+        return values.astype(str).astype(object)
+    if dtype.kind in "iu":
+        codes, uniques = pd.factorize(values)
+        return np.array([fn(v) for v in uniques], dtype=object)[codes]
+    if dtype.kind == "f":
+        # المفاتيح من تمثيل البتات حتى لا تندمج 0.0 و -0.0 (تختلف نتيجتها في trader)
+        codes, uniques = pd.factorize(values.astype(np.float64).view(np.int64))
+        return np.array([fn(v) for v in uniques.view(np.float64)], dtype=object)[codes]
+    if dtype.kind == "M" and mode == "support":
+        s = pd.Series(values)
+        return s.dt.strftime(_DATETIME_FMT).fillna("").to_numpy(dtype=object)
+    if dtype.kind != "O":
+        values = values.astype(object)
+
+    out = np.empty(n, dtype=object)
+    is_str = np.fromiter((type(v) is str for v in values), dtype=bool, count=n)
+    if not is_str.all():
+        # القيم غير النصية (نادرة في بيانات مخزنة كنص) تمر على الدالة قيمة بقيمة
+        other = ~is_str
+        out[other] = [fn(v) for v in values[other]]
+        if not is_str.any():
+            return out
+    strs = values[is_str] if not is_str.all() else values
+    codes, uniques = pd.factorize(strs)
+    cleaned = _clean_strings(pd.Series(uniques, dtype=object), mode)[codes]
+    if is_str.all():
+        return cleaned
+    out[is_str] = cleaned
+    return out
+
+
+def textify_series(s: pd.Series, mode: str = "reports") -> pd.Series:
+    return pd.Series(textify_array(s, mode), index=s.index, name=s.name, dtype=object)
+
+
+def clean_columns(columns) -> list:
+    """أسماء أعمدة كنص بدون مسافات طرفية أو أسطر جديدة."""
+    return [str(c).strip().replace("\n", " ").replace("\r", " ") for c in columns]
+
+
+def coerce_text_frame(df: pd.DataFrame, mode: str = "reports", columns=None) -> pd.DataFrame:
+    """جدول جديد بنفس الأعمدة بعد تحويل كل الخلايا (أو الأعمدة المحددة فقط) إلى نص نظيف.
+    عند تحويل كل الأعمدة يُعلّم الناتج كنظيف.
+    """
+    count_copy("coerce:" + mode)
+    targets = set(df.columns if columns is None else columns)
+    data = {}
+    for i, c in enumerate(df.columns):
+        col = df.iloc[:, i]
+        data[i] = textify_array(col, mode) if c in targets else col.to_numpy(copy=True)
+    out = pd.DataFrame(data, index=df.index.copy())
+    out.columns = df.columns
+    return mark_clean(out, mode) if columns is None else out